@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ClinicalPatient
+from .models import ClinicalPatient, ReconciliationCheckpoint
 
 @admin.register(ClinicalPatient)
 class ClinicalPatientAdmin(admin.ModelAdmin):
@@ -13,4 +13,10 @@ class ClinicalPatientAdmin(admin.ModelAdmin):
     list_filter = ('organization', 'is_active')
     
     # Campos de solo lectura (para que no edites el ID por error)
-    readonly_fields = ('created_at', 'updated_at')
\ No newline at end of file
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(ReconciliationCheckpoint)
+class ReconciliationCheckpointAdmin(admin.ModelAdmin):
+    # Progreso del job reconcile_patient_links
+    list_display = ('name', 'last_created_at', 'linked_total', 'updated_at')
+    readonly_fields = ('last_created_at', 'last_user_id', 'linked_total', 'updated_at')
@@ -6,3 +6,6 @@ class ClinicalConfig(AppConfig):
     name = 'apps.clinical'
     label = 'clinical'
     verbose_name = "Gestión Clínica para Pacientes"
+
+    def ready(self):
+        import apps.clinical.signals
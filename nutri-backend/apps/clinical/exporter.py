@@ -0,0 +1,114 @@
+"""
+Exportación completa de los expedientes de una clínica (auditorías y migraciones).
+
+Todo es un generador: los expedientes se leen con `iterator(chunk_size=...)` y los
+planes de cada tanda con una sola query, así la memoria no crece con el tamaño de
+la clínica y el primer byte sale apenas se lee la primera tanda.
+
+Formatos:
+  - csv:    una fila por (expediente, plan); el expediente sin planes ocupa una fila
+            con las columnas del plan vacías.
+  - ndjson: un objeto JSON por línea, con sus planes anidados en "diet_plans".
+Con gzip=True se comprime al vuelo (stream .gz válido, se descomprime con gunzip).
+
+En el CSV, los textos que empiezan como una fórmula (=, +, -, @, tab, CR) salen con
+un apóstrofo delante para que Excel/Sheets no los ejecuten al abrir el archivo.
+"""
+import csv
+import io
+import zlib
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from apps.nutrition.models import DietPlan
+from .models import ClinicalPatient
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+PATIENT_FIELDS = ['id', 'first_name', 'last_name', 'email', 'phone', 'is_active', 'app_user_id', 'created_at', 'updated_at']
+PLAN_FIELDS = ['id', 'name', 'description', 'is_active', 'professional_email', 'created_at', 'updated_at']
+CSV_HEADER = PATIENT_FIELDS + [f'plan_{field}' for field in PLAN_FIELDS]
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def iter_patient_batches(organization_id, chunk_size=2000):
+    """Tandas de expedientes (dicts) con los planes de su usuario vinculado en 'diet_plans'."""
+    patients = (
+        ClinicalPatient.objects.filter(organization_id=organization_id)
+        .order_by('created_at', 'id')
+        .values(*PATIENT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        batch = list(islice(patients, chunk_size))
+        if not batch:
+            return
+        user_ids = {row['app_user_id'] for row in batch if row['app_user_id']}
+        plans = {}
+        if user_ids:
+            # Solo los planes hechos por profesionales de esta clínica
+            queryset = (
+                DietPlan.objects.filter(patient_id__in=user_ids, professional__organization_id=organization_id)
+                .order_by('created_at', 'id')
+                .values('patient_id', 'id', 'name', 'description', 'is_active', 'created_at', 'updated_at',
+                        professional_email=F('professional__email'))
+            )
+            for plan in queryset:
+                plans.setdefault(plan.pop('patient_id'), []).append(plan)
+        for row in batch:
+            row['diet_plans'] = plans.get(row['app_user_id'], [])
+        yield batch
+
+
+def _csv_value(value):
+    if isinstance(value, str):
+        return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def render_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for batch in batches:
+        for row in batch:
+            patient = [_csv_value(row[field]) for field in PATIENT_FIELDS]
+            for plan in row['diet_plans'] or [None]:
+                writer.writerow(patient + [_csv_value(plan[field]) if plan else '' for field in PLAN_FIELDS])
+        # Un fragmento por tanda: pocos writes grandes en vez de uno por fila
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def render_ndjson(batches):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for batch in batches:
+        yield ''.join(encoder.encode(row) + '\n' for row in batch).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Comprime los fragmentos al vuelo; cada tanda se vacía para que el cliente reciba bytes enseguida."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_patients(organization_id, export_format='csv', gzip=False, chunk_size=2000):
+    """Generador de bytes con la exportación completa de la organización."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: '{export_format}'. Usa csv o ndjson.")
+    render = render_csv if export_format == 'csv' else render_ndjson
+    chunks = render(iter_patient_batches(organization_id, chunk_size))
+    return gzip_stream(chunks) if gzip else chunks
+
+
+def export_filename(organization, export_format, gzip=False):
+    extension = EXPORT_FORMATS[export_format][1]
+    return f"{organization.slug}-pacientes.{extension}" + ('.gz' if gzip else '')
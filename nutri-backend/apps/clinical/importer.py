@@ -0,0 +1,189 @@
+"""
+Importación masiva de expedientes (migración de clínicas).
+
+En vez de guardar paciente por paciente (save() + búsqueda del usuario de app
+en cada fila), cada lote:
+  1. normaliza y valida todas las filas en una pasada,
+  2. resuelve los usuarios de app con un solo `email__in` (sin distinguir mayúsculas),
+  3. descarta los emails que la clínica ya tiene (otro `email__in`),
+  4. reserva el cupo del plan y inserta con un solo bulk_create en la organización.
+
+Devuelve un reporte por fila: {'row', 'status', 'id', 'linked', 'errors'}.
+"""
+import csv
+import io
+import logging
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from apps.common.text import normalize_text
+from apps.users.models import PatientQuotaExceeded
+from .models import ClinicalPatient
+
+logger = logging.getLogger(__name__)
+
+# Encabezados aceptados (ya normalizados: minúsculas y sin tildes)
+COLUMN_ALIASES = {
+    'first_name': ['first name', 'nombre', 'nombres'],
+    'last_name': ['last name', 'apellido', 'apellidos'],
+    'email': ['email', 'e mail', 'correo', 'correo electronico'],
+    'phone': ['phone', 'telefono', 'celular', 'movil'],
+}
+MAX_LENGTHS = {field: ClinicalPatient._meta.get_field(field).max_length for field in COLUMN_ALIASES}
+
+STATUS_CREATED = 'created'
+STATUS_SKIPPED = 'skipped'
+STATUS_ERROR = 'error'
+
+
+def read_rows(fileobj, filename):
+    """Itera las filas (dicts) de un CSV o XLSX. XLSX requiere openpyxl."""
+    if filename.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Para importar archivos .xlsx instala openpyxl.")
+        sheet = load_workbook(fileobj, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell or '') for cell in next(rows, [])]
+        for values in rows:
+            if any(value not in (None, '') for value in values):
+                yield dict(zip(header, values))
+        return
+
+    content = fileobj.read()
+    text = content.decode('utf-8-sig') if isinstance(content, bytes) else content
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.DictReader(io.StringIO(text), dialect=dialect)
+
+
+def resolve_columns(header):
+    normalized = {normalize_text(column): column for column in header}
+    columns = {
+        field: next((normalized[alias] for alias in aliases if alias in normalized), None)
+        for field, aliases in COLUMN_ALIASES.items()
+    }
+    missing = [field for field in ('first_name', 'last_name') if not columns[field]]
+    if missing:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(missing)}.")
+    return columns
+
+
+def import_patients(organization, rows, dry_run=False, batch_size=1000):
+    """
+    Importa `rows` (iterable de dicts) en `organization`.
+    Devuelve {'created', 'linked', 'skipped', 'errors', 'rows': [reporte por fila]}.
+    """
+    report = []
+    columns = None
+    batch = []
+    seen_emails = set()
+    organization.refresh_from_db(fields=['active_patient_count'])
+    quota = {'remaining': organization.remaining_patient_slots}
+
+    for row_number, record in enumerate(rows, start=2):  # La fila 1 es el encabezado
+        if columns is None:
+            columns = resolve_columns(record.keys())
+        values = {
+            field: str(record.get(column) or '').strip() if column else ''
+            for field, column in columns.items()
+        }
+        values['email'] = values['email'].lower()
+
+        errors = []
+        for field in ('first_name', 'last_name'):
+            if not values[field]:
+                errors.append(f"'{field}' es obligatorio.")
+        for field, max_length in MAX_LENGTHS.items():
+            if len(values[field]) > max_length:
+                errors.append(f"'{field}' supera {max_length} caracteres.")
+        if values['email']:
+            try:
+                validate_email(values['email'])
+            except ValidationError:
+                errors.append(f"Email inválido: {values['email']}")
+            if values['email'] in seen_emails:
+                errors.append(f"Email repetido en el archivo: {values['email']}")
+            seen_emails.add(values['email'])
+
+        entry = {'row': row_number, 'status': STATUS_ERROR if errors else None, 'id': None, 'linked': False, 'errors': errors}
+        report.append(entry)
+        if not errors:
+            batch.append((entry, values))
+        if len(batch) >= batch_size:
+            _flush(organization, batch, dry_run, quota)
+            batch = []
+
+    if batch:
+        _flush(organization, batch, dry_run, quota)
+
+    summary = {
+        'created': sum(entry['status'] == STATUS_CREATED for entry in report),
+        'linked': sum(entry['linked'] for entry in report),
+        'skipped': sum(entry['status'] == STATUS_SKIPPED for entry in report),
+        'errors': sum(entry['status'] == STATUS_ERROR for entry in report),
+        'dry_run': dry_run,
+    }
+    logger.info("Importación de pacientes en %s: %s", organization.pk, summary)
+    return {**summary, 'rows': report}
+
+
+def _flush(organization, batch, dry_run, quota):
+    """Resuelve usuarios/duplicados del lote con dos queries y lo inserta con un bulk_create."""
+    User = get_user_model()
+    emails = [values['email'] for _, values in batch if values['email']]
+    # Los emails de los usuarios no siempre se guardaron en minúsculas (índice users_user_email_lower)
+    app_users = {
+        user.email_lower: user
+        for user in User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails, role='PACIENTE')
+    }
+    existing = set(
+        ClinicalPatient.objects.filter(organization=organization, email__in=emails).values_list('email', flat=True)
+    )
+
+    created = []
+    for entry, values in batch:
+        if values['email'] and values['email'] in existing:
+            entry['status'] = STATUS_SKIPPED
+            entry['errors'].append("La clínica ya tiene un expediente con este email.")
+            continue
+        patient = ClinicalPatient(
+            organization=organization,
+            first_name=values['first_name'],
+            last_name=values['last_name'],
+            email=values['email'] or None,
+            phone=values['phone'] or None,
+            app_user=app_users.get(values['email']),
+        )
+        # bulk_create no llama a save(): completamos a mano el texto de búsqueda
+        patient.search_text = patient.build_search_text()
+        entry['status'] = STATUS_CREATED
+        entry['id'] = str(patient.pk)
+        entry['linked'] = patient.app_user is not None
+        created.append((entry, patient))
+
+    # Cupo del plan: las filas que ya no entran se reportan como error
+    quota_error = f"Se alcanzó el límite de {organization.max_patients} pacientes activos del plan."
+    for entry, _ in created[quota['remaining']:]:
+        entry.update(status=STATUS_ERROR, id=None, linked=False)
+        entry['errors'].append(quota_error)
+    created = created[:quota['remaining']]
+    quota['remaining'] -= len(created)
+    if not created or dry_run:
+        return
+
+    try:
+        with transaction.atomic():
+            # bulk_create tampoco pasa por save(): reservamos el cupo del lote de una vez
+            organization.reserve_patient_slots(len(created))
+            ClinicalPatient.objects.bulk_create([patient for _, patient in created])
+    except PatientQuotaExceeded:
+        # Otra alta simultánea ocupó el cupo entre la lectura y la reserva
+        for entry, _ in created:
+            entry.update(status=STATUS_ERROR, id=None, linked=False)
+            entry['errors'].append(quota_error)
@@ -0,0 +1,84 @@
+import gzip
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from apps.clinical.models import ClinicalPatient
+from apps.clinical.serializers import ClinicalPatientListSerializer
+from apps.clinical.views import PatientViewSet
+from apps.common.renderers import ORJSONRenderer
+from apps.nutrition.models import Ingredient
+from apps.nutrition.serializers import IngredientSerializer
+from apps.nutrition.views import IngredientViewSet
+from apps.users.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara las listas de pacientes e ingredientes: ModelSerializer + JSONRenderer contra "
+        "proyección .values() + orjson, con y sin gzip. No deja datos en la BD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Filas por lista (ej: 1000,10000)")
+        parser.add_argument('--repeat', type=int, default=5, help="Mediciones por punto")
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/'))
+
+        for size in [int(value) for value in options['sizes'].split(',')]:
+            with transaction.atomic():
+                organization = Organization.objects.create(name=f"Bench {size}", slug=f"bench-{uuid.uuid4().hex[:12]}")
+                tag = uuid.uuid4().hex[:8]
+                for start in range(0, size, 5000):
+                    batch = range(start, min(start + 5000, size))
+                    ClinicalPatient.objects.bulk_create([
+                        ClinicalPatient(organization=organization, first_name=f"Paciente {n}", last_name="Bench",
+                                        email=f"bench{n}@{tag}.test")
+                        for n in batch
+                    ])
+                    Ingredient.objects.bulk_create([
+                        Ingredient(name=f"Bench {tag} {n}", calories=100, proteins=10, carbohydrates=10, fats=3)
+                        for n in batch
+                    ])
+                patients = ClinicalPatient.objects.filter(organization=organization).order_by('-created_at', '-id')
+                ingredients = Ingredient.objects.filter(name__startswith=f"Bench {tag}")
+
+                cases = [
+                    ('pacientes', patients, ClinicalPatientListSerializer, PatientViewSet),
+                    ('ingredientes', ingredients, IngredientSerializer, IngredientViewSet),
+                ]
+                for label, queryset, serializer_class, viewset in cases:
+                    view = viewset(request=request, format_kwarg=None, action='list')
+                    fields = [field for field in view.projection if field != 'created_at' or viewset is not PatientViewSet]
+
+                    def legacy():
+                        data = serializer_class(queryset, many=True, context={'request': request}).data
+                        return JSONRenderer().render(data)
+
+                    def projected():
+                        rows = map(view.project_row, view.project_queryset(queryset, fields))
+                        return ORJSONRenderer().render([{field: row[field] for field in fields} for row in rows])
+
+                    legacy_ms, legacy_body = self.measure(legacy, options['repeat'])
+                    projected_ms, projected_body = self.measure(projected, options['repeat'])
+                    self.stdout.write(
+                        f"{size:>7} {label:<12} | serializer {legacy_ms:8.1f}ms | proyección {projected_ms:8.1f}ms "
+                        f"(x{legacy_ms / projected_ms:.1f}) | {len(projected_body) / 1024:.0f} KB -> "
+                        f"{len(gzip.compress(projected_body)) / 1024:.0f} KB con gzip"
+                    )
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Listo (datos de prueba descartados)."))
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), body
@@ -0,0 +1,64 @@
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from apps.clinical.models import ClinicalPatient
+from apps.clinical.pagination import PatientCursorPagination
+from apps.users.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la latencia de la paginación por cursor contra OFFSET en el listado de pacientes "
+        "(primera página, mitad y final) para organizaciones de distintos tamaños. No deja datos en la BD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000,100000', help="Pacientes por organización (ej: 100,10000,1000000)")
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20, help="Mediciones por punto")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        page_size = options['page_size']
+
+        for size in [int(value) for value in options['sizes'].split(',')]:
+            with transaction.atomic():
+                organization = Organization.objects.create(name=f"Bench {size}", slug=f"bench-{uuid.uuid4().hex[:12]}")
+                for start in range(0, size, 5000):
+                    ClinicalPatient.objects.bulk_create([
+                        ClinicalPatient(organization=organization, first_name=f"Paciente {n}", last_name="Bench")
+                        for n in range(start, min(start + 5000, size))
+                    ])
+                queryset = ClinicalPatient.objects.filter(organization=organization)
+
+                results = []
+                for label, depth in (('inicio', 0), ('mitad', size // 2), ('final', max(size - page_size, 0))):
+                    # Cursor que apunta a la fila anterior a `depth` (lo que devolvería la página previa)
+                    params = {'page_size': page_size}
+                    if depth:
+                        anchor = queryset.order_by(*PatientCursorPagination.ordering)[depth - 1]
+                        params['cursor'] = PatientCursorPagination().encode_cursor(anchor)
+                    request = Request(factory.get('/api/clinical/patients/', params))
+
+                    cursor_ms = self.measure(lambda: PatientCursorPagination().paginate_queryset(queryset, request), options['repeat'])
+                    offset_ms = self.measure(
+                        lambda: list(queryset.order_by('-created_at', '-id')[depth:depth + page_size]), options['repeat']
+                    )
+                    results.append(f"{label}: cursor {cursor_ms:.2f}ms / offset {offset_ms:.2f}ms")
+
+                self.stdout.write(f"{size:>8} pacientes | " + " | ".join(results))
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Listo (datos de prueba descartados)."))
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,49 @@
+import sys
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from apps.clinical.exporter import EXPORT_FORMATS, export_patients
+from apps.users.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta todos los expedientes de una organización (con los planes de sus usuarios "
+        "vinculados) en CSV o NDJSON, en streaming y opcionalmente comprimido con gzip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', required=True, help="Slug o id de la organización")
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Comprime la salida (.gz)")
+        parser.add_argument('--output', help="Archivo de destino (por defecto, la salida estándar)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(slug=options['organization']).first()
+        if organization is None:
+            try:
+                organization = Organization.objects.get(pk=options['organization'])
+            except (Organization.DoesNotExist, ValidationError):
+                raise CommandError(f"No existe la organización '{options['organization']}'.")
+
+        started = time.perf_counter()
+        chunks = export_patients(
+            organization.pk, options['format'], gzip=options['gzip'], chunk_size=options['chunk_size'],
+        )
+        size = 0
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Exportado {options['output']} ({size / 1024:.1f} KB) en {time.perf_counter() - started:.2f}s"
+            ))
@@ -0,0 +1,57 @@
+import csv
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from apps.clinical.importer import STATUS_CREATED, import_patients, read_rows
+from apps.users.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa expedientes de pacientes (CSV o XLSX) en una organización: vincula usuarios "
+        "de app por email en una sola query por lote e inserta con bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo CSV/XLSX a importar")
+        parser.add_argument('--organization', required=True, help="Slug o id de la organización")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--report', help="Archivo CSV donde guardar el reporte por fila")
+        parser.add_argument('--dry-run', action='store_true', help="Valida sin escribir en la BD")
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(slug=options['organization']).first()
+        if organization is None:
+            try:
+                organization = Organization.objects.get(pk=options['organization'])
+            except (Organization.DoesNotExist, ValidationError):
+                raise CommandError(f"No existe la organización '{options['organization']}'.")
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fp:
+                report = import_patients(
+                    organization, read_rows(fp, options['path']),
+                    dry_run=options['dry_run'], batch_size=options['batch_size'],
+                )
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as fp:
+                writer = csv.writer(fp)
+                writer.writerow(['row', 'status', 'id', 'linked', 'errors'])
+                for entry in report['rows']:
+                    writer.writerow([entry['row'], entry['status'], entry['id'] or '', entry['linked'], json.dumps(entry['errors'], ensure_ascii=False)])
+
+        if options['verbosity'] >= 2:
+            for entry in report['rows']:
+                if entry['status'] != STATUS_CREATED:
+                    self.stderr.write(f"Fila {entry['row']} ({entry['status']}): {'; '.join(entry['errors'])}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Creados: {report['created']} (vinculados: {report['linked']}) | omitidos: {report['skipped']} | "
+            f"con errores: {report['errors']} | {elapsed:.2f}s" + (" [dry-run]" if options['dry_run'] else "")
+        ))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.clinical.models import ReconciliationCheckpoint
+from apps.clinical.reconciliation import CHECKPOINT_NAME, reconcile_patient_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Vincula expedientes 'Pendiente' con los usuarios PACIENTE registrados desde el último "
+        "checkpoint. Pensado para cron o como worker con --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Queda corriendo y revisa cada --interval segundos")
+        parser.add_argument('--interval', type=int, default=60)
+        parser.add_argument('--reset', action='store_true', help="Borra el checkpoint y revisa todos los usuarios")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            ReconciliationCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+
+        while True:
+            started = time.perf_counter()
+            stats = reconcile_patient_links(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Usuarios revisados: {stats['users']} | expedientes vinculados: {stats['linked']} | "
+                f"lotes: {stats['batches']} | {time.perf_counter() - started:.2f}s"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0002_alter_clinicalpatient_options_clinicalpatient_photo_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clinicalpatient',
+            index=models.Index(fields=['organization', '-created_at', '-id'], name='clinical_patient_org_cursor'),
+        ),
+    ]
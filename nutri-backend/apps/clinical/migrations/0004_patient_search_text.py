@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:14
+
+from django.db import migrations, models
+from apps.common.text import normalize_text
+
+
+def fill_search_text(apps, schema_editor):
+    ClinicalPatient = apps.get_model('clinical', 'ClinicalPatient')
+    patients = ClinicalPatient.objects.only('first_name', 'last_name', 'email')
+    batch = []
+    for patient in patients.iterator(chunk_size=2000):
+        patient.search_text = normalize_text(f"{patient.first_name} {patient.last_name} {patient.email or ''}")
+        batch.append(patient)
+        if len(batch) >= 2000:
+            ClinicalPatient.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        ClinicalPatient.objects.bulk_update(batch, ['search_text'])
+
+
+def create_trigram_index(apps, schema_editor):
+    """Índice GIN de trigramas (LIKE '%q%' indexado). Solo existe en Postgres."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS clinical_patient_search_trgm '
+        'ON clinical_clinicalpatient USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS clinical_patient_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0003_patient_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinicalpatient',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
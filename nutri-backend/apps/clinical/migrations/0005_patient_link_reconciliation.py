@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0004_patient_search_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_created_at', models.DateTimeField(blank=True, null=True)),
+                ('last_user_id', models.UUIDField(blank=True, null=True)),
+                ('linked_total', models.PositiveIntegerField(default=0, verbose_name='Expedientes vinculados')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Conciliación',
+                'verbose_name_plural': 'Checkpoints de Conciliación',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='clinicalpatient',
+            index=models.Index(condition=models.Q(('app_user__isnull', True)), fields=['email'], name='clinical_patient_unlinked'),
+        ),
+    ]
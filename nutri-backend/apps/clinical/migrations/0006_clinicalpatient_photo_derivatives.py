@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0005_patient_link_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinicalpatient',
+            name='photo_derivatives',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
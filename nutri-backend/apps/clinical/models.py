@@ -1,6 +1,12 @@
+import logging
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings  # Para referenciar a tu usuario maestro
+from apps.common.text import normalize_text
+from apps.users.models import Organization
+from apps.users.tenancy import TenantQuerySet
+
+logger = logging.getLogger(__name__)
 
 class ClinicalPatient(models.Model):
     """
@@ -27,6 +33,8 @@ class ClinicalPatient(models.Model):
     
     # Patient profile photo
     photo = models.ImageField(upload_to='patients/photos/', null=True, blank=True, verbose_name="Foto")
+    # Foto cuyas miniaturas ya están generadas (apps.common.images)
+    photo_derivatives = models.CharField(max_length=100, blank=True, default='', editable=False)
 
     # ESTADO DEL TRATAMIENTO
     is_active = models.BooleanField(default=True, verbose_name="¿Activo?")
@@ -41,25 +49,45 @@ class ClinicalPatient(models.Model):
         verbose_name="Usuario de App Vinculado"
     )
 
+    # Texto normalizado para el buscador ("perez juan juan@mail.com"); se mantiene en save()
+    # En Postgres lo cubre un índice GIN de trigramas (ver migración 0004)
+    search_text = models.TextField(blank=True, default='', editable=False)
+
     # Auditoría
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TenantQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Expediente de Paciente"
         verbose_name_plural = "Expedientes de Pacientes"
         ordering = ['-created_at'] # Muestra los recientes primero
+        indexes = [
+            # Paginación por cursor del listado: WHERE organization = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['organization', '-created_at', '-id'], name='clinical_patient_org_cursor'),
+            # Conciliación de vínculos: solo indexa los expedientes "Pendiente" (email ya normalizado en save)
+            models.Index(fields=['email'], name='clinical_patient_unlinked', condition=models.Q(app_user__isnull=True)),
+        ]
 
     def __str__(self):
         org_name = self.organization.name if self.organization else "Sin Clínica"
         return f"{self.first_name} {self.last_name} ({org_name})"
 
+    def build_search_text(self):
+        return normalize_text(f"{self.first_name} {self.last_name} {self.email or ''}")
+
     def save(self, *args, **kwargs):
         """Auto-linking with app user if email matches"""
         # Normalize email
         if self.email:
             self.email = self.email.lower().strip()
 
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'first_name', 'last_name', 'email'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'search_text'}
+
         # Attempt to link with existing user
         if self.email and not self.app_user:
             from django.contrib.auth import get_user_model
@@ -69,11 +97,49 @@ class ClinicalPatient(models.Model):
                 existing_user = User.objects.get(email=self.email, role='PACIENTE')
                 
                 self.app_user = existing_user
-                print(f"Auto-linked patient {self.email} with app user")
+                logger.info("Auto-linked patient %s with app user", self.email)
                 
             except User.DoesNotExist:
                 pass # No pasa nada, queda pendiente
             except Exception as e:
-                print(f"Warning during auto-linking: {e}")
+                logger.warning("Warning during auto-linking: %s", e)
+
+        # Cupo del plan: un expediente activo ocupa un lugar en su organización.
+        # Altas, reactivaciones y cambios de clínica reservan; bajas y cambios de clínica liberan.
+        counts_toward_quota = update_fields is None or bool({'is_active', 'organization', 'organization_id'} & set(update_fields))
+        with transaction.atomic():
+            counted_before = None
+            if counts_toward_quota and not self._state.adding:
+                # Estado guardado, leído bajo lock: dos bajas simultáneas no liberan dos veces
+                persisted = (
+                    ClinicalPatient.objects.select_for_update()
+                    .filter(pk=self.pk).values_list('is_active', 'organization_id').first()
+                )
+                if persisted and persisted[0]:
+                    counted_before = persisted[1]
+            counted_after = self.organization_id if self.is_active else None
+            if counts_toward_quota and counted_before != counted_after:
+                if counted_after:
+                    Organization.reserve_slots(counted_after)
+                if counted_before:
+                    Organization.release_slots(counted_before)
+            super().save(*args, **kwargs)
+
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+class ReconciliationCheckpoint(models.Model):
+    """
+    Hasta dónde revisó el job `reconcile_patient_links` la tabla de usuarios.
+    Guarda el último (created_at, id) procesado para continuar desde ahí.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    last_user_id = models.UUIDField(null=True, blank=True)
+    linked_total = models.PositiveIntegerField(default=0, verbose_name="Expedientes vinculados")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Checkpoint de Conciliación"
+        verbose_name_plural = "Checkpoints de Conciliación"
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_created_at}"
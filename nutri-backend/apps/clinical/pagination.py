@@ -0,0 +1,87 @@
+import base64
+import uuid
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PatientCursorPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) sobre (created_at, id), de más reciente a más antiguo.
+
+    En vez de OFFSET, cada página filtra "lo que viene después del último visto":
+        created_at <= c AND (created_at < c OR id < i)
+    y lo resuelve el índice (organization, -created_at, -id), así la página N cuesta
+    lo mismo que la primera. El cursor apunta a una fila concreta: si se crean
+    pacientes mientras el cliente pagina, no se repiten ni se saltan resultados.
+
+    Respuesta: {"next": url | null, "results": [...]}
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            # La condición `created_at <= c` por separado permite recorrer el índice por rango
+            queryset = queryset.filter(Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+        # Pedimos una fila extra solo para saber si hay página siguiente
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, patient):
+        # La página puede ser de instancias o de filas de .values() (modo proyección)
+        if isinstance(patient, dict):
+            created_at, pk = patient['created_at'], patient['id']
+        else:
+            created_at, pk = patient.created_at, patient.pk
+        raw = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, pk = raw.split('|', 1)
+            return datetime.fromisoformat(created_at), uuid.UUID(pk)
+        except (ValueError, UnicodeDecodeError):  # Incluye base64 (binascii.Error) y UUID inválidos
+            raise NotFound("Cursor inválido.")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
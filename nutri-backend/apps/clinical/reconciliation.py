@@ -0,0 +1,68 @@
+"""
+Conciliación de expedientes "Pendiente" con usuarios de app.
+
+El vínculo automático de ClinicalPatient.save() solo ocurre al guardar el
+expediente; si el paciente se registra después, el expediente queda pendiente.
+Este proceso (fuera del request, ver `reconcile_patient_links`) recorre los
+usuarios PACIENTE creados desde el último checkpoint, en lotes ordenados por
+(created_at, id), y vincula los expedientes sin app_user con el mismo email
+(índice parcial `clinical_patient_unlinked`).
+"""
+import logging
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ClinicalPatient, ReconciliationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'app-user-links'
+# Margen para no saltarse usuarios cuya transacción aún no confirmó al leer el lote
+SAFETY_LAG = timedelta(seconds=5)
+
+
+def reconcile_patient_links(batch_size=500, checkpoint_name=CHECKPOINT_NAME, max_batches=None):
+    """
+    Procesa usuarios nuevos hasta alcanzar el presente (o `max_batches`).
+    Devuelve {'users': revisados, 'linked': expedientes vinculados, 'batches': lotes}.
+    """
+    User = get_user_model()
+    stats = {'users': 0, 'linked': 0, 'batches': 0}
+    checkpoint, _ = ReconciliationCheckpoint.objects.get_or_create(name=checkpoint_name)
+    horizon = timezone.now() - SAFETY_LAG
+
+    while max_batches is None or stats['batches'] < max_batches:
+        users = User.objects.filter(role='PACIENTE', created_at__lte=horizon)
+        if checkpoint.last_created_at is not None:
+            users = users.filter(
+                Q(created_at__gt=checkpoint.last_created_at)
+                | Q(created_at=checkpoint.last_created_at, id__gt=checkpoint.last_user_id)
+            )
+        batch = list(users.order_by('created_at', 'id').values_list('id', 'email', 'created_at')[:batch_size])
+        if not batch:
+            break
+
+        user_by_email = {email.lower(): user_id for user_id, email, _ in batch}
+        with transaction.atomic():
+            patients = list(
+                ClinicalPatient.objects.filter(app_user__isnull=True, email__in=list(user_by_email)).only('id', 'email')
+            )
+            for patient in patients:
+                patient.app_user_id = user_by_email[patient.email]
+            ClinicalPatient.objects.bulk_update(patients, ['app_user'], batch_size=500)
+
+            last_id, _, last_created_at = batch[-1]
+            checkpoint.last_created_at = last_created_at
+            checkpoint.last_user_id = last_id
+            checkpoint.linked_total += len(patients)
+            checkpoint.save()
+
+        stats['users'] += len(batch)
+        stats['linked'] += len(patients)
+        stats['batches'] += 1
+
+    if stats['linked']:
+        logger.info("Conciliación de vínculos: %s", stats)
+    return stats
@@ -0,0 +1,67 @@
+"""
+Buscador de expedientes clínicos.
+
+Se busca sobre `ClinicalPatient.search_text` (nombre, apellido y email ya
+normalizados: minúsculas y sin tildes), así "Pérez" y "perez" coinciden y cada
+tecla es un solo LIKE por palabra que en Postgres resuelve el índice GIN de
+trigramas, en vez de tres ILIKE '%q%' sobre columnas distintas.
+"""
+from django.db.models import Case, IntegerField, Value, When
+from rest_framework import filters
+from apps.common.text import normalize_text
+
+# Orden de relevancia (menor = mejor)
+RANK_EXACT_EMAIL = 0
+RANK_NAME_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_CONTAINS = 3
+
+
+def filter_patients(queryset, query):
+    """Pacientes cuyo texto normalizado contiene todas las palabras de la búsqueda."""
+    for word in normalize_text(query).split():
+        queryset = queryset.filter(search_text__contains=word)
+    return queryset
+
+
+def search_patients(queryset, query):
+    """
+    Igual que filter_patients pero ordenado por relevancia:
+    email exacto > empieza por el nombre > alguna palabra empieza así > contiene.
+    """
+    term = normalize_text(query)
+    if not term:
+        return queryset.none()
+    rank = Case(
+        When(email=query.strip().lower(), then=Value(RANK_EXACT_EMAIL)),
+        When(search_text__startswith=term, then=Value(RANK_NAME_PREFIX)),
+        When(search_text__contains=f' {term}', then=Value(RANK_WORD_PREFIX)),
+        default=Value(RANK_CONTAINS),
+        output_field=IntegerField(),
+    )
+    return (
+        filter_patients(queryset, term)
+        .annotate(search_rank=rank)
+        .order_by('search_rank', 'first_name', 'last_name', 'id')
+    )
+
+
+class PatientSearchFilter(filters.BaseFilterBackend):
+    """
+    Reemplaza a SearchFilter en el listado (?search=perez). Solo filtra: el orden
+    lo sigue dando la paginación por cursor.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return filter_patients(queryset, query) if query.strip() else queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': "Busca por nombre, apellido o email (sin importar tildes ni mayúsculas).",
+            'schema': {'type': 'string'},
+        }]
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from apps.common.fields import ImageDerivativeField
 from .models import ClinicalPatient
 
 # ==============================================================================
@@ -17,6 +18,9 @@ class ClinicalPatientListSerializer(serializers.ModelSerializer):
         allow_null=True
     )
     
+    # Miniatura del avatar (no la foto original de la cámara)
+    photo = ImageDerivativeField(size='avatar')
+
     # Campos calculados (No existen en la BD, se crean al vuelo)
     status_label = serializers.SerializerMethodField()
     initials = serializers.SerializerMethodField()
@@ -32,13 +36,13 @@ class ClinicalPatientListSerializer(serializers.ModelSerializer):
             'app_user_id',  # 👈 El ID que busca tu Frontend (UUID o Null)
             'status_label', # "Vinculado" / "Pendiente"
             'initials',     # "JP"
-            'photo'         # URL de la foto (si existe)
+            'photo'         # URL del avatar en miniatura (si hay foto)
         ]
         read_only_fields = ['id', 'app_user_id']
 
     def get_status_label(self, obj):
         """Devuelve un texto legible para la UI sobre el estado de vinculación."""
-        return "Vinculado" if obj.app_user else "Pendiente"
+        return "Vinculado" if obj.app_user_id else "Pendiente"
 
     def get_initials(self, obj):
         """Genera las iniciales (Ej: Juan Perez -> JP)"""
@@ -63,7 +67,10 @@ class ClinicalPatientDetailSerializer(serializers.ModelSerializer):
         allow_null=True
     )
 
+    # Versión mediana de la foto para la ficha (`photo` sigue siendo el original, editable)
+    photo_medium = ImageDerivativeField(size='medium', source='photo')
+
     class Meta:
         model = ClinicalPatient
-        fields = '__all__' # Trae todo: phone, created_at, organization, etc.
+        exclude = ['search_text'] # Trae todo: phone, created_at, organization, etc. (menos el índice de búsqueda)
         read_only_fields = ['id', 'app_user', 'organization', 'created_at', 'updated_at']
\ No newline at end of file
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.common.images import refresh_derivatives
+from apps.users.models import Organization
+from .models import ClinicalPatient
+
+@receiver(post_delete, sender=ClinicalPatient)
+def release_patient_slot(sender, instance, **kwargs):
+    """
+    Al borrar un expediente activo se libera su lugar en el cupo de la organización
+    (también para borrados masivos: queryset.delete() emite post_delete por fila).
+    """
+    if instance.is_active:
+        # Por id: no carga la organización de cada fila en los borrados masivos
+        Organization.release_slots(instance.organization_id)
+
+@receiver(post_save, sender=ClinicalPatient)
+def generate_photo_derivatives(sender, instance, update_fields=None, **kwargs):
+    """
+    Foto nueva -> miniaturas en segundo plano (al confirmar la transacción);
+    las de la foto anterior se borran.
+    """
+    if update_fields is not None and 'photo' not in update_fields:
+        return
+    refresh_derivatives(instance)
@@ -0,0 +1,363 @@
+import base64
+import csv
+import io
+import tempfile
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from apps.common.images import build_derivatives, derivative_name
+from apps.users.models import Organization, User
+from .exporter import export_patients
+from .models import ClinicalPatient, ReconciliationCheckpoint
+from .reconciliation import SAFETY_LAG, reconcile_patient_links
+from .search import search_patients
+
+
+class InlinePool:
+    """ProcessPoolExecutor síncrono para las pruebas."""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ClinicalTestCase(APITestCase):
+    """Clínica con su dueño y un profesional."""
+    plan_type = 'ENTERPRISE'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name="Clínica Test", slug='clinica-test', plan_type=cls.plan_type)
+        cls.owner = User.objects.create_user('owner@test.com', 'x', role='ORG_OWNER', organization=cls.organization)
+        cls.professional = User.objects.create_user(
+            'pro@test.com', 'x', role='PROFESSIONAL', organization=cls.organization,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.professional)
+
+    def create_patient(self, position, organization=None, **fields):
+        return ClinicalPatient.objects.create(
+            organization=organization or self.organization,
+            **{'first_name': f"Paciente{position}", 'last_name': "Test", **fields},
+        )
+
+
+class PatientCursorPaginationTests(ClinicalTestCase):
+    def test_walks_every_patient_once_with_timestamp_ties(self):
+        patients = [self.create_patient(position) for position in range(23)]
+        # Varios pacientes con el mismo created_at: el id desempata
+        moment = timezone.now() - timedelta(days=1)
+        ClinicalPatient.objects.filter(pk__in=[patient.pk for patient in patients[5:15]]).update(created_at=moment)
+
+        seen, url, pages = [], '/api/clinical/patients/?page_size=4', 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()['results']]
+            url, pages = response.json()['next'], pages + 1
+            self.create_patient(100 + pages)  # Altas mientras se pagina: no desplazan las páginas
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {str(patient.pk) for patient in patients})
+        self.assertEqual(pages, 6)
+
+    def test_malformed_cursors_are_not_found(self):
+        def cursor(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+        for value in ['!!!', cursor('sin-separador'), cursor('2024-01-01T00:00:00|garbage'), cursor('ayer|4f9c0e3a-2b7c-4d6a-9a57-1c1b1c9f0a11')]:
+            with self.subTest(cursor=value):
+                self.assertEqual(self.client.get('/api/clinical/patients/', {'cursor': value}).status_code, 404)
+
+
+class PatientQuotaTests(ClinicalTestCase):
+    """El contador de pacientes activos sigue a altas, bajas, cambios de clínica y borrados."""
+    plan_type = 'STARTER'
+
+    def count(self, organization=None):
+        return Organization.objects.values_list('active_patient_count', flat=True).get(pk=(organization or self.organization).pk)
+
+    def test_quota_blocks_new_patients_over_the_plan_limit(self):
+        for position in range(10):
+            response = self.client.post('/api/clinical/patients/', {'first_name': f"P{position}", 'last_name': "T"}, format='json')
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/clinical/patients/', {'first_name': "Extra", 'last_name': "T"}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.count(), 10)
+
+    def test_stale_instances_do_not_release_twice(self):
+        self.create_patient(1)
+        patient = self.create_patient(2)
+        first, second = ClinicalPatient.objects.get(pk=patient.pk), ClinicalPatient.objects.get(pk=patient.pk)
+        first.is_active = False
+        first.save()
+        second.is_active = False
+        second.save(update_fields=['is_active'])
+        self.assertEqual(self.count(), 1)
+
+        second.is_active = True
+        second.save()
+        self.assertEqual(self.count(), 2)
+
+    def test_changing_organization_moves_the_slot(self):
+        other = Organization.objects.create(name="Otra", slug='otra', plan_type='STARTER')
+        patient = self.create_patient(1)
+        patient.organization = other
+        patient.save()
+        self.assertEqual((self.count(), self.count(other)), (0, 1))
+
+        patient.is_active = False
+        patient.organization = self.organization
+        patient.save()
+        self.assertEqual((self.count(), self.count(other)), (0, 0))
+
+    def test_bulk_delete_releases_by_organization_id(self):
+        for position in range(6):
+            self.create_patient(position, is_active=position % 2 == 0)
+        self.assertEqual(self.count(), 3)
+        with CaptureQueriesContext(connection) as queries:
+            ClinicalPatient.objects.filter(organization=self.organization).delete()
+        self.assertEqual(self.count(), 0)
+        self.assertFalse([query for query in queries if 'FROM "users_organization"' in query['sql']])
+
+
+class PatientPhotoDerivativeTests(ClinicalTestCase):
+    """Las miniaturas se registran en la base: la lista no sondea el storage y las viejas se borran."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        # Generación síncrona en vez del pool de procesos
+        self.enterContext(mock.patch('apps.common.images.schedule_derivatives', side_effect=build_derivatives))
+
+    def upload(self, patient, filename):
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 120), 'teal').save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.photo = SimpleUploadedFile(filename, buffer.getvalue(), content_type='image/png')
+            patient.save()
+        patient.refresh_from_db()
+        return patient.photo.name
+
+    def test_list_uses_the_recorded_derivatives_without_probing_storage(self):
+        patient = self.create_patient(1)
+        name = self.upload(patient, 'ana.png')
+        self.assertEqual(patient.photo_derivatives, name)
+
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError("exists() en una lectura")):
+            response = self.client.get('/api/clinical/patients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['photo'].endswith(derivative_name(name, 'avatar')))
+
+    def test_pending_derivatives_fall_back_to_the_original(self):
+        patient = self.create_patient(1)
+        name = self.upload(patient, 'ana.png')
+        ClinicalPatient.objects.filter(pk=patient.pk).update(photo_derivatives='')
+
+        response = self.client.get(f'/api/clinical/patients/{patient.pk}/')
+        self.assertTrue(response.json()['photo'].endswith(name))
+
+    def test_replacing_or_clearing_the_photo_deletes_the_old_derivatives(self):
+        patient = self.create_patient(1)
+        first = self.upload(patient, 'ana.png')
+        second = self.upload(patient, 'ana-2.png')
+        self.assertEqual(patient.photo_derivatives, second)
+        self.assertFalse(default_storage.exists(derivative_name(first, 'avatar')))
+        self.assertTrue(default_storage.exists(derivative_name(second, 'avatar')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.photo = None
+            patient.save()
+        patient.refresh_from_db()
+        self.assertEqual(patient.photo_derivatives, '')
+        self.assertFalse(default_storage.exists(derivative_name(second, 'medium')))
+
+    def test_pending_photos_are_retried_by_the_command(self):
+        patient = self.create_patient(1)
+        with mock.patch('apps.common.images.schedule_derivatives'):  # El worker murió sin registrarlas
+            name = self.upload(patient, 'ana.png')
+        self.assertEqual(patient.photo_derivatives, '')
+
+        with mock.patch('apps.users.management.commands.build_photo_derivatives.ProcessPoolExecutor', InlinePool):
+            call_command('build_photo_derivatives', stdout=io.StringIO())
+        patient.refresh_from_db()
+        self.assertEqual(patient.photo_derivatives, name)
+        self.assertTrue(default_storage.exists(derivative_name(name, 'avatar')))
+
+
+class PatientSearchTests(ClinicalTestCase):
+    """La búsqueda ignora tildes y mayúsculas, y ordena por relevancia."""
+
+    def names(self, response):
+        data = response.json()
+        return [patient['first_name'] for patient in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_matching_ignores_accents_and_case(self):
+        self.create_patient(1, first_name="José", last_name="Pérez Núñez")
+        self.create_patient(2, first_name="Ana", last_name="Perea")
+        for query in ['perez', 'PÉREZ', 'jose nunez', 'Jose  PEREZ']:
+            with self.subTest(query=query):
+                self.assertEqual(self.names(self.client.get('/api/clinical/patients/', {'search': query})), ["José"])
+                self.assertEqual(self.names(self.client.get('/api/clinical/patients/search/', {'q': query})), ["José"])
+
+    def test_results_are_ordered_by_relevance(self):
+        self.create_patient(1, first_name="Omar", last_name="Ruiz")                      # Contiene
+        self.create_patient(2, first_name="Rosa", last_name="Marin")                     # Una palabra empieza así
+        self.create_patient(3, first_name="Marina", last_name="Soto")                    # El nombre empieza así
+        self.create_patient(4, first_name="Luis", last_name="Paz", email='mar@test.com')  # Email exacto
+
+        # El email de Luis también tiene una palabra que empieza por "mar"
+        response = self.client.get('/api/clinical/patients/search/', {'q': 'Már'})
+        self.assertEqual(self.names(response), ["Marina", "Luis", "Rosa", "Omar"])
+        ranks = search_patients(ClinicalPatient.objects.all(), 'mar').values_list('first_name', 'search_rank')
+        self.assertEqual(list(ranks), [("Marina", 1), ("Luis", 2), ("Rosa", 2), ("Omar", 3)])
+
+        response = self.client.get('/api/clinical/patients/search/', {'q': 'MAR@test.com'})
+        self.assertEqual(self.names(response), ["Luis"])
+        ranks = search_patients(ClinicalPatient.objects.all(), 'mar@test.com').values_list('first_name', 'search_rank')
+        self.assertEqual(list(ranks), [("Luis", 0)])
+
+
+
+class PatientImportTests(ClinicalTestCase):
+    """Importación masiva: encabezados, duplicados, cupo por fila, dry-run y vínculo con la app."""
+    plan_type = 'STARTER'
+
+    def upload(self, content, name='pacientes.csv', **data):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'), content_type='text/csv')
+        return self.client.post('/api/clinical/patients/import/', {'file': upload, **data}, format='multipart')
+
+    def test_spanish_headers_and_semicolons_are_detected(self):
+        response = self.upload("Nombres;Apellidos;Correo electrónico;Teléfono\nJosé;Pérez;JOSE@test.com;999\n")
+        self.assertEqual(response.status_code, 201)
+        patient = ClinicalPatient.objects.get(organization=self.organization)
+        self.assertEqual((patient.first_name, patient.email, patient.phone), ("José", 'jose@test.com', '999'))
+
+    def test_missing_required_columns_are_a_bad_request(self):
+        response = self.upload("email,phone\nana@test.com,999\n")
+        self.assertEqual(response.status_code, 400)
+
+    def test_duplicates_in_the_file_and_in_the_clinic(self):
+        self.create_patient(1, email='ya@test.com')
+        response = self.upload(
+            "first name,last name,email\n"
+            "Ana,Paz,ana@test.com\n"
+            "Ana,Otra,ANA@test.com\n"
+            "Ya,Estaba,Ya@Test.com\n"
+        )
+        report = response.json()
+        self.assertEqual((report['created'], report['errors'], report['skipped']), (1, 1, 1))
+        self.assertEqual([row['status'] for row in report['rows']], ['created', 'error', 'skipped'])
+        self.assertIn("repetido", report['rows'][1]['errors'][0])
+
+    def test_rows_over_the_quota_are_reported(self):
+        Organization.objects.filter(pk=self.organization.pk).update(active_patient_count=8)
+        rows = ''.join(f"Paciente{position},Test\n" for position in range(4))
+        report = self.upload("nombre,apellido\n" + rows).json()
+
+        self.assertEqual((report['created'], report['errors']), (2, 2))
+        self.assertEqual([row['row'] for row in report['rows'] if row['status'] == 'error'], [4, 5])
+        self.assertTrue(all("límite" in row['errors'][0] for row in report['rows'][2:]))
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.active_patient_count, 10)
+
+    def test_dry_run_writes_nothing(self):
+        response = self.upload("nombre,apellido,email\nAna,Paz,ana@test.com\n", dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['created'], response.json()['dry_run']), (1, True))
+        self.assertFalse(ClinicalPatient.objects.exists())
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.active_patient_count, 0)
+
+    def test_app_users_are_linked_regardless_of_case(self):
+        app_user = User.objects.create_user('Paz.App@Test.com', 'x', role='PACIENTE')
+        report = self.upload("nombre,apellido,email\nAna,Paz,paz.app@test.com\nLuis,Soto,luis@test.com\n").json()
+
+        self.assertEqual((report['created'], report['linked']), (2, 1))
+        self.assertEqual(ClinicalPatient.objects.get(email='paz.app@test.com').app_user, app_user)
+        self.assertIsNone(ClinicalPatient.objects.get(email='luis@test.com').app_user)
+
+
+class PatientLinkReconciliationTests(ClinicalTestCase):
+    """La conciliación retoma desde el checkpoint y solo vincula expedientes pendientes."""
+
+    def create_app_user(self, email, created_at):
+        user = User.objects.create_user(email, 'x', role='PACIENTE')
+        User.objects.filter(pk=user.pk).update(created_at=created_at)
+        return user
+
+    def test_resumes_across_batches_with_created_at_ties(self):
+        moment = timezone.now() - timedelta(minutes=5)
+        patients = [self.create_patient(position, email=f'p{position}@test.com') for position in range(5)]
+        # Cuatro usuarios con el mismo created_at: el id desempata entre lotes
+        users = [self.create_app_user(f'P{position}@test.com', moment) for position in range(4)]
+        users.append(self.create_app_user('p4@test.com', moment + timedelta(seconds=1)))
+
+        batches = [reconcile_patient_links(batch_size=2, max_batches=1) for _ in range(4)]
+        self.assertEqual([stats['users'] for stats in batches], [2, 2, 1, 0])
+        self.assertEqual(sum(stats['linked'] for stats in batches), 5)
+        for patient in patients:
+            patient.refresh_from_db()
+        self.assertEqual(
+            {patient.pk: patient.app_user_id for patient in patients},
+            {patient.pk: user.pk for patient, user in zip(patients, sorted(users, key=lambda user: user.email.lower()))},
+        )
+        checkpoint = ReconciliationCheckpoint.objects.get()
+        self.assertEqual((checkpoint.last_user_id, checkpoint.linked_total), (users[-1].pk, 5))
+
+    def test_users_inside_the_safety_lag_wait_for_the_next_run(self):
+        patient = self.create_patient(1, email='nuevo@test.com')
+        user = self.create_app_user('nuevo@test.com', timezone.now() - SAFETY_LAG / 2)
+
+        self.assertEqual(reconcile_patient_links()['users'], 0)
+        patient.refresh_from_db()
+        self.assertIsNone(patient.app_user_id)
+
+        User.objects.filter(pk=user.pk).update(created_at=timezone.now() - SAFETY_LAG * 2)
+        self.assertEqual(reconcile_patient_links()['linked'], 1)
+        patient.refresh_from_db()
+        self.assertEqual(patient.app_user_id, user.pk)
+
+    def test_linked_records_are_not_overwritten(self):
+        original = self.create_app_user('otro@test.com', timezone.now() - timedelta(minutes=5))
+        patient = self.create_patient(1, email='ana@test.com')
+        ClinicalPatient.objects.filter(pk=patient.pk).update(app_user=original)
+        self.create_app_user('ana@test.com', timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(reconcile_patient_links(), {'users': 2, 'linked': 0, 'batches': 1})
+        patient.refresh_from_db()
+        self.assertEqual(patient.app_user_id, original.pk)
+
+class PatientExportTests(ClinicalTestCase):
+    def test_csv_neutralises_formula_cells(self):
+        self.create_patient(1, first_name='=HYPERLINK("http://x.test","ver")', phone='+51 999 888 777')
+        self.create_patient(2, first_name='Ana', email='@ana@test.com')
+        content = b''.join(export_patients(self.organization.pk, 'csv')).decode()
+        first, second = csv.DictReader(io.StringIO(content))
+        self.assertEqual(first['first_name'], "'=HYPERLINK(\"http://x.test\",\"ver\")")
+        self.assertEqual(first['phone'], "'+51 999 888 777")
+        self.assertEqual(second['email'], "'@ana@test.com")
+        self.assertEqual(second['first_name'], 'Ana')
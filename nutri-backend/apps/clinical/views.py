@@ -1,21 +1,63 @@
-from rest_framework import viewsets, permissions, filters
-from rest_framework.exceptions import PermissionDenied
+from django.db.models import Case, Value, When
+from django.db.models.functions import Concat, Left, Upper
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from apps.common.images import derivative_url_for_name
+from apps.common.projections import ProjectionListMixin
+from .exporter import EXPORT_FORMATS, export_filename, export_patients
+from .importer import import_patients, read_rows
 from .models import ClinicalPatient
+from .pagination import PatientCursorPagination
+from .search import PatientSearchFilter, search_patients
 from .serializers import ClinicalPatientListSerializer, ClinicalPatientDetailSerializer
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ProjectionListMixin, viewsets.ModelViewSet):
     """
     API para gestionar pacientes.
-    - LIST: Devuelve resumen optimizado.
+    - LIST: Devuelve resumen optimizado (proyección SQL, admite ?fields=id,first_name).
     - RETRIEVE/UPDATE: Devuelve detalle completo.
     """
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['first_name', 'last_name', 'email']
+    filter_backends = [PatientSearchFilter]
+    pagination_class = PatientCursorPagination
+
+    # Mismos campos que ClinicalPatientListSerializer, calculados en la query
+    projection = {
+        'id': 'id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'email': 'email',
+        'is_active': 'is_active',
+        'app_user_id': 'app_user_id',
+        'status_label': Case(When(app_user__isnull=False, then=Value('Vinculado')), default=Value('Pendiente')),
+        'initials': Upper(Concat(Left('first_name', 1), Left('last_name', 1))),
+        'photo': 'photo',
+        'created_at': 'created_at',
+    }
+    projection_by_default = True
+    # Cursor de la paginación y la foto con miniaturas ya generadas (sin sondear el storage)
+    projection_keys = ('id', 'created_at', 'photo_derivatives')
+
+    def get_projection_fields(self):
+        fields = super().get_projection_fields()
+        # created_at solo está para el cursor; en la lista se ve si se pide explícitamente
+        if fields is not None and self.fields_query_param not in self.request.query_params:
+            fields.remove('created_at')
+        return fields
+
+    def project_row(self, row):
+        if row.get('photo') is not None:
+            url = derivative_url_for_name(row['photo'], 'avatar', row['photo_derivatives'])
+            row['photo'] = self.request.build_absolute_uri(url) if url else None
+        return row
 
     def get_serializer_class(self):
         # Optimizamos tráfico: Lista ligera vs Detalle pesado
-        if self.action == 'list':
+        if self.action in ('list', 'search'):
             return ClinicalPatientListSerializer
         return ClinicalPatientDetailSerializer
 
@@ -24,20 +66,82 @@ class PatientViewSet(viewsets.ModelViewSet):
         🛡️ AISLAMIENTO MULTI-TENANT (Security Layer)
         Filtramos estrictamente por la organización del usuario logueado.
         """
-        user = self.request.user
+        tenant = self.request.tenant
         
         # Validamos que el usuario tenga perfil profesional u org
-        if user.role != 'PROFESSIONAL' and user.role != 'ORG_OWNER':
+        if tenant.role != 'PROFESSIONAL' and tenant.role != 'ORG_OWNER':
             raise PermissionDenied("Solo profesionales pueden gestionar expedientes.")
 
-        if not user.organization:
+        if not tenant.organization_id:
             raise PermissionDenied("Tu cuenta no pertenece a ninguna organización clínica.")
 
-        # Retornamos SOLO los pacientes de SU clínica
-        return ClinicalPatient.objects.filter(organization=user.organization).order_by('-created_at')
+        # Retornamos SOLO los pacientes de SU clínica (sin query extra: usa organization_id)
+        # (orden estable por (created_at, id) para la paginación por cursor)
+        return ClinicalPatient.objects.for_tenant(tenant).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         """
         Al crear, asignamos automáticamente la organización del nutri.
         """
-        serializer.save(organization=self.request.user.organization)
\ No newline at end of file
+        serializer.save(organization=self.request.tenant.organization)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Typeahead: /patients/search/?q=perez&limit=10
+        Devuelve los campos de la lista ordenados por relevancia
+        (email exacto, luego nombres que empiezan así, luego coincidencias parciales).
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': "Escribe al menos un carácter para buscar."})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            raise ValidationError({'limit': "Debe ser un número."})
+
+        patients = search_patients(self.get_queryset(), query)[:limit]
+        return Response(self.get_serializer(patients, many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        """
+        Importación masiva: POST multipart con `file` (CSV o XLSX) y `dry_run` opcional.
+        Columnas: nombre, apellido, email, teléfono (acepta encabezados en español o inglés).
+        Responde con totales y un reporte por fila.
+        """
+        self.get_queryset()  # Mismas validaciones de rol y organización que el resto del ViewSet
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': "Adjunta un archivo CSV o XLSX."})
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+        try:
+            report = import_patients(request.tenant.organization, read_rows(upload, upload.name), dry_run=dry_run)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ValidationError({'file': str(exc)})
+
+        created = report['created'] and not dry_run
+        return Response(report, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Exportación completa en streaming: /patients/export/?export_format=csv|ndjson&gzip=1
+        Incluye los planes del usuario vinculado hechos por la clínica. La memoria no crece
+        con el tamaño de la clínica y el primer byte sale con la primera tanda.
+        """
+        self.get_queryset()  # Mismas validaciones de rol y organización que el resto del ViewSet
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': "Usa csv o ndjson."})
+        gzip = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        tenant = request.tenant
+        response = StreamingHttpResponse(
+            export_patients(tenant.organization_id, export_format, gzip=gzip),
+            content_type='application/gzip' if gzip else EXPORT_FORMATS[export_format][0],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(tenant.organization, export_format, gzip)}"'
+        response['Cache-Control'] = 'no-store'
+        return response
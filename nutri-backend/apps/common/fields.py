@@ -0,0 +1,20 @@
+from rest_framework import serializers
+from .images import derivative_url
+
+
+class ImageDerivativeField(serializers.ReadOnlyField):
+    """
+    URL absoluta de una miniatura ('avatar', 'medium') de un ImageField.
+    Si la miniatura todavía no se generó, devuelve la del original.
+    """
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        url = derivative_url(value, self.size)
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
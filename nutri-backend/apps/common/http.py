@@ -0,0 +1,4 @@
+def etag_matches(request, etag):
+    """True si el cliente ya tiene esta versión (cabecera If-None-Match)."""
+    if_none_match = request.headers.get('If-None-Match', '')
+    return etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
@@ -0,0 +1,190 @@
+"""
+Derivados de imágenes (miniaturas) para fotos de pacientes y usuarios.
+
+Cada foto subida genera versiones de tamaño fijo junto al original:
+    patients/photos/juan.jpg -> patients/photos/juan.avatar.webp (96x96)
+                             -> patients/photos/juan.medium.webp (480px máx.)
+
+El redimensionado (CPU) corre en un pool de procesos con Pillow; el proceso
+principal solo lee el original y guarda los resultados en el storage, así la
+respuesta del upload no espera a las miniaturas. Si el worker se recicla antes de
+terminar, la foto queda pendiente (`photo` != `photo_derivatives`) y la retoma
+`build_photo_derivatives` (cron, o `--loop` como worker).
+
+Qué foto ya tiene miniaturas queda registrado en la base: junto a `photo` cada
+modelo guarda `photo_derivatives` (el nombre de la foto cuyas miniaturas están
+generadas). Las lecturas comparan ambas columnas sin tocar el storage; mientras
+no coincidan, los serializers devuelven la URL del original. Al cambiar o quitar
+la foto se borran las miniaturas de la anterior.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# nombre -> (ancho, alto, recorte cuadrado)
+DERIVATIVE_SIZES = {
+    'avatar': (96, 96, True),     # Avatares de 40-48px en pantallas 2x
+    'medium': (480, 480, False),  # Detalle del expediente / perfil
+}
+DERIVATIVE_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+DERIVATIVE_EXTENSION = '.webp' if DERIVATIVE_FORMAT == 'WEBP' else '.jpg'
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 82, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+_executor = None
+
+
+def derivative_name(name, size):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}{DERIVATIVE_EXTENSION}'
+
+
+def record_field(field_name):
+    """Columna que registra de qué foto existen miniaturas ('photo' -> 'photo_derivatives')."""
+    return f'{field_name}_derivatives'
+
+
+def render_derivatives(content):
+    """Genera los bytes de cada tamaño a partir de la imagen original (corre en el pool)."""
+    results = {}
+    with Image.open(io.BytesIO(content)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for size, (width, height, crop) in DERIVATIVE_SIZES.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, DERIVATIVE_FORMAT, **SAVE_OPTIONS[DERIVATIVE_FORMAT])
+        results[size] = buffer.getvalue()
+    return results
+
+
+def store_derivatives(name, rendered):
+    for size, content in rendered.items():
+        target = derivative_name(name, size)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(content))
+
+
+def delete_derivatives(name):
+    for size in DERIVATIVE_SIZES:
+        default_storage.delete(derivative_name(name, size))
+
+
+def derivatives_exist(name):
+    """Sondea el storage (solo para el backfill; las lecturas usan la columna registrada)."""
+    return all(default_storage.exists(derivative_name(name, size)) for size in DERIVATIVE_SIZES)
+
+
+def record_derivatives(model, name, field_name='photo'):
+    """
+    Marca que las filas con la foto `name` ya tienen miniaturas. Si la foto cambió
+    mientras se generaban, nadie las usa: se borran.
+    """
+    if not model.objects.filter(**{field_name: name}).update(**{record_field(field_name): name}):
+        delete_derivatives(name)
+
+
+def discard_derivatives(model, pk, name, field_name='photo'):
+    """La fila `pk` dejó de usar la foto `name`: borra sus miniaturas si ninguna otra fila la usa."""
+    record = record_field(field_name)
+    model.objects.filter(pk=pk, **{record: name}).update(**{record: ''})
+    if not model.objects.filter(**{field_name: name}).exists():
+        delete_derivatives(name)
+
+
+def build_derivatives(name, model, field_name='photo'):
+    """Versión síncrona (comando de backfill): genera, guarda y registra todos los tamaños."""
+    with default_storage.open(name, 'rb') as fp:
+        store_derivatives(name, render_derivatives(fp.read()))
+    record_derivatives(model, name, field_name)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2))
+    return _executor
+
+
+def schedule_derivatives(name, model, field_name='photo'):
+    """Encola la generación de miniaturas de `name` en el pool de procesos."""
+    try:
+        with default_storage.open(name, 'rb') as fp:
+            content = fp.read()
+    except OSError:
+        logger.warning("No se pudo leer la imagen %s para generar miniaturas", name)
+        return None
+
+    def on_done(future):
+        # Corre en el hilo del pool, fuera del ciclo de un request: su conexión la cerramos aquí
+        close_old_connections()
+        try:
+            store_derivatives(name, future.result())
+            record_derivatives(model, name, field_name)
+        except Exception:
+            logger.exception("Falló la generación de miniaturas de %s (queda pendiente)", name)
+        finally:
+            close_old_connections()
+
+    future = get_executor().submit(render_derivatives, content)
+    future.add_done_callback(on_done)
+    return future
+
+
+def refresh_derivatives(instance, field_name='photo'):
+    """
+    Tras guardar `instance` (al confirmar la transacción): borra las miniaturas de la
+    foto anterior y encola las de la nueva. Sin cambios de foto no hace nada.
+    """
+    model = type(instance)
+    image_field = getattr(instance, field_name)
+    name = image_field.name if image_field else ''
+    recorded = getattr(instance, record_field(field_name))
+    if recorded == name:
+        return
+    if recorded:
+        transaction.on_commit(lambda: discard_derivatives(model, instance.pk, recorded, field_name))
+    if name:
+        transaction.on_commit(lambda: schedule_derivatives(name, model, field_name))
+
+
+def recorded_derivatives(image_field):
+    return getattr(image_field.instance, record_field(image_field.field.name), '')
+
+
+def has_derivatives(image_field):
+    """¿Ya están las miniaturas de esta foto? Lee la columna registrada de la instancia."""
+    return bool(image_field) and image_field.name == recorded_derivatives(image_field)
+
+
+def derivative_url(image_field, size):
+    """URL del derivado si ya existe; si no, la del original (o None sin foto)."""
+    if not image_field:
+        return None
+    return derivative_url_for_name(image_field.name, size, recorded_derivatives(image_field))
+
+
+def derivative_url_for_name(name, size, recorded=''):
+    """
+    Igual que derivative_url pero a partir de las columnas guardadas (filas de .values()):
+    `recorded` es el valor de `photo_derivatives`.
+    """
+    if not name:
+        return None
+    if name == recorded:
+        return default_storage.url(derivative_name(name, size))
+    return default_storage.url(name)
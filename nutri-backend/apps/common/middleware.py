@@ -0,0 +1,16 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZip de las respuestas (JSON, CSV, NDJSON) si el cliente manda Accept-Encoding: gzip.
+    No toca lo que ya viene comprimido: imágenes, descargas .gz y el snapshot del
+    catálogo (que ya trae Content-Encoding).
+    """
+    precompressed_types = ('application/gzip', 'application/zip', 'image/', 'video/')
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(self.precompressed_types):
+            return response
+        return super().process_response(request, response)
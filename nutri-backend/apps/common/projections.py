@@ -0,0 +1,72 @@
+"""
+Modo lista liviano para los ViewSets: proyecciones con .values() en vez de
+instancias de modelo + ModelSerializer.
+
+Cada ViewSet declara `projection` (nombre en el JSON -> campo o expresión SQL):
+
+    projection = {
+        'id': 'id',
+        'app_user_id': 'app_user_id',
+        'initials': Upper(Concat(Left('first_name', 1), Left('last_name', 1))),
+    }
+
+Los campos calculados se resuelven en la misma query (sin métodos por fila ni
+queries extra) y `?fields=id,first_name` devuelve solo esas columnas (sparse
+fieldsets). Con `projection_by_default = True` la lista usa siempre este camino
+(la proyección cubre todo lo que devuelve el serializer); si no, solo cuando el
+cliente pide `?fields=`.
+"""
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+class ProjectionListMixin:
+    projection = {}
+    projection_by_default = False
+    # Columnas que la paginación o project_row necesitan aunque el cliente no las pida
+    # (p.ej. el cursor); pueden ser columnas del modelo que no se exponen en `projection`
+    projection_keys = ()
+    fields_query_param = 'fields'
+
+    def get_projection_fields(self):
+        """Campos pedidos (en orden) o None para usar el serializer completo."""
+        raw = self.request.query_params.get(self.fields_query_param)
+        if raw is None:
+            return list(self.projection) if self.projection_by_default else None
+        requested = list(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+        unknown = [field for field in requested if field not in self.projection]
+        if unknown or not requested:
+            raise ValidationError({
+                self.fields_query_param: f"Campos no disponibles: {', '.join(unknown) or '(vacío)'}. "
+                                         f"Usa: {', '.join(self.projection)}."
+            })
+        return requested
+
+    def project_queryset(self, queryset, fields):
+        columns, expressions = [], {}
+        for name in dict.fromkeys([*fields, *self.projection_keys]):
+            source = self.projection.get(name, name)
+            if source == name:
+                columns.append(name)
+            else:
+                expressions[name] = F(source) if isinstance(source, str) else source
+        # Los prefetch son para instancias; sobre dicts no aplican
+        return queryset.prefetch_related(None).values(*columns, **expressions)
+
+    def project_row(self, row):
+        """Ajustes en Python que no se pueden hacer en SQL (URLs de imágenes, etc.)."""
+        return row
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_projection_fields() if self.projection else None
+        if fields is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.project_queryset(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [{field: row[field] for field in fields} for row in map(self.project_row, rows)]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
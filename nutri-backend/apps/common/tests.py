@@ -0,0 +1,140 @@
+import gzip
+import json
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase
+from apps.clinical.models import ClinicalPatient
+from apps.clinical.serializers import ClinicalPatientListSerializer
+from apps.nutrition.models import Ingredient, Meal, MealItem
+from apps.nutrition.serializers import IngredientSerializer, MealSerializer
+from apps.nutrition.views import MealViewSet
+from apps.users.models import Organization, User
+from .middleware import CompressionMiddleware
+from .renderers import ORJSONRenderer
+
+
+class CommonTestCase(APITestCase):
+    """Clínica con un profesional, dos expedientes y una receta con foto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name="Clínica Test", slug='clinica-test', plan_type='BUSINESS')
+        cls.professional = User.objects.create_user(
+            'pro@test.com', 'x', role='PROFESSIONAL', organization=cls.organization,
+        )
+        cls.app_user = User.objects.create_user('ana@test.com', 'x', role='PACIENTE')
+        cls.linked = ClinicalPatient.objects.create(
+            organization=cls.organization, first_name="Ana", last_name="Paz", email='ana@test.com',
+        )
+        cls.pending = ClinicalPatient.objects.create(organization=cls.organization, first_name="luis", last_name="Soto")
+        # Foto con miniaturas registradas y otra todavía pendiente
+        ClinicalPatient.objects.filter(pk=cls.linked.pk).update(photo='patients/ana.jpg', photo_derivatives='patients/ana.jpg')
+        ClinicalPatient.objects.filter(pk=cls.pending.pk).update(photo='patients/luis.jpg')
+
+        cls.rice = Ingredient.objects.create(
+            name="Arroz", calories=Decimal('130'), proteins=Decimal('2.70'),
+            carbohydrates=Decimal('28'), fats=Decimal('0.30'), fiber=Decimal('0.40'),
+        )
+        cls.meal = Meal.objects.create(name="Arroz blanco", created_by=cls.professional)
+        MealItem.objects.create(meal=cls.meal, ingredient=cls.rice, quantity_grams=Decimal('150'))
+        Meal.objects.filter(pk=cls.meal.pk).update(image='meals/arroz.jpg')
+        Meal.objects.create(name="Sin foto")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.professional)
+
+    def serialized(self, serializer_class, queryset):
+        """Salida del serializer completo, renderizada como la API (referencia de la proyección)."""
+        request = Request(RequestFactory().get('/'))
+        data = serializer_class(queryset, many=True, context={'request': request}).data
+        return json.loads(JSONRenderer().render(data))
+
+
+class ProjectionTests(CommonTestCase):
+    """La proyección .values() devuelve lo mismo que el serializer, y ?fields= recorta columnas."""
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/nutrition/ingredients/', {'fields': 'name,calories,name'})
+        self.assertEqual(response.json(), [{'name': "Arroz", 'calories': '130.00'}])
+
+        response = self.client.get('/api/clinical/patients/', {'fields': 'initials,status_label'})
+        self.assertEqual(
+            response.json()['results'],
+            [{'initials': 'LS', 'status_label': 'Pendiente'}, {'initials': 'AP', 'status_label': 'Vinculado'}],
+        )
+
+    def test_unknown_or_empty_fields_are_a_bad_request(self):
+        for fields in ['name,password', ' , ']:
+            with self.subTest(fields=fields):
+                response = self.client.get('/api/nutrition/ingredients/', {'fields': fields})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fields', response.json())
+
+    def test_patients_match_the_serializer(self):
+        response = self.client.get('/api/clinical/patients/')
+        patients = ClinicalPatient.objects.order_by('-created_at', '-id')
+        self.assertEqual(response.json()['results'], self.serialized(ClinicalPatientListSerializer, patients))
+        photos = [patient['photo'] for patient in response.json()['results']]
+        self.assertEqual(photos, ['http://testserver/media/patients/luis.jpg', 'http://testserver/media/patients/ana.avatar.webp'])
+
+    def test_ingredients_match_the_serializer(self):
+        response = self.client.get('/api/nutrition/ingredients/')
+        self.assertEqual(response.json(), self.serialized(IngredientSerializer, Ingredient.objects.all()))
+
+    def test_meals_match_the_serializer(self):
+        fields = ','.join(MealViewSet.projection)
+        response = self.client.get('/api/nutrition/meals/', {'fields': fields})
+        expected = [
+            {field: meal[field] for field in MealViewSet.projection}
+            for meal in self.serialized(MealSerializer, Meal.objects.with_items())
+        ]
+        self.assertEqual(sorted(response.json(), key=lambda meal: meal['id']), sorted(expected, key=lambda meal: meal['id']))
+        self.assertIn('http://testserver/media/meals/arroz.jpg', [meal['image'] for meal in response.json()])
+
+
+class ORJSONRendererTests(APITestCase):
+    def test_decimals_and_datetimes_are_formatted_like_drf(self):
+        moment = datetime(2024, 5, 6, 9, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        raw = {'calories': Decimal('130.50'), 'zero': Decimal('0.00'), 'updated_at': moment, 'days': {1: 'lunes'}}
+        # Lo que devuelven los serializers de DRF para esos mismos valores
+        drf = {'calories': '130.50', 'zero': '0.00', 'updated_at': '2024-05-06T09:30:15.123456Z', 'days': {'1': 'lunes'}}
+        self.assertEqual(json.loads(ORJSONRenderer().render(raw)), json.loads(JSONRenderer().render(drf)))
+
+    def test_indent_and_empty_bodies(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        rendered = ORJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, b'{\n  "a": 1\n}')
+
+
+class CompressionMiddlewareTests(CommonTestCase):
+    def compress(self, response):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_json_is_compressed(self):
+        response = self.compress(HttpResponse(b'{"a": 1}' * 200, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), b'{"a": 1}' * 200)
+
+    def test_gzip_downloads_are_left_alone(self):
+        body = gzip.compress(b'x' * 2000)
+        response = self.compress(HttpResponse(body, content_type='application/gzip'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+
+    def test_catalog_snapshot_is_not_compressed_twice(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+        response = self.client.get('/api/nutrition/ingredients/snapshot/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        document = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual([row['name'] for row in document['ingredients']], ["Arroz"])
@@ -0,0 +1,16 @@
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r'[^a-z0-9@.]+')
+
+
+def normalize_text(value):
+    """
+    Normaliza texto para búsquedas: minúsculas, sin tildes ni diéresis y con
+    los separadores colapsados a un espacio. Ej: "Pérez-Ñuñez " -> "perez nunez".
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value).lower())
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', folded).strip()
@@ -10,6 +10,7 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('category',)
     search_fields = ('name',) # VITAL: Necesario para que el autocomplete funcione en Meal
     ordering = ('name',)
+    readonly_fields = ('version', 'updated_at')
 
 # ==============================================================================
 # 2. GESTIÓN DE COMIDAS (RECETAS)
@@ -24,12 +25,14 @@ class MealItemInline(admin.TabularInline):
 
 @admin.register(Meal)
 class MealAdmin(admin.ModelAdmin):
-    list_display = ('name', 'created_by', 'total_calories_display', 'created_at')
+    list_display = ('name', 'created_by', 'total_calories_display', 'total_proteins', 'total_carbohydrates', 'total_fats', 'created_at')
     search_fields = ('name',) # VITAL: Necesario para que el autocomplete funcione en DietPlan
     list_filter = ('created_by',)
     inlines = [MealItemInline] # <--- Conectamos la tabla de ingredientes
+    # Totales guardados: se recalculan solos al guardar los ingredientes de la receta
+    readonly_fields = ('total_calories', 'total_proteins', 'total_carbohydrates', 'total_fats', 'total_fiber')
 
-    # Truco para mostrar la propiedad calculada 'total_calories'
+    # Mostramos la columna 'total_calories' con su unidad
     def total_calories_display(self, obj):
         return f"{obj.total_calories} kcal"
     total_calories_display.short_description = "Calorías Totales"
@@ -4,4 +4,10 @@ class NutritionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.nutrition'
     label = 'nutrition'
-    verbose_name = "Gestión Nutricional"
\ No newline at end of file
+    verbose_name = "Gestión Nutricional"
+
+    def ready(self):
+        """
+        Activamos las señales al arrancar (totales de recetas).
+        """
+        import apps.nutrition.signals
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Modelos de lectura cacheados de Nutrición.
+
+El "plan actual" de cada paciente se guarda ya serializado (JSON desnormalizado
+con asignaciones, recetas, items y totales) junto con su ETag. Las señales lo
+invalidan solo cuando cambia el plan, sus asignaciones o sus recetas. El documento
+guarda las imágenes con su URL relativa: se hacen absolutas al servirlo, con el
+host de cada request.
+
+Los resúmenes de macros se cachean por versión de plan: cada cambio asigna una
+versión nueva, así las entradas viejas simplemente dejan de leerse.
+"""
+import hashlib
+import json
+import time
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from .models import DietPlan
+from .serializers import CurrentPlanSerializer
+
+CURRENT_PLAN_KEY = 'nutrition:current-plan:{patient_id}'
+CURRENT_PLAN_TIMEOUT = 60 * 60 * 24  # 1 día como red de seguridad; la invalidación es explícita
+
+PLAN_VERSION_KEY = 'nutrition:plan-version:{plan_id}'
+PLAN_SUMMARY_KEY = 'nutrition:plan-summary:{plan_id}:{version}'
+PLAN_SUMMARY_TIMEOUT = 60 * 60 * 24
+
+MEAL_CATALOG_VERSION_KEY = 'nutrition:meal-catalog-version'
+
+
+def current_plan_key(patient_id):
+    return CURRENT_PLAN_KEY.format(patient_id=patient_id)
+
+
+def build_current_plan_entry(patient_id):
+    """
+    Reconstruye el documento del plan activo del paciente (3 queries).
+    Devuelve {'etag': str | None, 'document': dict | None}.
+    Se serializa sin request: las URLs quedan relativas y no dependen del host de quien lo pidió.
+    """
+    plan = (
+        DietPlan.objects.with_graph()
+        .filter(patient_id=patient_id, is_active=True)
+        .order_by('-updated_at')
+        .first()
+    )
+    if plan is None:
+        return {'etag': None, 'document': None}
+
+    content = JSONRenderer().render(CurrentPlanSerializer(plan, context={'request': None}).data)
+    return {
+        'etag': '"%s"' % hashlib.sha1(content).hexdigest(),
+        'document': json.loads(content),
+    }
+
+
+def get_current_plan_entry(patient_id):
+    """Lee el documento desde la caché y solo lo reconstruye si fue invalidado."""
+    key = current_plan_key(patient_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = build_current_plan_entry(patient_id)
+        cache.set(key, entry, CURRENT_PLAN_TIMEOUT)
+    return entry
+
+
+def absolute_current_plan(document, request):
+    """Copia del documento con las imágenes de las recetas como URL absoluta para este request."""
+    allocations = []
+    for allocation in document['allocations']:
+        meal = allocation['meal_details']
+        if meal.get('image'):
+            meal = {**meal, 'image': request.build_absolute_uri(meal['image'])}
+        allocations.append({**allocation, 'meal_details': meal})
+    return {**document, 'allocations': allocations}
+
+
+def get_plan_version(plan_id):
+    """
+    Versión actual del plan. Si la clave no existe (nueva o expulsada de la caché)
+    se crea una versión nueva, nunca se reutiliza una anterior.
+    """
+    key = PLAN_VERSION_KEY.format(plan_id=plan_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_plan_summary(plan):
+    """Resumen de macros del plan (DietPlan.macro_summary) cacheado por versión."""
+    key = PLAN_SUMMARY_KEY.format(plan_id=plan.pk, version=get_plan_version(plan.pk))
+    summary = cache.get(key)
+    if summary is None:
+        summary = plan.macro_summary()
+        cache.set(key, summary, PLAN_SUMMARY_TIMEOUT)
+    return summary
+
+
+def bump_plan_versions(plan_ids):
+    """Nueva versión para los planes (al confirmar la transacción en curso)."""
+    keys = [PLAN_VERSION_KEY.format(plan_id=plan_id) for plan_id in set(plan_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+
+def invalidate_patients(patient_ids):
+    """
+    Descarta el plan actual de los pacientes al confirmar la transacción en curso:
+    si se borrara antes, un lector concurrente volvería a cachear las filas viejas.
+    """
+    keys = [current_plan_key(patient_id) for patient_id in set(patient_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_plans(plan_ids):
+    """Nueva versión para los planes y se descarta el plan actual de sus pacientes."""
+    plan_ids = list(plan_ids)
+    bump_plan_versions(plan_ids)
+    invalidate_patients(DietPlan.objects.filter(pk__in=plan_ids).values_list('patient_id', flat=True))
+
+
+def get_meal_catalog_version():
+    """Versión del conjunto de recetas (la usa el índice de sustituciones)."""
+    version = cache.get(MEAL_CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(MEAL_CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(MEAL_CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_meal_catalog_version():
+    """Al confirmar la transacción: antes, otro proceso reconstruiría el índice con las filas viejas."""
+    transaction.on_commit(lambda: cache.set(MEAL_CATALOG_VERSION_KEY, time.time_ns(), None))
+
+
+def invalidate_meals(meals):
+    """`meals` puede ser una lista de ids o un queryset de Meal (se usa como subquery)."""
+    bump_meal_catalog_version()
+    plans = list(
+        DietPlan.objects.filter(allocations__meal__in=meals)
+        .values_list('pk', 'patient_id')
+        .distinct()
+    )
+    bump_plan_versions(plan_id for plan_id, _ in plans)
+    invalidate_patients(patient_id for _, patient_id in plans)
@@ -0,0 +1,80 @@
+"""
+Motor nutricional por lotes.
+
+Lee las asignaciones de los planes junto con los totales ya guardados en cada
+receta (Meal.total_*, ver signals.py) en una sola query y calcula con NumPy los
+totales por día, por momento del día y por plan, para muchos planes a la vez
+(dashboard de planes: /diet-plans/totals/).
+
+Uso:
+    totals = compute_plan_totals(plan_ids)
+    totals.as_dict(plan_id)  # {'total': {...}, 'days': {...}, 'meal_times': {...}}
+"""
+import numpy as np
+from .models import MACRO_FIELDS, PlanAllocation
+
+DAYS = [day for day, _ in PlanAllocation.DAYS_OF_WEEK]
+MEAL_TIMES = [code for code, _ in PlanAllocation.MEAL_TIMES]
+
+
+def _group_sum(index, values, size):
+    """Suma las filas de `values` (n, k) agrupadas por `index` -> matriz (size, k)."""
+    if not len(values):
+        return np.zeros((size, len(MACRO_FIELDS)))
+    columns = [np.bincount(index, weights=values[:, col], minlength=size) for col in range(values.shape[1])]
+    return np.stack(columns, axis=1)
+
+
+def _macros_dict(row):
+    return {field: round(float(value), 2) for field, value in zip(MACRO_FIELDS, row)}
+
+
+class PlanTotals:
+    """
+    Totales de varios planes calculados en bloque.
+    - plan_ids:   (p,)       ids de plan ordenados
+    - total:      (p, 5)     total semanal por plan
+    - days:       (p, 7, 5)  total por día de la semana (lunes..domingo)
+    - meal_times: (p, 5, 5)  total por momento del día (en el orden de MEAL_TIMES)
+    """
+    def __init__(self, plan_ids, total, days, meal_times):
+        self.plan_ids = plan_ids
+        self.total = total
+        self.days = days
+        self.meal_times = meal_times
+
+    def as_dict(self, plan_id):
+        """Totales de un plan en formato JSON-friendly."""
+        index = int(np.searchsorted(self.plan_ids, plan_id))
+        if index >= len(self.plan_ids) or self.plan_ids[index] != plan_id:
+            raise KeyError(plan_id)
+        return {
+            'total': _macros_dict(self.total[index]),
+            'days': {day: _macros_dict(self.days[index, pos]) for pos, day in enumerate(DAYS)},
+            'meal_times': {code: _macros_dict(self.meal_times[index, pos]) for pos, code in enumerate(MEAL_TIMES)},
+        }
+
+
+def compute_plan_totals(plan_ids):
+    """
+    Calcula los totales de todos los planes pedidos en una pasada matricial.
+    Cuesta 1 query (asignaciones con los totales de su receta) sin importar el número de planes.
+    """
+    plan_ids = np.unique(np.asarray(list(plan_ids), dtype=np.int64))
+    allocations = list(
+        PlanAllocation.objects.filter(plan_id__in=plan_ids.tolist())
+        .values_list('plan_id', 'day_of_week', 'meal_time', *[f'meal__total_{field}' for field in MACRO_FIELDS])
+    )
+
+    n_plans, n_days, n_times = len(plan_ids), len(DAYS), len(MEAL_TIMES)
+    time_index = {code: pos for pos, code in enumerate(MEAL_TIMES)}
+    plan_idx = np.searchsorted(plan_ids, np.array([row[0] for row in allocations], dtype=np.int64))
+    day_idx = np.array([row[1] - 1 for row in allocations], dtype=np.int64)
+    meal_time_idx = np.array([time_index[row[2]] for row in allocations], dtype=np.int64)
+    allocated = np.array([row[3:] for row in allocations], dtype=np.float64).reshape(len(allocations), len(MACRO_FIELDS))
+
+    total = _group_sum(plan_idx, allocated, n_plans)
+    n_macros = len(MACRO_FIELDS)
+    days = _group_sum(plan_idx * n_days + day_idx, allocated, n_plans * n_days).reshape(n_plans, n_days, n_macros)
+    meal_times = _group_sum(plan_idx * n_times + meal_time_idx, allocated, n_plans * n_times).reshape(n_plans, n_times, n_macros)
+    return PlanTotals(plan_ids, total, days, meal_times)
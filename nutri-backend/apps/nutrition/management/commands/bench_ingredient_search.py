@@ -0,0 +1,52 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from apps.nutrition.models import Ingredient
+from apps.nutrition.search import IngredientIndex
+
+BASES = [
+    'pollo', 'pechuga de pollo', 'arroz', 'arroz integral', 'atún', 'salmón', 'huevo', 'leche',
+    'yogur griego', 'queso fresco', 'plátano', 'manzana', 'piña', 'palta', 'aceite de oliva',
+    'avena', 'quinua', 'lentejas', 'garbanzos', 'frijoles', 'camote', 'papa', 'brócoli',
+    'espinaca', 'zanahoria', 'tomate', 'cebolla', 'maní', 'almendras', 'pan integral',
+]
+VARIANTS = ['cocido', 'crudo', 'a la plancha', 'hervido', 'al horno', 'frito', 'light', 'orgánico', 'en conserva', 'deshidratado']
+QUERIES = ['pol', 'pollo', 'poyo', 'pechuga', 'arroz int', 'salmon', 'atun', 'platano', 'brocoli', 'qinua', 'lente', 'a']
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia (p50/p95) del índice de búsqueda de ingredientes sobre un catálogo sintético."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100_000, help="Número de ingredientes sintéticos")
+        parser.add_argument('--queries', type=int, default=1000, help="Número de búsquedas a medir")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        categories = [code for code, _ in Ingredient.CATEGORIES]
+        rows = [
+            (pk, f"{rng.choice(BASES)} {rng.choice(VARIANTS)} {pk}", rng.choice(categories))
+            for pk in range(1, options['size'] + 1)
+        ]
+
+        started = time.perf_counter()
+        index = IngredientIndex(rows)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        for _ in range(options['queries']):
+            query = rng.choice(QUERIES)
+            category = rng.choice([None, rng.choice(categories)])
+            started = time.perf_counter()
+            index.search(query, category=category)[:20]
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(f"Catálogo: {len(index)} ingredientes (índice construido en {build_seconds:.2f}s)")
+        self.stdout.write(f"Búsquedas: {len(latencies)}  p50={p50:.2f}ms  p95={p95:.2f}ms  max={latencies[-1]:.2f}ms")
+        names = dict((pk, name) for pk, name, _ in rows)
+        top = [names[pk] for pk in index.search('poyo')[:3]]
+        self.stdout.write(self.style.SUCCESS(f"Ejemplo 'poyo' -> {top}"))
@@ -0,0 +1,232 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.common.text import normalize_text
+from apps.nutrition.caching import invalidate_meals
+from apps.nutrition.models import MACRO_FIELDS, CatalogState, Ingredient, Meal
+from apps.nutrition.search import bump_catalog_version
+
+# Nombres de columna aceptados por defecto (ya normalizados: minúsculas y sin tildes)
+COLUMN_ALIASES = {
+    'name': ['name', 'nombre', 'description', 'descripcion', 'food', 'alimento'],
+    'category': ['category', 'categoria', 'grupo', 'food group'],
+    'calories': ['calories', 'kcal', 'energy', 'energia', 'energy kcal', 'energia kcal'],
+    'proteins': ['proteins', 'protein', 'proteina', 'proteinas'],
+    'carbohydrates': ['carbohydrates', 'carbs', 'carbohidratos', 'carbohydrate by difference'],
+    'fats': ['fats', 'fat', 'grasa', 'grasas', 'total lipid fat', 'lipidos'],
+    'fiber': ['fiber', 'fibra', 'fiber total dietary', 'fibra dietaria'],
+}
+
+# Límites según los DecimalField de Ingredient (max_digits - decimal_places)
+MAX_VALUES = {'calories': Decimal('9999.99')} | {field: Decimal('999.99') for field in MACRO_FIELDS[1:]}
+MAX_NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def iter_csv_records(fp, delimiter):
+    yield from csv.DictReader(fp, delimiter=delimiter)
+
+
+def iter_json_records(fp, chunk_size=64 * 1024):
+    """
+    Lee un arreglo JSON ([{...}, {...}]) elemento por elemento, o JSON Lines
+    (un objeto por línea), sin cargar el archivo completo en memoria.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        # JSON Lines
+        for line in (buffer + fp.readline()).splitlines():
+            if line.strip():
+                yield json.loads(line)
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                raise CommandError("JSON incompleto: el arreglo no se cerró correctamente.")
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa/actualiza ingredientes desde tablas de composición (CSV, JSON o JSON Lines) "
+        "en lotes con upsert por nombre, usando memoria constante."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo CSV/JSON a importar")
+        parser.add_argument('--format', choices=['auto', 'csv', 'json'], default='auto')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delimiter', default=',', help="Separador del CSV")
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument(
+            '--map', action='append', default=[], metavar='CAMPO=COLUMNA',
+            help="Mapeo explícito de columnas, ej: --map calories='Energy (kcal)' (repetible)",
+        )
+        parser.add_argument('--default-category', default='OTHER', choices=[code for code, _ in Ingredient.CATEGORIES])
+        parser.add_argument('--rejects', help="Archivo CSV donde guardar las filas rechazadas")
+        parser.add_argument('--dry-run', action='store_true', help="Valida sin escribir en la BD")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.explicit_map = {}
+        for mapping in options['map']:
+            field, _, column = mapping.partition('=')
+            if field not in COLUMN_ALIASES or not column:
+                raise CommandError(f"Mapeo inválido '{mapping}'. Campos: {', '.join(COLUMN_ALIASES)}")
+            self.explicit_map[field] = column
+
+        categories = {}
+        for code, label in Ingredient.CATEGORIES:
+            categories[normalize_text(code)] = code
+            categories[normalize_text(label)] = code
+        self.categories = categories
+
+        fmt = options['format']
+        if fmt == 'auto':
+            fmt = 'csv' if options['path'].lower().endswith(('.csv', '.tsv', '.txt')) else 'json'
+
+        rejects_file = open(options['rejects'], 'w', newline='', encoding='utf-8') if options['rejects'] else None
+        self.rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if self.rejects_writer:
+            self.rejects_writer.writerow(['row', 'reason', 'data'])
+
+        stats = {'read': 0, 'upserted': 0, 'rejected': 0, 'batches': 0}
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as fp:
+                records = iter_csv_records(fp, options['delimiter']) if fmt == 'csv' else iter_json_records(fp)
+                batch = {}
+                for row_number, record in enumerate(records, start=1):
+                    stats['read'] += 1
+                    ingredient = self.build_ingredient(row_number, record)
+                    if ingredient is None:
+                        stats['rejected'] += 1
+                        continue
+                    batch[ingredient.name] = ingredient  # Si se repite el nombre en el lote, gana el último
+                    if len(batch) >= options['batch_size']:
+                        stats['upserted'] += self.flush(batch, stats)
+                        batch = {}
+                if batch:
+                    stats['upserted'] += self.flush(batch, stats)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        if stats['upserted'] and not options['dry_run']:
+            bump_catalog_version()
+
+        elapsed = time.perf_counter() - started
+        throughput = stats['read'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Filas leídas: {stats['read']} | guardadas: {stats['upserted']} | rechazadas: {stats['rejected']} | "
+            f"lotes: {stats['batches']} | {elapsed:.2f}s ({throughput:,.0f} filas/s)"
+            + (" [dry-run]" if options['dry_run'] else "")
+        ))
+
+    # ------------------------------------------------------------------
+    def resolve_columns(self, record):
+        """Asocia cada campo de Ingredient con una columna del archivo (una vez por archivo)."""
+        if getattr(self, 'columns', None) is not None:
+            return self.columns
+        normalized = {normalize_text(column): column for column in record}
+        columns = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            if field in self.explicit_map:
+                columns[field] = self.explicit_map[field]
+                continue
+            columns[field] = next((normalized[alias] for alias in aliases if alias in normalized), None)
+        missing = [field for field in ('name', 'calories', 'proteins', 'carbohydrates', 'fats') if not columns[field]]
+        if missing:
+            raise CommandError(f"No se encontraron columnas para: {', '.join(missing)}. Usa --map CAMPO=COLUMNA.")
+        self.columns = columns
+        return columns
+
+    def reject(self, row_number, reason, record):
+        if self.rejects_writer:
+            self.rejects_writer.writerow([row_number, reason, json.dumps(record, ensure_ascii=False, default=str)])
+        if self.options['verbosity'] >= 2:
+            self.stderr.write(f"Fila {row_number} rechazada: {reason}")
+
+    def build_ingredient(self, row_number, record):
+        if not isinstance(record, dict):
+            self.reject(row_number, "La fila no es un objeto", record)
+            return None
+        columns = self.resolve_columns(record)
+
+        name = str(record.get(columns['name']) or '').strip()
+        if not name:
+            self.reject(row_number, "Nombre vacío", record)
+            return None
+        if len(name) > MAX_NAME_LENGTH:
+            self.reject(row_number, f"Nombre con más de {MAX_NAME_LENGTH} caracteres", record)
+            return None
+
+        values = {}
+        for field in MACRO_FIELDS:
+            raw = record.get(columns[field]) if columns[field] else None
+            if raw in (None, ''):
+                if field == 'fiber':
+                    values[field] = Decimal('0')
+                    continue
+                self.reject(row_number, f"Falta el valor de '{field}'", record)
+                return None
+            try:
+                value = Decimal(str(raw).strip().replace(',', '.')).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                self.reject(row_number, f"Valor no numérico en '{field}': {raw!r}", record)
+                return None
+            if value < 0 or value > MAX_VALUES[field]:
+                self.reject(row_number, f"Valor fuera de rango en '{field}': {value}", record)
+                return None
+            values[field] = value
+
+        raw_category = record.get(columns['category']) if columns['category'] else None
+        category = self.categories.get(normalize_text(raw_category), self.options['default_category'])
+        return Ingredient(name=name, category=category, **values)
+
+    def flush(self, batch, stats):
+        """Upsert de un lote con un solo INSERT ... ON CONFLICT (name) DO UPDATE."""
+        stats['batches'] += 1
+        started = time.perf_counter()
+        ingredients = list(batch.values())
+        if not self.options['dry_run']:
+            with transaction.atomic():
+                # Todo el lote comparte una versión del catálogo (sincronización incremental)
+                version = CatalogState.next_version()
+                for ingredient in ingredients:
+                    ingredient.version = version
+                Ingredient.objects.bulk_create(
+                    ingredients,
+                    update_conflicts=True,
+                    unique_fields=['name'],
+                    update_fields=['category', *MACRO_FIELDS, 'version', 'updated_at'],
+                )
+                # bulk_create no dispara señales: recalculamos las recetas que usan estos ingredientes
+                affected = Meal.objects.filter(meal_items__ingredient__name__in=list(batch))
+                affected.refresh_totals()
+                invalidate_meals(affected)
+
+        elapsed = time.perf_counter() - started
+        if self.options['verbosity'] >= 1:
+            self.stdout.write(
+                f"Lote {stats['batches']}: {len(ingredients)} ingredientes en {elapsed:.3f}s "
+                f"({len(ingredients) / elapsed if elapsed else 0:,.0f}/s)"
+            )
+        return len(ingredients)
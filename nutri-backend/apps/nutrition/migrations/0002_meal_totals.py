@@ -0,0 +1,67 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:01
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+MACRO_FIELDS = ('calories', 'proteins', 'carbohydrates', 'fats', 'fiber')
+
+
+def backfill_meal_totals(apps, schema_editor):
+    Meal = apps.get_model('nutrition', 'Meal')
+    MealItem = apps.get_model('nutrition', 'MealItem')
+
+    totals = {}
+    for field in MACRO_FIELDS:
+        contribution = (
+            MealItem.objects.filter(meal=OuterRef('pk'))
+            .values('meal')
+            .annotate(total=Sum(
+                F('quantity_grams') * F(f'ingredient__{field}') * Value(Decimal('0.01')),  # macros por 100g
+                output_field=DecimalField(max_digits=12, decimal_places=4),
+            ))
+            .values('total')[:1]
+        )
+        totals[f'total_{field}'] = Coalesce(
+            Subquery(contribution),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=8, decimal_places=2),
+        )
+    Meal.objects.update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='total_calories',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Kcal Totales'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_carbohydrates',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Carbohidratos Totales (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_fats',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Grasas Totales (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_fiber',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Fibra Total (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_proteins',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Proteínas Totales (g)'),
+        ),
+        migrations.RunPython(backfill_meal_totals, migrations.RunPython.noop),
+    ]
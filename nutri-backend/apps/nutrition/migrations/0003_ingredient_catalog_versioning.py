@@ -0,0 +1,57 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+def seed_catalog_version(apps, schema_editor):
+    """Los ingredientes existentes quedan en la versión 1 del catálogo."""
+    CatalogState = apps.get_model('nutrition', 'CatalogState')
+    Ingredient = apps.get_model('nutrition', 'Ingredient')
+    CatalogState.objects.update_or_create(pk=1, defaults={'version': 1})
+    Ingredient.objects.update(version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0002_meal_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estado del Catálogo',
+                'verbose_name_plural': 'Estado del Catálogo',
+            },
+        ),
+        migrations.CreateModel(
+            name='IngredientTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_id', models.BigIntegerField(db_index=True)),
+                ('name', models.CharField(max_length=100)),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Ingrediente Eliminado',
+                'verbose_name_plural': 'Ingredientes Eliminados',
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(seed_catalog_version, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,41 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from apps.users.models import User
+from apps.users.tenancy import TenantQuerySet
+
+# Macros que se guardan por ingrediente y se acumulan por receta
+MACRO_FIELDS = ('calories', 'proteins', 'carbohydrates', 'fats', 'fiber')
+
+# ==============================================================================
+# VERSIÓN DEL CATÁLOGO (Secuencia para la sincronización incremental)
+# ==============================================================================
+class CatalogState(models.Model):
+    """
+    Fila única con la secuencia de cambios del catálogo de ingredientes.
+    Cada alta, edición o baja toma el siguiente número; los clientes piden
+    "cambios desde la versión N".
+    """
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Estado del Catálogo"
+        verbose_name_plural = "Estado del Catálogo"
+
+    @classmethod
+    def current_version(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def next_version(cls):
+        """Incrementa la secuencia de forma atómica (el UPDATE bloquea la fila hasta el commit)."""
+        with transaction.atomic():
+            if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+                cls.objects.get_or_create(pk=1)
+                cls.objects.filter(pk=1).update(version=F('version') + 1)
+            return cls.objects.filter(pk=1).values_list('version', flat=True).get()
+
 
 # ==============================================================================
 # INGREDIENTE (La Materia Prima)
@@ -27,12 +63,100 @@ class Ingredient(models.Model):
     # Opcional: Microminerales (podemos agregar más a futuro)
     fiber = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name="Fibra (g)")
 
+    # Sincronización: versión del catálogo en la que cambió por última vez
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return f"{self.name} ({self.calories} kcal/100g)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Macros guardados: la señal solo recalcula las recetas si alguno cambió
+        instance._persisted_macros = instance.macro_values()
+        return instance
+
+    def macro_values(self):
+        """Macros cargados como Decimal (None si alguno quedó diferido y no se puede comparar)."""
+        if any(field not in self.__dict__ for field in MACRO_FIELDS):
+            return None
+        return tuple(Decimal(str(getattr(self, field))) for field in MACRO_FIELDS)
+
+    @property
+    def macros_changed(self):
+        """¿Cambió algún macro desde la lectura o el último save? (sí, si no se sabe)."""
+        current = self.macro_values()
+        return current is None or current != getattr(self, '_persisted_macros', None)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self.version = CatalogState.next_version()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+            super().save(*args, **kwargs)
+
+
+class IngredientTombstone(models.Model):
+    """Registro de ingredientes borrados, para que los clientes los eliminen al sincronizar."""
+    ingredient_id = models.BigIntegerField(db_index=True)
+    name = models.CharField(max_length=100)
+    version = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ingrediente Eliminado"
+        verbose_name_plural = "Ingredientes Eliminados"
+
+    def __str__(self):
+        return f"{self.name} (v{self.version})"
+
 # ==============================================================================
 # RECETA / COMIDA (El Plato Final)
 # ==============================================================================
+class MealQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """
+        Recalcula los totales guardados de las recetas del queryset en un solo UPDATE.
+        Cada total es un SUM(gramos * macro / 100) sobre sus MealItem (0 si no tiene items).
+        """
+        totals = {}
+        for field in MACRO_FIELDS:
+            contribution = (
+                MealItem.objects.filter(meal=OuterRef('pk'))
+                .values('meal')
+                .annotate(total=Sum(
+                    F('quantity_grams') * F(f'ingredient__{field}') * Value(Decimal('0.01')),  # macros por 100g
+                    output_field=DecimalField(max_digits=12, decimal_places=4),
+                ))
+                .values('total')[:1]
+            )
+            totals[f'total_{field}'] = Coalesce(
+                Subquery(contribution),
+                Value(Decimal('0')),
+                output_field=DecimalField(max_digits=8, decimal_places=2),
+            )
+        return self.update(**totals)
+
+    def available_to(self, tenant):
+        """
+        Recetas que puede usar el tenant: las del sistema (sin autor) y las creadas en su
+        clínica (o por él mismo si no tiene clínica). El Super Admin ve todas.
+        """
+        if tenant.role == 'ADMIN':
+            return self
+        if tenant.organization_id:
+            return self.filter(models.Q(created_by__isnull=True) | models.Q(created_by__organization_id=tenant.organization_id))
+        return self.filter(models.Q(created_by__isnull=True) | models.Q(created_by_id=tenant.user.pk))
+
+    def with_items(self):
+        """Precarga los items con su ingrediente (1 query extra, sin N+1)."""
+        return self.prefetch_related(
+            models.Prefetch('meal_items', queryset=MealItem.objects.select_related('ingredient'))
+        )
+
+
 class Meal(models.Model):
     # El creador (Nutricionista). Si es null, es una "Receta del Sistema" (pública)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_meals')
@@ -45,16 +169,25 @@ class Meal(models.Model):
     # Usamos 'through' para especificar cantidades exactas
     ingredients = models.ManyToManyField(Ingredient, through='MealItem')
     
+    # Totales desnormalizados: se recalculan al agregar/editar/borrar un MealItem
+    # o al editar los macros de un Ingrediente (ver signals.py)
+    total_calories = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name="Kcal Totales")
+    total_proteins = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name="Proteínas Totales (g)")
+    total_carbohydrates = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name="Carbohidratos Totales (g)")
+    total_fats = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name="Grasas Totales (g)")
+    total_fiber = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name="Fibra Total (g)")
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = MealQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
-    @property
-    def total_calories(self):
-        # Lógica calculada: Suma de las calorías de todos sus ingredientes
-        total = sum(item.calories_contribution for item in self.meal_items.all())
-        return round(total, 2)
+    def refresh_totals(self):
+        """Recalcula y recarga los totales guardados de esta receta."""
+        Meal.objects.filter(pk=self.pk).refresh_totals()
+        self.refresh_from_db(fields=[f'total_{field}' for field in MACRO_FIELDS])
 
 # ==============================================================================
 # ITEM DE COMIDA (La Cantidad Exacta: Ej. "150g de Pollo")
@@ -80,6 +213,21 @@ class MealItem(models.Model):
 # ==============================================================================
 # PLAN NUTRICIONAL (El Calendario para el Paciente)
 # ==============================================================================
+class DietPlanQuerySet(TenantQuerySet):
+    # Los planes son de la clínica del profesional que los creó
+    tenant_field = 'professional__organization'
+
+    def with_graph(self):
+        """
+        Precarga el plan completo (asignaciones -> receta -> items -> ingrediente)
+        en 2 queries extra, sin importar cuántos planes o asignaciones haya.
+        """
+        return self.prefetch_related(
+            models.Prefetch('allocations', queryset=PlanAllocation.objects.select_related('meal')),
+            models.Prefetch('allocations__meal__meal_items', queryset=MealItem.objects.select_related('ingredient')),
+        )
+
+
 class DietPlan(models.Model):
     # ¿A quién pertenece este plan? (Paciente)
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='diet_plans', limit_choices_to={'role': 'PACIENTE'})
@@ -95,9 +243,62 @@ class DietPlan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DietPlanQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.patient.email}"
 
+    def macro_summary(self):
+        """
+        Totales del plan por día y por momento del día, calculados en la BD con una
+        sola query (PlanAllocation -> MealItem -> Ingredient, SUM(gramos * macro / 100)).
+        """
+        zero = Value(Decimal('0'))
+        sums = {
+            field: Coalesce(
+                Sum(
+                    F('meal__meal_items__quantity_grams') * F(f'meal__meal_items__ingredient__{field}') * Value(Decimal('0.01')),
+                    output_field=DecimalField(max_digits=12, decimal_places=4),
+                ),
+                zero,
+                output_field=DecimalField(max_digits=12, decimal_places=4),
+            )
+            for field in MACRO_FIELDS
+        }
+        slots = (
+            self.allocations.values('day_of_week', 'meal_time')
+            .annotate(**sums)
+            .order_by('day_of_week', 'meal_time')
+        )
+
+        # Consolidamos las filas (máx. 7 x 5) en días, momentos y total semanal
+        days, meal_times = {}, {}
+        week = dict.fromkeys(MACRO_FIELDS, Decimal('0'))
+        for slot in slots:
+            day = days.setdefault(slot['day_of_week'], dict.fromkeys(MACRO_FIELDS, Decimal('0')))
+            meal_time = meal_times.setdefault(slot['meal_time'], dict.fromkeys(MACRO_FIELDS, Decimal('0')))
+            for field in MACRO_FIELDS:
+                day[field] += slot[field]
+                meal_time[field] += slot[field]
+                week[field] += slot[field]
+
+        def as_strings(macros):
+            return {field: str(Decimal(value).quantize(Decimal('0.01'))) for field, value in macros.items()}
+
+        day_labels = dict(PlanAllocation.DAYS_OF_WEEK)
+        return {
+            'plan': self.pk,
+            'week': as_strings(week),
+            'days': [
+                {'day_of_week': day, 'label': day_labels[day], **as_strings(macros)}
+                for day, macros in sorted(days.items())
+            ],
+            'meal_times': [
+                {'meal_time': code, 'label': label, **as_strings(meal_times[code])}
+                for code, label in PlanAllocation.MEAL_TIMES if code in meal_times
+            ],
+        }
+
 # ==============================================================================
 # ASIGNACIÓN DE COMIDAS (El Horario)
 # ==============================================================================
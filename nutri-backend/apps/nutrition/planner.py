@@ -0,0 +1,217 @@
+"""
+Generador automático de planes semanales.
+
+Dado un objetivo diario de kcal y macros y un catálogo de recetas permitidas,
+elige una receta para cada uno de los 35 espacios (7 días x 5 momentos) de modo
+que los totales de cada día se acerquen al objetivo.
+
+No hay un solver ILP en las dependencias, así que se usa una heurística:
+  1. Greedy: cada espacio toma la receta más cercana a su porción del objetivo.
+  2. Búsqueda local: se cambia la receta de un espacio por la que más reduce el
+     error del día, hasta que no haya mejoras; luego se perturba la solución y se
+     repite mientras quede tiempo (presupuesto configurable). Se guarda la mejor.
+
+Los totales de cada receta se leen de las columnas total_* de Meal (una query)
+y todo el cálculo se hace con NumPy. El plan se escribe con un solo bulk_create.
+"""
+import time
+import numpy as np
+from django.db import transaction
+from .caching import invalidate_plans
+from .engine import DAYS, MEAL_TIMES
+from .models import MACRO_FIELDS, DietPlan, Meal, PlanAllocation
+
+# Porción del objetivo diario que se espera en cada momento del día
+MEAL_TIME_SHARES = {
+    'BREAKFAST': 0.25,
+    'MORNING_SNACK': 0.10,
+    'LUNCH': 0.35,
+    'AFTERNOON_SNACK': 0.10,
+    'DINNER': 0.20,
+}
+SLOT_WEIGHT = 0.25  # Peso del error por espacio frente al error del día completo
+CANDIDATES_PER_SLOT = 256  # Recetas consideradas en cada momento del día
+MEAL_FIELDS = tuple(f'total_{field}' for field in MACRO_FIELDS)
+
+
+class PlanSolution:
+    """Resultado del optimizador: qué receta va en cada (día, momento)."""
+
+    def __init__(self, meal_ids, assignment, day_totals, targets, score, iterations, elapsed):
+        self.meal_ids = meal_ids
+        self.assignment = assignment  # matriz (7, 5) de posiciones en meal_ids
+        self.day_totals = day_totals
+        self.targets = targets
+        self.score = score
+        self.iterations = iterations
+        self.elapsed = elapsed
+
+    def allocations(self):
+        """Lista de (día, momento, meal_id) en el orden del plan."""
+        return [
+            (day, meal_time, int(self.meal_ids[self.assignment[d, s]]))
+            for d, day in enumerate(DAYS)
+            for s, meal_time in enumerate(MEAL_TIMES)
+        ]
+
+    def as_dict(self):
+        def macros(row):
+            return {field: round(float(value), 2) for field, value in zip(MACRO_FIELDS, row)}
+
+        return {
+            'score': round(self.score, 6),
+            'iterations': self.iterations,
+            'seconds': round(self.elapsed, 3),
+            'target': macros(self.targets),
+            'days': [{'day_of_week': day, **macros(self.day_totals[d])} for d, day in enumerate(DAYS)],
+        }
+
+
+def optimize_week(meal_ids, macros, targets, time_budget=0.5, max_repeats=2, seed=None):
+    """
+    `macros`: matriz (n, 5) con los totales de cada receta en el orden de MACRO_FIELDS.
+    `targets`: objetivo diario (5 valores; 0 = sin objetivo para ese macro).
+    Devuelve un PlanSolution. Error relativo: sum(((total - objetivo) / objetivo)^2).
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    meal_ids = np.asarray(meal_ids)
+    macros = np.asarray(macros, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    n_days, n_slots = len(DAYS), len(MEAL_TIMES)
+    if not len(meal_ids):
+        raise ValueError("No hay recetas disponibles para generar el plan.")
+    if len(meal_ids) * max_repeats < n_days * n_slots:
+        max_repeats = -(-n_days * n_slots // len(meal_ids))  # Catálogo chico: se permiten más repeticiones
+
+    weights = np.divide(1.0, targets ** 2, out=np.zeros_like(targets), where=targets > 0)
+    shares = np.array([MEAL_TIME_SHARES[code] for code in MEAL_TIMES])
+
+    # Candidatos por momento: las recetas más cercanas a la porción del objetivo
+    candidates, slot_errors = [], []
+    for s in range(n_slots):
+        errors = (((macros - targets * shares[s]) ** 2) * weights).sum(axis=1) * SLOT_WEIGHT
+        size = min(CANDIDATES_PER_SLOT, len(meal_ids))
+        best = np.argpartition(errors, size - 1)[:size]
+        best = best[np.argsort(errors[best])]
+        candidates.append(best)
+        slot_errors.append(errors[best])
+
+    def day_error(totals):
+        return (((totals - targets) ** 2) * weights).sum(axis=-1)
+
+    # 1. Greedy: mejor candidato disponible por espacio (rank = posición en candidates[s])
+    counts = np.zeros(len(meal_ids), dtype=np.int64)
+    ranks = np.zeros((n_days, n_slots), dtype=np.int64)
+    for d in range(n_days):
+        for s in range(n_slots):
+            available = np.flatnonzero(counts[candidates[s]] < max_repeats)
+            rank = available[0] if len(available) else 0
+            ranks[d, s] = rank
+            counts[candidates[s][rank]] += 1
+
+    def meal_at(d, s):
+        return candidates[s][ranks[d, s]]
+
+    totals = np.array([macros[[meal_at(d, s) for s in range(n_slots)]].sum(axis=0) for d in range(n_days)])
+
+    def score():
+        slots = sum(slot_errors[s][ranks[d, s]] for d in range(n_days) for s in range(n_slots))
+        return float(day_error(totals).sum() + slots)
+
+    current = score()
+    best_score, best_ranks = current, ranks.copy()
+    iterations = 0
+    slots_order = [(d, s) for d in range(n_days) for s in range(n_slots)]
+
+    # 2. Búsqueda local con perturbaciones mientras quede presupuesto
+    while time.perf_counter() - started < time_budget:
+        improved = False
+        for index in rng.permutation(len(slots_order)):
+            d, s = slots_order[index]
+            iterations += 1
+            old = meal_at(d, s)
+            options = candidates[s]
+            new_totals = totals[d] - macros[old] + macros[options]
+            cost = day_error(new_totals) + slot_errors[s]
+            cost[counts[options] >= max_repeats] = np.inf
+            cost[ranks[d, s]] = day_error(totals[d]) + slot_errors[s][ranks[d, s]]
+            rank = int(np.argmin(cost))
+            if cost[rank] < cost[ranks[d, s]] - 1e-12:
+                counts[old] -= 1
+                counts[options[rank]] += 1
+                ranks[d, s] = rank
+                totals[d] = new_totals[rank]
+                improved = True
+
+        if improved:
+            continue
+        current = score()
+        if current < best_score - 1e-12:
+            best_score, best_ranks = current, ranks.copy()
+        if best_score == 0:
+            break
+        # Óptimo local: se parte de la mejor solución y se cambian algunos espacios al azar
+        ranks[:] = best_ranks
+        counts = _counts_for(ranks, candidates, len(meal_ids))
+        for index in rng.choice(len(slots_order), size=3, replace=False):
+            d, s = slots_order[index]
+            available = np.flatnonzero(counts[candidates[s]] < max_repeats)
+            if len(available):
+                counts[meal_at(d, s)] -= 1
+                ranks[d, s] = rng.choice(available)
+                counts[meal_at(d, s)] += 1
+        totals = np.array([macros[[meal_at(d, s) for s in range(n_slots)]].sum(axis=0) for d in range(n_days)])
+
+    current = score()
+    if current < best_score:
+        best_score, best_ranks = current, ranks.copy()
+
+    assignment = np.array([[candidates[s][best_ranks[d, s]] for s in range(n_slots)] for d in range(n_days)])
+    day_totals = macros[assignment].sum(axis=1)
+    return PlanSolution(meal_ids, assignment, day_totals, targets, best_score, iterations, time.perf_counter() - started)
+
+
+def _counts_for(ranks, candidates, size):
+    """Cuántas veces aparece cada receta en la asignación `ranks`."""
+    chosen = [candidates[s][ranks[d, s]] for d in range(ranks.shape[0]) for s in range(ranks.shape[1])]
+    return np.bincount(chosen, minlength=size)
+
+
+def load_meal_catalog(meal_ids=None, meals=None):
+    """
+    Devuelve (ids, macros) de las recetas permitidas con sus totales guardados (1 query).
+    `meals` es el queryset de recetas disponibles (p.ej. Meal.objects.available_to(tenant)).
+    """
+    queryset = meals if meals is not None else Meal.objects.all()
+    if meal_ids is not None:
+        queryset = queryset.filter(pk__in=meal_ids)
+    rows = list(queryset.order_by('pk').values_list('pk', *MEAL_FIELDS))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    macros = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(MACRO_FIELDS))
+    return ids, macros
+
+
+def generate_plan(patient, professional, targets, name, description='', meal_ids=None, meals=None,
+                  time_budget=0.5, max_repeats=2, seed=None, commit=True):
+    """
+    Genera y (si commit=True) guarda un DietPlan con sus 35 asignaciones.
+    `targets`: dict con objetivos diarios por macro (los que falten no se optimizan).
+    `meals`: queryset de recetas disponibles; `meal_ids` lo acota aún más.
+    Devuelve (plan o None, PlanSolution).
+    """
+    ids, macros = load_meal_catalog(meal_ids, meals)
+    target_vector = [float(targets.get(field) or 0) for field in MACRO_FIELDS]
+    solution = optimize_week(ids, macros, target_vector, time_budget=time_budget, max_repeats=max_repeats, seed=seed)
+    if not commit:
+        return None, solution
+
+    with transaction.atomic():
+        plan = DietPlan.objects.create(patient=patient, professional=professional, name=name, description=description)
+        PlanAllocation.objects.bulk_create([
+            PlanAllocation(plan=plan, day_of_week=day, meal_time=meal_time, meal_id=meal_id)
+            for day, meal_time, meal_id in solution.allocations()
+        ])
+        # bulk_create no dispara señales: invalidamos el plan actual del paciente a mano
+        invalidate_plans([plan.pk])
+    return plan, solution
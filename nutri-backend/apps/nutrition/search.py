@@ -0,0 +1,151 @@
+"""
+Índice de búsqueda en memoria para el catálogo de ingredientes.
+
+Cada proceso mantiene un índice de trigramas + palabras ordenadas sobre los nombres
+normalizados (sin tildes, minúsculas). Soporta:
+- Prefijo: "pol" -> "Pollo", "Pechuga de pollo"
+- Errores de tipeo: "poyo" -> "Pollo" (similitud de trigramas, como word_similarity de pg_trgm)
+- Filtro por categoría y ranking (exacto > prefijo > prefijo de palabra > similitud)
+
+El índice se reconstruye solo cuando cambia la versión del catálogo (ver signals.py).
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from apps.common.text import normalize_text
+from .models import Ingredient
+
+CATALOG_VERSION_KEY = 'nutrition:ingredient-catalog-version'
+MIN_SIMILARITY = 0.4
+
+# Niveles de ranking (se suman a la similitud, que va de 0 a 1)
+EXACT, PREFIX, WORD_PREFIX, FUZZY = 3, 2, 1, 0
+
+
+def trigrams(text):
+    """Trigramas por palabra con relleno, al estilo pg_trgm ("pollo" -> "  p", " po", ...)."""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class IngredientIndex:
+    def __init__(self, rows):
+        """`rows`: iterable de (id, name, category)."""
+        rows = list(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names = [normalize_text(row[1]) for row in rows]
+        self.categories = np.array([row[2] for row in rows], dtype=object)
+        self.name_lengths = np.array([len(name) for name in self.names], dtype=np.int32)
+
+        postings = defaultdict(list)
+        words = []
+        for position, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings[gram].append(position)
+            words.extend((word, position) for word in set(name.split()))
+
+        self.postings = {gram: np.array(items, dtype=np.int32) for gram, items in postings.items()}
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_positions = np.array([position for _, position in words], dtype=np.int32)
+        by_name = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self.sorted_names = [self.names[position] for position in by_name]
+        self.name_positions = np.array(by_name, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _prefix_range(sorted_values, prefix):
+        return bisect.bisect_left(sorted_values, prefix), bisect.bisect_left(sorted_values, prefix + '\uffff')
+
+    def _word_prefix_matches(self, prefix):
+        start, end = self._prefix_range(self.words, prefix)
+        return self.word_positions[start:end]
+
+    def _word_matches(self, word):
+        start, end = bisect.bisect_left(self.words, word), bisect.bisect_right(self.words, word)
+        return self.word_positions[start:end]
+
+    def search(self, query, category=None):
+        """
+        Devuelve la lista de ids ordenada por relevancia (todas las coincidencias).
+        """
+        query = normalize_text(query)
+        if not query or not len(self):
+            return []
+
+        # 1. Similitud de trigramas vectorizada: fracción de los trigramas de la consulta
+        #    presentes en cada nombre (bincount sobre las listas invertidas)
+        query_grams = trigrams(query)
+        lists = [self.postings[gram] for gram in query_grams if gram in self.postings]
+        shared = (
+            np.bincount(np.concatenate(lists), minlength=len(self)).astype(np.float64)
+            if lists else np.zeros(len(self))
+        )
+        similarity = shared / len(query_grams)
+
+        # 2. Niveles por prefijo (la última palabra puede estar incompleta mientras se tipea)
+        tier = np.full(len(self), -1, dtype=np.int8)
+        tier[similarity >= MIN_SIMILARITY] = FUZZY
+        *complete_words, last_word = query.split()
+        word_hits = self._word_prefix_matches(last_word)
+        for word in complete_words:
+            # Multi-palabra: las palabras ya completas tienen que aparecer tal cual
+            word_hits = np.intersect1d(word_hits, self._word_matches(word))
+        tier[word_hits] = np.maximum(tier[word_hits], WORD_PREFIX)
+
+        start, end = self._prefix_range(self.sorted_names, query)
+        tier[self.name_positions[start:end]] = PREFIX
+        if start < end and self.sorted_names[start] == query:
+            tier[self.name_positions[start]] = EXACT
+
+        if category:
+            tier[self.categories != category] = -1
+
+        matches = np.flatnonzero(tier >= 0)
+        score = tier[matches] + similarity[matches]
+        # Orden: score desc, luego nombres más cortos (más específicos)
+        order = np.lexsort((self.name_lengths[matches], -score))
+        return self.ids[matches[order]].tolist()
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Marca el catálogo como modificado: cada proceso reconstruirá su índice.
+    Al confirmar la transacción: antes, otro proceso reconstruiría con las filas viejas.
+    """
+    transaction.on_commit(lambda: cache.set(CATALOG_VERSION_KEY, time.time_ns(), None))
+
+
+def get_ingredient_index():
+    """Índice del proceso, reconstruido (1 query) solo si el catálogo cambió."""
+    global _index, _index_version
+    version = get_catalog_version()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                rows = Ingredient.objects.values_list('pk', 'name', 'category').iterator(chunk_size=5000)
+                _index = IngredientIndex(rows)
+                _index_version = version
+    return _index
@@ -1,5 +1,7 @@
+from decimal import Decimal
 from rest_framework import serializers
-from .models import Ingredient, Meal, MealItem, DietPlan, PlanAllocation
+from apps.users.models import User
+from .models import MACRO_FIELDS, Ingredient, Meal, MealItem, DietPlan, PlanAllocation
 
 # --- 1. INGREDIENTE (Simple) ---
 class IngredientSerializer(serializers.ModelSerializer):
@@ -19,11 +21,15 @@ class MealItemSerializer(serializers.ModelSerializer):
 class MealSerializer(serializers.ModelSerializer):
     # Incluimos los items dentro de la receta
     meal_items = MealItemSerializer(many=True, read_only=True)
-    total_calories = serializers.ReadOnlyField() # Campo calculado
 
     class Meta:
         model = Meal
-        fields = ['id', 'name', 'description', 'image', 'created_by', 'total_calories', 'meal_items', 'created_at']
+        fields = [
+            'id', 'name', 'description', 'image', 'created_by',
+            # Totales guardados en la receta (no recorren los items)
+            'total_calories', 'total_proteins', 'total_carbohydrates', 'total_fats', 'total_fiber',
+            'meal_items', 'created_at'
+        ]
 
 # --- 3. PLAN (El Calendario) ---
 class PlanAllocationSerializer(serializers.ModelSerializer):
@@ -39,4 +45,65 @@ class DietPlanSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DietPlan
-        fields = ['id', 'name', 'description', 'patient', 'professional', 'is_active', 'allocations', 'created_at']
\ No newline at end of file
+        fields = ['id', 'name', 'description', 'patient', 'professional', 'is_active', 'allocations', 'created_at']
+
+# --- 4. PLAN ACTUAL (Documento desnormalizado para la app del paciente) ---
+class CurrentPlanSerializer(DietPlanSerializer):
+    # Totales por día y semanales a partir de los totales guardados en cada receta
+    totals = serializers.SerializerMethodField()
+
+    class Meta(DietPlanSerializer.Meta):
+        fields = DietPlanSerializer.Meta.fields + ['updated_at', 'totals']
+
+    def get_totals(self, obj):
+        days = {}
+        week = dict.fromkeys(MACRO_FIELDS, Decimal('0'))
+        for allocation in obj.allocations.all():
+            day = days.setdefault(allocation.day_of_week, dict.fromkeys(MACRO_FIELDS, Decimal('0')))
+            for field in MACRO_FIELDS:
+                value = getattr(allocation.meal, f'total_{field}')
+                day[field] += value
+                week[field] += value
+        return {
+            'week': {field: str(value) for field, value in week.items()},
+            'days': {day: {field: str(value) for field, value in macros.items()} for day, macros in sorted(days.items())},
+        }
+
+# --- 5. GENERACIÓN AUTOMÁTICA DE PLANES (Entrada del optimizador) ---
+def plan_patients_for(tenant):
+    """
+    Pacientes para los que el tenant puede armar planes: los vinculados a un expediente
+    de su clínica (o, sin clínica, los que ya atiende). El Super Admin, todos.
+    """
+    patients = User.objects.filter(role='PACIENTE')
+    if tenant.role == 'ADMIN':
+        return patients
+    if tenant.organization_id:
+        return patients.filter(clinical_records__organization_id=tenant.organization_id).distinct()
+    return patients.filter(diet_plans__professional_id=tenant.user.pk).distinct()
+
+class PlanGenerationSerializer(serializers.Serializer):
+    # Los querysets se acotan al tenant del request en __init__
+    patient = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='PACIENTE'))
+    name = serializers.CharField(max_length=150)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+
+    # Objetivos diarios (los macros omitidos no se optimizan)
+    calories = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=Decimal('1'))
+    proteins = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), required=False)
+    carbohydrates = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), required=False)
+    fats = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), required=False)
+    fiber = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'), required=False)
+
+    # Catálogo permitido para el paciente (por defecto, todas las recetas)
+    meals = serializers.PrimaryKeyRelatedField(queryset=Meal.objects.all(), many=True, required=False)
+    max_repeats = serializers.IntegerField(min_value=1, max_value=7, default=2)
+    time_budget_ms = serializers.IntegerField(min_value=50, max_value=5000, default=500)
+    dry_run = serializers.BooleanField(default=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None:
+            self.fields['patient'].queryset = plan_patients_for(request.tenant)
+            self.fields['meals'].child_relation.queryset = Meal.objects.available_to(request.tenant)
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .caching import bump_meal_catalog_version, bump_plan_versions, invalidate_meals, invalidate_patients, invalidate_plans
+from .models import MACRO_FIELDS, CatalogState, Ingredient, IngredientTombstone, Meal, MealItem, DietPlan, PlanAllocation
+from .search import bump_catalog_version
+
+@receiver(post_save, sender=MealItem)
+@receiver(post_delete, sender=MealItem)
+def refresh_meal_totals(sender, instance, **kwargs):
+    """
+    Mantiene los totales de la receta al agregar, editar o borrar uno de sus ingredientes.
+    """
+    Meal.objects.filter(pk=instance.meal_id).refresh_totals()
+    invalidate_meals([instance.meal_id])
+
+@receiver(post_save, sender=Ingredient)
+def propagate_ingredient_macros(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Si cambian los macros de un ingrediente, recalcula todas las recetas que lo usan.
+    Un save completo que no toca los macros (p.ej. renombrarlo en el admin) no recalcula nada.
+    """
+    if created:
+        instance._persisted_macros = instance.macro_values()
+        return  # Un ingrediente nuevo todavía no está en ninguna receta
+    if update_fields is not None and not set(update_fields) & set(MACRO_FIELDS):
+        return
+    if not instance.macros_changed:
+        return
+
+    affected = Meal.objects.filter(meal_items__ingredient=instance)
+    affected.refresh_totals()
+    invalidate_meals(affected)
+    instance._persisted_macros = instance.macro_values()
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, instance, **kwargs):
+    """
+    Cualquier cambio en el catálogo obliga a reconstruir el índice de búsqueda.
+    """
+    bump_catalog_version()
+
+@receiver(post_delete, sender=Ingredient)
+def create_ingredient_tombstone(sender, instance, **kwargs):
+    """
+    Deja constancia del borrado para que la sincronización incremental lo propague.
+    """
+    IngredientTombstone.objects.create(
+        ingredient_id=instance.pk,
+        name=instance.name,
+        version=CatalogState.next_version(),
+    )
+
+# ------------------------------------------------------------------------------
+# Invalidación del "plan actual" y de los resúmenes cacheados (ver caching.py)
+# ------------------------------------------------------------------------------
+@receiver(post_save, sender=DietPlan)
+@receiver(post_delete, sender=DietPlan)
+def invalidate_diet_plan(sender, instance, **kwargs):
+    bump_plan_versions([instance.pk])
+    invalidate_patients([instance.patient_id])
+
+@receiver(post_save, sender=PlanAllocation)
+@receiver(post_delete, sender=PlanAllocation)
+def invalidate_plan_allocation(sender, instance, **kwargs):
+    invalidate_plans([instance.plan_id])
+
+@receiver(post_save, sender=Meal)
+def invalidate_meal(sender, instance, created, **kwargs):
+    if created:
+        bump_meal_catalog_version()
+    else:
+        invalidate_meals([instance.pk])
+
+@receiver(post_delete, sender=Meal)
+def invalidate_deleted_meal(sender, instance, **kwargs):
+    bump_meal_catalog_version()
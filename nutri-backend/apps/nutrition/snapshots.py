@@ -0,0 +1,113 @@
+"""
+Snapshot completo del catálogo de ingredientes para clientes móviles.
+
+Se genera una sola vez por versión del catálogo como JSON comprimido con gzip
+(catalog/ingredients-v<N>.json.gz) y se sirve tal cual. Los clientes que ya
+tienen un snapshot solo piden /ingredients/changes/?since=<N>.
+
+Dos requests pueden pedir a la vez una versión que aún no existe: un lock por
+versión en la caché deja construir a uno solo, y si igual hubo dos builds el
+segundo descarta su copia (el storage le dio otro nombre) en vez de borrar la del
+primero. Mientras tanto los demás no esperan: sirven la versión anterior (el
+cliente se pone al día con /changes/) o, si no hay ninguna, reciben un 503 con
+Retry-After. La limpieza solo borra versiones anteriores y conserva la inmediata
+anterior, que es la que se sirve durante el build.
+"""
+import gzip
+import json
+import re
+import tempfile
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import CatalogState, Ingredient
+from .serializers import IngredientSerializer
+
+SNAPSHOT_DIR = 'catalog'
+SNAPSHOT_PATTERN = re.compile(r'^ingredients-v(\d+)')
+BUILD_LOCK_KEY = 'nutrition:catalog-snapshot-lock:{version}'
+BUILD_LOCK_TIMEOUT = 120  # Segundos; si el que construye muere, el lock vence solo
+BUILD_RETRY_AFTER = 5  # Segundos sugeridos al cliente si no hay ninguna versión para servir
+
+
+def snapshot_name(version):
+    return f'{SNAPSHOT_DIR}/ingredients-v{version}.json.gz'
+
+
+def build_snapshot(version):
+    """Escribe el snapshot en streaming (memoria constante) y borra los de versiones anteriores."""
+    name = snapshot_name(version)
+    fields = IngredientSerializer.Meta.fields
+    if fields == '__all__':
+        fields = [field.attname for field in Ingredient._meta.concrete_fields]
+
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb') as archive:
+            archive.write(b'{"version": %d, "ingredients": [' % version)
+            rows = Ingredient.objects.order_by('pk').values(*fields).iterator(chunk_size=2000)
+            for position, row in enumerate(rows):
+                archive.write((b',' if position else b'') + json.dumps(row, cls=DjangoJSONEncoder).encode())
+            archive.write(b']}')
+        tmp.seek(0)
+        saved_name = default_storage.save(name, File(tmp))
+
+    if saved_name != name:
+        # Otro build de la misma versión guardó primero: el suyo es el que se sirve
+        default_storage.delete(saved_name)
+    remove_old_snapshots(version)
+    return name
+
+
+def remove_old_snapshots(version):
+    """Borra los snapshots de versiones anteriores salvo el más reciente de ellos."""
+    if not default_storage.exists(SNAPSHOT_DIR):
+        return
+    _, files = default_storage.listdir(SNAPSHOT_DIR)
+    older = []
+    for filename in files:
+        match = SNAPSHOT_PATTERN.match(filename)
+        if match and int(match.group(1)) < version:
+            older.append((int(match.group(1)), filename))
+    previous = max((file_version for file_version, _ in older), default=None)
+    for file_version, filename in older:
+        if file_version != previous:
+            default_storage.delete(f'{SNAPSHOT_DIR}/{filename}')
+
+
+def previous_snapshot(version):
+    """(versión, ruta) del snapshot anterior más reciente que sigue en el storage, o None."""
+    if not default_storage.exists(SNAPSHOT_DIR):
+        return None
+    _, files = default_storage.listdir(SNAPSHOT_DIR)
+    versions = []
+    for filename in files:
+        match = SNAPSHOT_PATTERN.match(filename)
+        # Las copias con sufijo de un build duplicado no cuentan: se están borrando
+        if match and int(match.group(1)) < version and f'{SNAPSHOT_DIR}/{filename}' == snapshot_name(int(match.group(1))):
+            versions.append(int(match.group(1)))
+    if not versions:
+        return None
+    return max(versions), snapshot_name(max(versions))
+
+
+def get_catalog_snapshot():
+    """
+    Devuelve (versión, ruta) del snapshot vigente; lo genera solo si el catálogo cambió.
+    Si otro request lo está generando devuelve el anterior, o None si no queda ninguno.
+    """
+    version = CatalogState.current_version()
+    name = snapshot_name(version)
+    if default_storage.exists(name):
+        return version, name
+
+    lock = BUILD_LOCK_KEY.format(version=version)
+    if not cache.add(lock, 1, BUILD_LOCK_TIMEOUT):
+        # Otro request lo está construyendo: no bloqueamos al worker esperándolo
+        return previous_snapshot(version)
+    try:
+        if not default_storage.exists(name):
+            build_snapshot(version)
+    finally:
+        cache.delete(lock)
+    return version, name
@@ -0,0 +1,198 @@
+"""
+Motor de sustituciones por cercanía de macros.
+
+"Algo parecido a la pechuga de pollo": cada ingrediente (macros por 100g) y cada
+receta (totales guardados) es un punto en R^5 = (kcal, proteínas, carbohidratos,
+grasas, fibra), escalado por la desviación estándar de cada eje. Un KD-tree sobre
+NumPy responde los k vecinos más cercanos sin recorrer toda la tabla.
+
+El índice de ingredientes se actualiza de forma incremental con la secuencia del
+catálogo (CatalogState): los cambios se guardan en un pequeño buffer que se busca
+por fuerza bruta y se reconstruye el árbol recién cuando el buffer crece.
+"""
+import threading
+import numpy as np
+from .caching import get_meal_catalog_version
+from .models import MACRO_FIELDS, CatalogState, Ingredient, IngredientTombstone, Meal
+
+LEAF_SIZE = 16
+MEAL_FIELDS = tuple(f'total_{field}' for field in MACRO_FIELDS)
+
+
+class KDTree:
+    """KD-tree estático sobre una matriz (n, d); guarda los nodos en arreglos planos."""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        self.start, self.end, self.dim, self.value, self.left, self.right = [], [], [], [], [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def _build(self, start, end):
+        node = len(self.start)
+        for column in (self.start, self.end, self.dim, self.value, self.left, self.right):
+            column.append(-1)
+        self.start[node], self.end[node] = start, end
+        if end - start <= self.leaf_size:
+            return node
+
+        indices = self.order[start:end]
+        points = self.points[indices]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        mid = (start + end) // 2
+        partition = np.argpartition(points[:, dim], mid - start)
+        self.order[start:end] = indices[partition]
+
+        self.dim[node] = dim
+        self.value[node] = self.points[self.order[mid], dim]
+        self.left[node] = self._build(start, mid)
+        self.right[node] = self._build(mid, end)
+        return node
+
+    def query(self, point, k):
+        """Devuelve (distancias², índices) de los k puntos más cercanos, ordenados."""
+        if not len(self.points) or k <= 0:
+            return np.array([]), np.array([], dtype=np.int64)
+        k = min(k, len(self.points))
+        best_dist = np.full(k, np.inf)
+        best_idx = np.full(k, -1, dtype=np.int64)
+
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_dist.max():
+                continue
+            if self.dim[node] < 0:
+                indices = self.order[self.start[node]:self.end[node]]
+                dist = ((self.points[indices] - point) ** 2).sum(axis=1)
+                all_dist = np.concatenate([best_dist, dist])
+                all_idx = np.concatenate([best_idx, indices])
+                keep = np.argpartition(all_dist, k - 1)[:k]
+                best_dist, best_idx = all_dist[keep], all_idx[keep]
+                continue
+            diff = point[self.dim[node]] - self.value[node]
+            near, far = (self.left[node], self.right[node]) if diff < 0 else (self.right[node], self.left[node])
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+
+        order = np.argsort(best_dist)
+        found = best_idx[order] >= 0
+        return best_dist[order][found], best_idx[order][found]
+
+
+class SubstitutionIndex:
+    """
+    Índice de vecinos por macros, global y por categoría.
+    `rows`: lista de (id, [5 macros], categoría o None).
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        vectors = np.array([row[1] for row in rows], dtype=np.float64).reshape(len(rows), len(MACRO_FIELDS))
+        self.categories = np.array([row[2] for row in rows], dtype=object)
+
+        scale = vectors.std(axis=0) if len(rows) else np.ones(len(MACRO_FIELDS))
+        scale[scale == 0] = 1
+        self.scale = scale
+        self.vectors = vectors / scale
+        self.positions = {int(pk): position for position, pk in enumerate(self.ids)}
+
+        # Un árbol global y uno por categoría: filtrar por categoría no recorre los demás puntos
+        self.trees = {None: (KDTree(self.vectors), np.arange(len(rows)))}
+        for category in set(self.categories) - {None}:
+            positions = np.flatnonzero(self.categories == category)
+            self.trees[category] = (KDTree(self.vectors[positions]), positions)
+
+        # Buffer incremental: puntos nuevos/editados y puntos del árbol que ya no valen
+        self.extra = {}
+        self.removed = set()
+
+    @property
+    def pending(self):
+        return len(self.extra) + len(self.removed)
+
+    def update(self, rows, deleted_ids=()):
+        for pk, macros, category in rows:
+            if pk in self.positions:
+                self.removed.add(pk)
+            self.extra[pk] = (np.asarray(macros, dtype=np.float64) / self.scale, category)
+        for pk in deleted_ids:
+            if pk in self.positions:
+                self.removed.add(pk)
+            self.extra.pop(pk, None)
+
+    def vector_of(self, pk):
+        if pk in self.extra:
+            return self.extra[pk][0]
+        if pk in self.positions and pk not in self.removed:
+            return self.vectors[self.positions[pk]]
+        return None
+
+    def nearest(self, vector, k=5, category=None, exclude=()):
+        """Devuelve [(id, distancia)] de los k más cercanos a `vector` (ya escalado)."""
+        skip = self.removed | set(exclude)
+        candidates = []
+
+        tree, positions = self.trees.get(category, (None, None))
+        if tree is not None:
+            dist, found = tree.query(vector, k + len(skip))
+            for distance, position in zip(dist, found):
+                pk = int(self.ids[positions[position]])
+                if pk not in skip:
+                    candidates.append((float(distance), pk))
+
+        for pk, (point, point_category) in self.extra.items():
+            if pk in exclude or (category and point_category != category):
+                continue
+            candidates.append((float(((point - vector) ** 2).sum()), pk))
+
+        candidates.sort()
+        return [(pk, round(distance ** 0.5, 4)) for distance, pk in candidates[:k]]
+
+
+# ------------------------------------------------------------------------------
+# Índices por proceso
+# ------------------------------------------------------------------------------
+_lock = threading.Lock()
+_ingredient_index = None
+_meal_index = None
+
+
+def _ingredient_rows(queryset):
+    return [(row[0], row[1:6], row[6]) for row in queryset.values_list('pk', *MACRO_FIELDS, 'category')]
+
+
+def get_ingredient_substitution_index():
+    """
+    Devuelve el índice de ingredientes al día. Si el catálogo avanzó, aplica solo
+    los cambios desde la última versión vista; reconstruye si el buffer es grande.
+    """
+    global _ingredient_index
+    version = CatalogState.current_version()
+    with _lock:
+        index = _ingredient_index
+        if index is not None and version > index.version:
+            changed = _ingredient_rows(Ingredient.objects.filter(version__gt=index.version))
+            deleted = IngredientTombstone.objects.filter(version__gt=index.version).values_list('ingredient_id', flat=True)
+            index.update(changed, deleted)
+            index.version = version
+            if index.pending > max(256, len(index.ids) // 20):
+                index = None
+        if index is None:
+            index = SubstitutionIndex(_ingredient_rows(Ingredient.objects.all()), version=version)
+        _ingredient_index = index
+    return index
+
+
+def get_meal_substitution_index():
+    """Índice de recetas por totales; se reconstruye cuando cambia alguna receta."""
+    global _meal_index
+    version = get_meal_catalog_version()
+    with _lock:
+        if _meal_index is None or _meal_index.version != version:
+            rows = [(row[0], row[1:], None) for row in Meal.objects.values_list('pk', *MEAL_FIELDS)]
+            _meal_index = SubstitutionIndex(rows, version=version)
+        return _meal_index
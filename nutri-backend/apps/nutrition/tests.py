@@ -0,0 +1,378 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from apps.clinical.models import ClinicalPatient
+from apps.users.models import Organization, User
+from .models import MACRO_FIELDS, CatalogState, DietPlan, Ingredient, Meal, MealItem, PlanAllocation
+from .snapshots import BUILD_LOCK_KEY, SNAPSHOT_DIR, build_snapshot
+
+DAYS = [day for day, _ in PlanAllocation.DAYS_OF_WEEK]
+MEAL_TIMES = [code for code, _ in PlanAllocation.MEAL_TIMES]
+
+
+class NutritionTestCase(APITestCase):
+    """Clínica con un profesional, un paciente y un pequeño catálogo de recetas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name="Clínica Test", slug='clinica-test', plan_type='BUSINESS')
+        cls.professional = User.objects.create_user(
+            'pro@test.com', 'x', role='PROFESSIONAL', organization=cls.organization,
+        )
+        cls.patient = User.objects.create_user('paciente@test.com', 'x', role='PACIENTE')
+        cls.rice = Ingredient.objects.create(
+            name="Arroz", calories=Decimal('130'), proteins=Decimal('2.70'),
+            carbohydrates=Decimal('28'), fats=Decimal('0.30'), fiber=Decimal('0.40'),
+        )
+        cls.chicken = Ingredient.objects.create(
+            name="Pollo", calories=Decimal('165'), proteins=Decimal('31'),
+            carbohydrates=Decimal('0'), fats=Decimal('3.60'), fiber=Decimal('0'),
+        )
+        cls.meals = []
+        for position in range(5):
+            meal = Meal.objects.create(name=f"Receta {position}")
+            MealItem.objects.create(meal=meal, ingredient=cls.rice, quantity_grams=Decimal(100 + position * 50))
+            MealItem.objects.create(meal=meal, ingredient=cls.chicken, quantity_grams=Decimal('150'))
+            cls.meals.append(meal)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.professional)
+
+    def create_plan(self, allocations, name="Plan"):
+        plan = DietPlan.objects.create(patient=self.patient, professional=self.professional, name=name)
+        slots = [(day, meal_time) for day in DAYS for meal_time in MEAL_TIMES][:allocations]
+        PlanAllocation.objects.bulk_create([
+            PlanAllocation(plan=plan, day_of_week=day, meal_time=meal_time, meal=self.meals[position % len(self.meals)])
+            for position, (day, meal_time) in enumerate(slots)
+        ])
+        return plan
+
+
+class DietPlanQueryCountTests(NutritionTestCase):
+    """El grafo del plan (asignaciones -> receta -> items -> ingrediente) se carga en un número fijo de queries."""
+    SIZES = (1, 10, 35)
+    LIST_QUERIES = 3      # planes + asignaciones con su receta + items con su ingrediente
+    RETRIEVE_QUERIES = 3
+
+    def test_list_query_count_does_not_grow_with_allocations(self):
+        for size in self.SIZES:
+            DietPlan.objects.all().delete()
+            for copy in range(3):
+                self.create_plan(size, name=f"Plan {size}-{copy}")
+            with self.subTest(allocations=size), self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get('/api/nutrition/diet-plans/')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(all(len(plan['allocations']) == size for plan in response.json()))
+
+    def test_retrieve_query_count_does_not_grow_with_allocations(self):
+        for size in self.SIZES:
+            plan = self.create_plan(size, name=f"Plan {size}")
+            with self.subTest(allocations=size), self.assertNumQueries(self.RETRIEVE_QUERIES):
+                response = self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['allocations']), size)
+            self.assertEqual(len(response.json()['allocations'][0]['meal_details']['meal_items']), 2)
+
+
+class PlanTotalsTests(NutritionTestCase):
+    """El dashboard (motor NumPy sobre los totales guardados) coincide con macro_summary (SQL sobre los items)."""
+
+    def test_totals_match_macro_summary(self):
+        plans = [self.create_plan(size, name=f"Plan {size}") for size in (1, 10, 35)]
+        empty = self.create_plan(0, name="Vacío")
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/nutrition/diet-plans/totals/')
+        self.assertEqual(response.status_code, 200)
+        by_plan = {row['plan']: row for row in response.json()}
+        self.assertEqual(set(by_plan), {plan.pk for plan in [*plans, empty]})
+
+        def as_decimals(macros):
+            return {field: Decimal(str(macros[field])).quantize(Decimal('0.01')) for field in MACRO_FIELDS}
+
+        for plan in plans:
+            summary, totals = plan.macro_summary(), by_plan[plan.pk]
+            with self.subTest(plan=plan.name):
+                self.assertEqual(as_decimals(totals['total']), as_decimals(summary['week']))
+                for day in summary['days']:
+                    self.assertEqual(as_decimals(totals['days'][str(day['day_of_week'])]), as_decimals(day))
+                for meal_time in summary['meal_times']:
+                    self.assertEqual(as_decimals(totals['meal_times'][meal_time['meal_time']]), as_decimals(meal_time))
+        self.assertEqual(by_plan[empty.pk]['total'], dict.fromkeys(MACRO_FIELDS, 0.0))
+
+    def test_totals_are_scoped_to_the_caller(self):
+        plan = self.create_plan(5)
+        other = User.objects.create_user('otro@test.com', 'x', role='PROFESSIONAL', organization=self.organization)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/nutrition/diet-plans/totals/').json(), [])
+        self.client.force_authenticate(self.professional)
+        self.assertEqual([row['plan'] for row in self.client.get(f'/api/nutrition/diet-plans/totals/?ids={plan.pk}').json()], [plan.pk])
+        self.assertEqual(self.client.get('/api/nutrition/diet-plans/totals/?ids=x').status_code, 400)
+
+
+class CurrentPlanInvalidationTests(NutritionTestCase):
+    """El plan actual cacheado se descarta recién cuando la transacción confirma."""
+
+    def test_current_plan_is_invalidated_on_commit(self):
+        plan = self.create_plan(5)
+        self.client.force_authenticate(self.patient)
+        first = self.client.get('/api/nutrition/diet-plans/current/')
+        self.assertEqual(first.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            plan.name = "Plan renombrado"
+            plan.save()
+            # Antes del commit un lector sigue viendo (y cacheando) la versión confirmada
+            self.assertEqual(self.client.get('/api/nutrition/diet-plans/current/')['ETag'], first['ETag'])
+        self.assertTrue(callbacks)
+
+        second = self.client.get('/api/nutrition/diet-plans/current/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['name'], "Plan renombrado")
+
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_cached_document_takes_the_host_of_each_request(self):
+        self.create_plan(1)
+        Meal.objects.filter(pk=self.meals[0].pk).update(image='meals/arroz.jpg')
+        self.client.force_authenticate(self.patient)
+
+        first = self.client.get('/api/nutrition/diet-plans/current/', HTTP_HOST='app.example.com')
+        second = self.client.get('/api/nutrition/diet-plans/current/', HTTP_HOST='otra.example.com', secure=True)
+        image = lambda response: response.json()['allocations'][0]['meal_details']['image']
+        self.assertEqual(image(first), 'http://app.example.com/media/meals/arroz.jpg')
+        self.assertEqual(image(second), 'https://otra.example.com/media/meals/arroz.jpg')
+        self.assertEqual(first['ETag'], second['ETag'])
+
+
+class PlanSummaryCacheTests(NutritionTestCase):
+    """El resumen cacheado cambia de versión recién al confirmar la transacción."""
+
+    def test_summary_version_is_bumped_on_commit(self):
+        plan = self.create_plan(2)
+        first = self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/summary/').json()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            PlanAllocation.objects.create(plan=plan, day_of_week=7, meal_time='DINNER', meal=self.meals[0])
+            # Sin commit la versión no cambia: el resumen sigue siendo el confirmado
+            self.assertEqual(self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/summary/').json(), first)
+        self.assertTrue(callbacks)
+
+        second = self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/summary/').json()
+        self.assertEqual(second, plan.macro_summary())
+        self.assertNotEqual(second['week'], first['week'])
+
+
+class IngredientSearchIndexTests(NutritionTestCase):
+    """El índice de autocompletado se reconstruye con las filas ya confirmadas."""
+
+    def search(self, query):
+        return [row['name'] for row in self.client.get('/api/nutrition/ingredients/search/', {'q': query}).json()['results']]
+
+    def test_catalog_version_is_bumped_on_commit(self):
+        self.assertEqual(self.search('quinua'), [])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Ingredient.objects.create(
+                name="Quinua", calories=Decimal('120'), proteins=Decimal('4.40'),
+                carbohydrates=Decimal('21.30'), fats=Decimal('1.90'),
+            )
+            self.assertEqual(self.search('quinua'), [])
+        self.assertTrue(callbacks)
+        self.assertEqual(self.search('quinua'), ["Quinua"])
+
+
+class MealSubstitutionIndexTests(NutritionTestCase):
+    """El índice de sustituciones de recetas se reconstruye con las filas ya confirmadas."""
+
+    def substitutes(self, meal):
+        return [row['name'] for row in self.client.get(f'/api/nutrition/meals/{meal.pk}/substitutes/', {'k': 10}).json()]
+
+    def test_meal_catalog_version_is_bumped_on_commit(self):
+        self.assertNotIn("Gemela", self.substitutes(self.meals[0]))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            twin = Meal.objects.create(name="Gemela")
+            MealItem.objects.create(meal=twin, ingredient=self.rice, quantity_grams=Decimal('100'))
+            MealItem.objects.create(meal=twin, ingredient=self.chicken, quantity_grams=Decimal('150'))
+            self.assertNotIn("Gemela", self.substitutes(self.meals[0]))
+        self.assertTrue(callbacks)
+        self.assertEqual(self.substitutes(self.meals[0])[0], "Gemela")
+
+
+class CatalogSnapshotTests(NutritionTestCase):
+    """Dos builds de la misma versión no se pisan y la limpieza respeta lo que se está sirviendo."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_concurrent_builds_of_the_same_version_keep_the_served_file(self):
+        version = CatalogState.current_version()
+        first = build_snapshot(version)
+        second = build_snapshot(version)  # El storage le da un nombre con sufijo a esta copia
+        self.assertEqual(first, second)
+        self.assertTrue(default_storage.exists(first))
+        self.assertEqual(default_storage.listdir(SNAPSHOT_DIR)[1], [first.rsplit('/', 1)[1]])
+
+    def test_cleanup_keeps_the_previous_version(self):
+        names = [build_snapshot(version) for version in (1, 2, 3)]
+        _, files = default_storage.listdir(SNAPSHOT_DIR)
+        self.assertEqual(sorted(files), [name.rsplit('/', 1)[1] for name in names[1:]])
+
+    def test_snapshot_endpoint_serves_the_current_version(self):
+        response = self.client.get('/api/nutrition/ingredients/snapshot/')
+        self.assertEqual(response.status_code, 200)
+        document = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(document['version'], CatalogState.current_version())
+        self.assertEqual({row['name'] for row in document['ingredients']}, {"Arroz", "Pollo"})
+
+
+    def test_requests_during_a_build_get_the_previous_version(self):
+        previous = CatalogState.current_version()
+        build_snapshot(previous)
+        Ingredient.objects.create(name="Lentejas", calories=116, proteins=9, carbohydrates=20, fats='0.40')
+        version = CatalogState.current_version()
+        cache.add(BUILD_LOCK_KEY.format(version=version), 1)  # Otro request está construyendo
+
+        response = self.client.get('/api/nutrition/ingredients/snapshot/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"catalog-v{previous}"')
+        document = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(document['version'], previous)
+
+    def test_build_in_progress_without_previous_version_is_unavailable(self):
+        cache.add(BUILD_LOCK_KEY.format(version=CatalogState.current_version()), 1)
+        response = self.client.get('/api/nutrition/ingredients/snapshot/')
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response['Retry-After'])
+
+class PlanGenerationTests(NutritionTestCase):
+    """El generador solo usa pacientes y recetas de la clínica del profesional."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        ClinicalPatient.objects.create(
+            organization=cls.organization, first_name="Ana", last_name="Paz", email=cls.patient.email,
+        )
+        cls.other_organization = Organization.objects.create(name="Otra Clínica", slug='otra-clinica', plan_type='BUSINESS')
+        cls.outsider = User.objects.create_user(
+            'ajeno@test.com', 'x', role='PROFESSIONAL', organization=cls.other_organization,
+        )
+        cls.foreign_patient = User.objects.create_user('ajena@test.com', 'x', role='PACIENTE')
+        ClinicalPatient.objects.create(
+            organization=cls.other_organization, first_name="Eva", last_name="Sol", email=cls.foreign_patient.email,
+        )
+        cls.foreign_meal = Meal.objects.create(name="Receta ajena", created_by=cls.outsider)
+        MealItem.objects.create(meal=cls.foreign_meal, ingredient=cls.rice, quantity_grams=Decimal('200'))
+
+    def generate(self, **data):
+        payload = {'patient': str(self.patient.pk), 'name': "Generado", 'calories': 1800, 'time_budget_ms': 50, **data}
+        return self.client.post('/api/nutrition/diet-plans/generate/', payload, format='json')
+
+    def test_generates_a_full_week_from_the_clinic_catalog(self):
+        response = self.generate()
+        self.assertEqual(response.status_code, 201, response.content)
+        allocations = response.json()['allocations']
+        self.assertEqual(len(allocations), len(DAYS) * len(MEAL_TIMES))
+        self.assertNotIn(self.foreign_meal.pk, {allocation['meal'] for allocation in allocations})
+        self.assertEqual(DietPlan.objects.get(pk=response.json()['id']).professional, self.professional)
+
+    def test_dry_run_does_not_write(self):
+        response = self.generate(dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['allocations']), len(DAYS) * len(MEAL_TIMES))
+        self.assertFalse(DietPlan.objects.exists())
+
+    def test_rejects_patients_and_meals_of_other_clinics(self):
+        self.assertEqual(self.generate(patient=str(self.foreign_patient.pk)).status_code, 400)
+        self.assertEqual(self.generate(meals=[self.foreign_meal.pk]).status_code, 400)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.generate().status_code, 403)
+        self.assertFalse(DietPlan.objects.exists())
+
+
+class IngredientMacroPropagationTests(NutritionTestCase):
+    """Solo un cambio de macros recalcula las recetas que usan el ingrediente."""
+
+    def test_full_save_without_macro_changes_does_not_touch_meals(self):
+        rice = Ingredient.objects.get(pk=self.rice.pk)
+        rice.name = "Arroz blanco"
+        rice.calories = '130.00'  # Mismo valor, escrito distinto (formulario del admin)
+        with mock.patch('apps.nutrition.signals.invalidate_meals') as invalidate:
+            rice.save()
+        invalidate.assert_not_called()
+
+    def test_macro_change_refreshes_meal_totals(self):
+        rice = Ingredient.objects.get(pk=self.rice.pk)
+        rice.calories = Decimal('200')
+        rice.save()
+        meal = Meal.objects.get(pk=self.meals[0].pk)
+        self.assertEqual(meal.total_calories, Decimal('200') + Decimal('165') * Decimal('1.5'))
+        # Y un segundo save sin cambios ya no recalcula
+        with mock.patch('apps.nutrition.signals.invalidate_meals') as invalidate:
+            rice.save()
+        invalidate.assert_not_called()
+
+
+class ImportIngredientsTests(NutritionTestCase):
+    """import_ingredients: upsert por nombre, versión del catálogo y totales de las recetas."""
+
+    def import_csv(self, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'tabla.csv')
+        with open(path, 'w', encoding='utf-8') as fp:
+            fp.write(content)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_ingredients', path, stdout=io.StringIO())
+
+    def test_existing_names_are_updated_and_new_ones_inserted(self):
+        self.import_csv(
+            "Nombre,Categoría,kcal,Proteína,Carbohidratos,Grasas\n"
+            "Arroz,Cereales,350,7.5,77,0.6\n"
+            "Lentejas,Legumbres,116,9,20,0.4\n"
+        )
+        rice = Ingredient.objects.get(pk=self.rice.pk)
+        self.assertEqual((rice.calories, rice.proteins), (Decimal('350.00'), Decimal('7.50')))
+        self.assertEqual(Ingredient.objects.filter(name="Arroz").count(), 1)
+        lentils = Ingredient.objects.get(name="Lentejas")
+        self.assertEqual((lentils.calories, lentils.fiber), (Decimal('116.00'), Decimal('0.00')))
+
+    def test_changes_feed_reports_the_imported_batch_and_tombstones(self):
+        since = CatalogState.current_version()
+        deleted_pk = self.chicken.pk
+        MealItem.objects.filter(ingredient=self.chicken).delete()
+        Ingredient.objects.get(pk=deleted_pk).delete()
+        self.import_csv("name,calories,proteins,carbohydrates,fats\nArroz,131,2.7,28,0.3\nPollo,170,31,0,3.6\n")
+
+        changes = self.client.get('/api/nutrition/ingredients/changes/', {'since': since}).json()
+        self.assertEqual(changes['deleted'], [deleted_pk])
+        # Todo el lote comparte la última versión; el pollo reimportado es una fila nueva
+        self.assertEqual({row['name'] for row in changes['updated']}, {"Arroz", "Pollo"})
+        self.assertEqual({row['version'] for row in changes['updated']}, {changes['version']})
+        self.assertNotIn(deleted_pk, [row['id'] for row in changes['updated']])
+
+        changes = self.client.get('/api/nutrition/ingredients/changes/', {'since': changes['version']}).json()
+        self.assertEqual((changes['updated'], changes['deleted']), ([], []))
+
+    def test_meal_totals_are_refreshed_after_import(self):
+        plan = self.create_plan(1)
+        self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/summary/')
+        self.import_csv("name,calories,proteins,carbohydrates,fats\nArroz,200,2.7,28,0.3\n")
+
+        meal = Meal.objects.get(pk=self.meals[0].pk)
+        self.assertEqual(meal.total_calories, Decimal('200') + Decimal('165') * Decimal('1.5'))
+        summary = self.client.get(f'/api/nutrition/diet-plans/{plan.pk}/summary/').json()
+        self.assertEqual(summary, DietPlan.objects.get(pk=plan.pk).macro_summary())
@@ -1,45 +1,306 @@
-from rest_framework import viewsets, permissions
-from .models import Ingredient, Meal, DietPlan
-from .serializers import IngredientSerializer, MealSerializer, DietPlanSerializer
+from django.core.files.storage import default_storage
+from django.http import FileResponse
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from apps.common.http import etag_matches
+from apps.common.projections import ProjectionListMixin
+from .caching import absolute_current_plan, get_current_plan_entry, get_plan_summary
+from .engine import compute_plan_totals
+from .models import CatalogState, Ingredient, IngredientTombstone, Meal, DietPlan
+from .planner import generate_plan
+from .search import get_ingredient_index
+from .serializers import IngredientSerializer, MealSerializer, DietPlanSerializer, PlanGenerationSerializer
+from .snapshots import BUILD_RETRY_AFTER, get_catalog_snapshot
+from .substitutions import get_ingredient_substitution_index, get_meal_substitution_index
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+def parse_substitution_params(request):
+    """Lee ?k= (1-50) y ?exclude=1,2,3 de las acciones de sustitución."""
+    try:
+        k = int(request.query_params.get('k', 5))
+        exclude = [int(pk) for pk in request.query_params.get('exclude', '').split(',') if pk.strip()]
+    except ValueError:
+        raise ValidationError("'k' y 'exclude' deben ser números (exclude separado por comas).")
+    return max(1, min(k, 50)), exclude
+
+class IngredientSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class IngredientViewSet(ProjectionListMixin, viewsets.ReadOnlyModelViewSet):
     """
     Catálogo de Ingredientes (Solo lectura para usuarios, creación vía Admin)
+    La lista sale de una proyección .values() y admite ?fields=id,name,calories
     """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    projection = {
+        field: field for field in [
+            'id', 'name', 'category', 'calories', 'proteins', 'carbohydrates', 'fats', 'fiber', 'version', 'updated_at',
+        ]
+    }
+    projection_by_default = True
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Autocompletado: /ingredients/search/?q=poll&category=PROTEIN&page=1
+        Tolera tildes y errores de tipeo; resultados ordenados por relevancia y paginados.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': "Escribe al menos un carácter para buscar."})
+
+        ranked_ids = get_ingredient_index().search(query, category=request.query_params.get('category'))
+
+        paginator = IngredientSearchPagination()
+        page_ids = paginator.paginate_queryset(ranked_ids, request, view=self)
+        ingredients = Ingredient.objects.in_bulk(page_ids)
+        page = [ingredients[pk] for pk in page_ids if pk in ingredients]
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def substitutes(self, request, pk=None):
+        """
+        Alternativas con macros parecidos: /ingredients/{id}/substitutes/?k=5&category=PROTEIN&exclude=3,8
+        Ordenadas por distancia (macros normalizados); `category` restringe la búsqueda.
+        """
+        ingredient = self.get_object()
+        k, exclude = parse_substitution_params(request)
+        index = get_ingredient_substitution_index()
+        vector = index.vector_of(ingredient.pk)
+        if vector is None:
+            raise NotFound("El ingrediente aún no está en el índice de sustituciones.")
+
+        matches = index.nearest(vector, k, category=request.query_params.get('category'), exclude=[ingredient.pk, *exclude])
+        ingredients = Ingredient.objects.in_bulk([pk for pk, _ in matches])
+        results = []
+        for match_pk, distance in matches:
+            if match_pk in ingredients:
+                results.append({**self.get_serializer(ingredients[match_pk]).data, 'distance': distance})
+        return Response(results)
 
-class MealViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Sincronización incremental: /ingredients/changes/?since=<versión>
+        Devuelve los ingredientes nuevos o editados y los ids borrados desde esa versión.
+        El cliente guarda `version` y la usa como `since` en la próxima llamada.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            raise ValidationError({'since': "Debe ser un número de versión."})
+
+        version = CatalogState.current_version()
+        updated = Ingredient.objects.filter(version__gt=since).order_by('version', 'pk')
+        deleted = (
+            IngredientTombstone.objects.filter(version__gt=since)
+            .order_by('ingredient_id')
+            .values_list('ingredient_id', flat=True)
+            .distinct()
+        )
+        return Response({
+            'version': version,
+            'since': since,
+            'updated': self.get_serializer(updated, many=True).data,
+            'deleted': list(deleted),
+        })
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Catálogo completo como JSON comprimido (gzip), pre-generado por versión.
+        Con If-None-Match de la misma versión responde 304. Mientras otro request genera
+        la versión nueva se sirve la anterior (con su ETag), o 503 si no hay ninguna.
+        """
+        snapshot = get_catalog_snapshot()
+        if snapshot is None:
+            return Response(
+                {'detail': "El catálogo se está generando, intenta de nuevo en unos segundos."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(BUILD_RETRY_AFTER)},
+            )
+        version, name = snapshot
+        etag = f'"catalog-v{version}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        response['X-Catalog-Version'] = str(version)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+class MealViewSet(ProjectionListMixin, viewsets.ModelViewSet):
     """
     Gestión de Recetas
+    Con ?fields=id,name,total_calories la lista sale de una proyección (sin meal_items).
     """
-    queryset = Meal.objects.all()
+    queryset = Meal.objects.with_items()
     serializer_class = MealSerializer
     permission_classes = [permissions.IsAuthenticated]
+    projection = {
+        field: field for field in [
+            'id', 'name', 'description', 'image', 'created_by',
+            'total_calories', 'total_proteins', 'total_carbohydrates', 'total_fats', 'total_fiber', 'created_at',
+        ]
+    }
+
+    def project_row(self, row):
+        if 'image' in row:
+            row['image'] = self.request.build_absolute_uri(default_storage.url(row['image'])) if row['image'] else None
+        return row
 
     def perform_create(self, serializer):
         # Asignar automáticamente al usuario que crea la receta
         serializer.save(created_by=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def substitutes(self, request, pk=None):
+        """
+        Recetas con totales de kcal y macros parecidos: /meals/{id}/substitutes/?k=5&exclude=3
+        """
+        meal = self.get_object()
+        k, exclude = parse_substitution_params(request)
+        index = get_meal_substitution_index()
+        vector = index.vector_of(meal.pk)
+        if vector is None:
+            raise NotFound("La receta aún no está en el índice de sustituciones.")
+
+        matches = index.nearest(vector, k, exclude=[meal.pk, *exclude])
+        meals = self.get_queryset().in_bulk([pk for pk, _ in matches])
+        results = []
+        for match_pk, distance in matches:
+            if match_pk in meals:
+                results.append({**self.get_serializer(meals[match_pk]).data, 'distance': distance})
+        return Response(results)
+
 class DietPlanViewSet(viewsets.ModelViewSet):
     """
     Gestión de Planes Nutricionales
     """
     serializer_class = DietPlanSerializer
     permission_classes = [permissions.IsAuthenticated]
+    MAX_TOTALS_PLANS = 500
 
     def get_queryset(self):
         # FILTRO DE SEGURIDAD (VITAL):
         user = self.request.user
+        tenant = self.request.tenant
+        # Cargamos el plan completo en un número fijo de queries (sin N+1)
+        # (el resumen y los totales se calculan aparte y no necesitan el grafo)
+        plans = DietPlan.objects.all() if self.action in ('summary', 'totals') else DietPlan.objects.with_graph()
         
         # 1. Si es Nutricionista: Ve los planes que ÉL creó
-        if user.role == 'NUTRICIONISTA':
-            return DietPlan.objects.filter(professional=user)
+        if tenant.role == 'PROFESSIONAL':
+            return plans.filter(professional_id=user.pk)
+
+        # 2. Si es Dueño de Clínica: Ve los planes de SU organización
+        elif tenant.role == 'ORG_OWNER':
+            return plans.for_tenant(tenant)
             
-        # 2. Si es Paciente: Ve los planes asignados a ÉL
-        elif user.role == 'PACIENTE':
-            return DietPlan.objects.filter(patient=user)
+        # 3. Si es Paciente: Ve los planes asignados a ÉL
+        elif tenant.role == 'PACIENTE':
+            return plans.filter(patient_id=user.pk)
             
-        # 3. Si es Admin: Ve todo
-        return DietPlan.objects.all()
\ No newline at end of file
+        # 4. Si es Admin: Ve todo
+        return plans
+
+    @action(detail=False, methods=['get'])
+    def current(self, request):
+        """
+        Plan activo del paciente logueado (lo pide la app al abrirse).
+        Se sirve desde un documento precalculado con ETag: si el cliente manda
+        If-None-Match y el plan no cambió, responde 304 sin tocar la BD.
+        """
+        if request.user.role != 'PACIENTE':
+            raise PermissionDenied("Solo los pacientes tienen un plan actual.")
+
+        entry = get_current_plan_entry(request.user.pk)
+        if entry['document'] is None:
+            raise NotFound("No tienes un plan nutricional activo.")
+
+        headers = {'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+        if etag_matches(request, entry['etag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(absolute_current_plan(entry['document'], request), headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """
+        Totales de kcal y macros por día, por momento del día y de la semana.
+        Se calculan con una sola query de agregación y se cachean por versión del plan.
+        """
+        return Response(get_plan_summary(self.get_object()))
+
+    @action(detail=False, methods=['get'])
+    def totals(self, request):
+        """
+        Dashboard: totales de kcal y macros (semana, por día y por momento) de los planes visibles.
+        /diet-plans/totals/?ids=1,2,3&active=1 (máx. MAX_TOTALS_PLANS planes, los más recientes).
+        Sale de los totales guardados en cada receta: 2 queries para cualquier cantidad de planes.
+        """
+        plans = self.get_queryset()
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                plans = plans.filter(pk__in=[int(pk) for pk in ids.split(',') if pk.strip()])
+            except ValueError:
+                raise ValidationError({'ids': "Deben ser números separados por comas."})
+        if request.query_params.get('active', '').lower() in ('1', 'true', 'yes'):
+            plans = plans.filter(is_active=True)
+        plan_ids = list(plans.order_by('-updated_at').values_list('pk', flat=True)[:self.MAX_TOTALS_PLANS])
+
+        totals = compute_plan_totals(plan_ids)
+        return Response([{'plan': plan_id, **totals.as_dict(plan_id)} for plan_id in plan_ids])
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """
+        Genera un plan semanal (7 días x 5 momentos) que se ajusta a los objetivos diarios.
+        Body: {patient, name, calories, proteins?, carbohydrates?, fats?, fiber?, meals?: [ids],
+               max_repeats?: 2, time_budget_ms?: 500, dry_run?: false}
+        Con dry_run solo devuelve la propuesta sin guardarla.
+        """
+        if request.user.role == 'PACIENTE':
+            raise PermissionDenied("Solo los profesionales pueden generar planes.")
+
+        params = PlanGenerationSerializer(data=request.data, context=self.get_serializer_context())
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        meal_ids = [meal.pk for meal in data['meals']] if data.get('meals') else None
+
+        try:
+            plan, solution = generate_plan(
+                patient=data['patient'],
+                professional=request.user,
+                targets=data,
+                name=data['name'],
+                description=data['description'],
+                meal_ids=meal_ids,
+                meals=Meal.objects.available_to(request.tenant),
+                time_budget=data['time_budget_ms'] / 1000,
+                max_repeats=data['max_repeats'],
+                commit=not data['dry_run'],
+            )
+        except ValueError as exc:
+            raise ValidationError({'meals': str(exc)})
+
+        if plan is None:
+            return Response({'allocations': [
+                {'day_of_week': day, 'meal_time': meal_time, 'meal': meal_id}
+                for day, meal_time, meal_id in solution.allocations()
+            ], 'optimization': solution.as_dict()})
+
+        plan = DietPlan.objects.with_graph().get(pk=plan.pk)
+        return Response(
+            {**self.get_serializer(plan).data, 'optimization': solution.as_dict()},
+            status=status.HTTP_201_CREATED,
+        )
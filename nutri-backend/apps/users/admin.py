@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, ProfessionalProfile, PatientProfile, Organization
+from .models import User, ProfessionalProfile, PatientProfile, Organization, BodyMeasurement
 
 # ==============================================================================
 # 1. ADMIN DE ORGANIZACIÓN
@@ -91,4 +91,18 @@ class ProfessionalProfileAdmin(admin.ModelAdmin):
 @admin.register(PatientProfile)
 class PatientProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'gender', 'weight')
-    search_fields = ('user__email',)
\ No newline at end of file
+    search_fields = ('user__email',)
+
+# ==============================================================================
+# 5. ADMIN DE MEDICIONES (Solo lectura: la serie no se edita)
+# ==============================================================================
+@admin.register(BodyMeasurement)
+class BodyMeasurementAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'kind', 'value', 'measured_at', 'recorded_by')
+    list_filter = ('kind',)
+    search_fields = ('patient__email',)
+    date_hierarchy = 'measured_at'
+    raw_id_fields = ('patient', 'recorded_by')
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None
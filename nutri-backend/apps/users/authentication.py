@@ -0,0 +1,130 @@
+"""
+Autenticación JWT con el usuario en caché.
+
+JWTAuthentication de simplejwt busca el User en la BD en cada request. Aquí el
+usuario se lee de la caché compartida con una clave versionada por id: guardar o
+borrar el usuario asigna una versión nueva (ver signals.py) y la entrada vieja
+deja de leerse. La organización se toma de su propia caché versionada
+(tenancy.get_cached_organization), así `user.organization` tampoco va a la BD.
+
+En caché no va el modelo entero (ni el hash de la contraseña): solo AUTH_USER_FIELDS,
+los datos que leen las vistas y serializers (CACHED_USER_FIELDS: email, nombre, foto)
+y, si CHECK_REVOKE_TOKEN está activo, el md5 del hash que simplejwt compara. Con eso
+se arma un User diferido; los demás campos (last_login, cognito_sub...) cuestan una
+query cada uno si se usan: la vista que necesite la fila completa la lee ella misma
+(como /me/, con su propio documento cacheado).
+
+Con la caché caliente, un request autenticado no hace queries de autenticación.
+Las validaciones de simplejwt (usuario activo, cambio de contraseña) se aplican
+igual sobre el usuario cacheado. Si el token trae claims de tenant (tokens.py),
+request.user es un TokenTenantUser y la entrada del usuario no se lee hasta que la
+vista necesita el modelo completo; para no aceptar durante la vida del access token
+a un usuario desactivado, se consulta una sola marca en caché (INACTIVE_USER_KEY).
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .tenancy import get_cached_organization
+from .tokens import TokenTenantUser, has_tenant_claims
+
+USER_VERSION_KEY = 'users:user-version:{user_id}'
+AUTH_USER_KEY = 'users:auth-entry:{user_id}:{version}'
+AUTH_USER_TIMEOUT = 60 * 60  # Red de seguridad; la invalidación es por versión
+AUTH_USER_FIELDS = ('id', 'role', 'organization_id', 'is_active', 'is_staff', 'is_superuser')
+# Campos no secretos que leen los requests (str(user), logs, serializers): sin ellos cada uno es una query
+CACHED_USER_FIELDS = ('email', 'first_name', 'last_name', 'photo', 'photo_derivatives')
+INACTIVE_USER_KEY = 'users:inactive:{user_id}'
+
+
+def get_user_version(user_id):
+    key = USER_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    """Invalida el usuario en caché (al confirmar la transacción en curso)."""
+    key = USER_VERSION_KEY.format(user_id=user_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def flag_inactive_user(user_id, inactive):
+    """
+    Marca (o desmarca) al usuario desactivado o borrado. Dura lo que un access token:
+    pasado ese tiempo los tokens viejos vencieron y el refresh ya valida is_active.
+    """
+    key = INACTIVE_USER_KEY.format(user_id=user_id)
+    if inactive:
+        timeout = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        transaction.on_commit(lambda: cache.set(key, True, timeout))
+    else:
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+def auth_user_entry(user):
+    """Lo mínimo para autenticar más los datos de lectura (sin el hash de la contraseña)."""
+    entry = {field: getattr(user, field) for field in AUTH_USER_FIELDS}
+    for field in CACHED_USER_FIELDS:
+        value = getattr(user, field)
+        entry[field] = value.name if isinstance(value, FieldFile) else value  # La foto, como su ruta
+    if api_settings.CHECK_REVOKE_TOKEN:
+        entry['password_md5'] = get_md5_hash_password(user.password)
+    return entry
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Token con claims de rol/organización: el User se carga solo si la vista lo usa
+        if has_tenant_claims(validated_token) and not api_settings.CHECK_REVOKE_TOKEN:
+            if cache.get(INACTIVE_USER_KEY.format(user_id=validated_token[api_settings.USER_ID_CLAIM])):
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return TokenTenantUser(validated_token, lambda: self.get_cached_user(validated_token))
+        return self.get_cached_user(validated_token)
+
+    def get_cached_user(self, validated_token):
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        key = AUTH_USER_KEY.format(user_id=user_id, version=get_user_version(user_id))
+        entry = cache.get(key)
+        if entry is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            entry = auth_user_entry(user)
+            cache.set(key, entry, AUTH_USER_TIMEOUT)
+
+        if not entry['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry['password_md5']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # User diferido: los campos que no están en la entrada se leen de la BD si se usan
+        # (from_db recibe los valores en el orden de los campos del modelo)
+        names = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in entry]
+        user = self.user_model.from_db(self.user_model.objects.db, names, [entry[name] for name in names])
+
+        if user.organization_id:
+            organization_entry = get_cached_organization(user.organization_id)
+            if organization_entry is not None:
+                user._meta.get_field('organization').set_cached_value(user, organization_entry['organization'])
+        return user
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """Mismo esquema 'Bearer' en la documentación (Swagger) que JWTAuthentication."""
+    target_class = 'apps.users.authentication.CachedJWTAuthentication'
@@ -0,0 +1,78 @@
+"""
+Perfil propio cacheado (/api/users/me/).
+
+La app pide su perfil en cada arranque. El documento completo (usuario +
+organización + perfil profesional o de paciente) se guarda ya serializado con su
+ETag, en una clave versionada por usuario: guardar el usuario o su perfil asigna
+una versión nueva (ver signals.py). La entrada recuerda además la versión de la
+organización con la que se armó; si la clínica cambió (plan, cupo), se reconstruye.
+Las URLs de la foto se guardan relativas y se hacen absolutas al servir, con el host
+de cada request.
+
+Con la caché caliente son tres GET a la caché y ninguna query.
+"""
+import hashlib
+import json
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from apps.common.images import has_derivatives
+from .authentication import get_user_version
+from .models import User
+from .serializers import UserSerializer
+from .tenancy import get_organization_version
+
+ME_KEY = 'users:me:{user_id}:{version}'
+ME_TIMEOUT = 60 * 60 * 24  # Red de seguridad; la invalidación es por versión
+PHOTO_FIELDS = ('photo', 'photo_avatar', 'photo_medium')
+
+
+def build_me_entry(user_id):
+    """
+    Arma el documento del usuario con una sola query (organización y perfiles por JOIN).
+    Devuelve {'etag', 'document', 'organization_id', 'organization_version', 'timeout'}.
+    """
+    user = (
+        User.objects.select_related('organization', 'professional_profile', 'patient_profile')
+        .get(pk=user_id)
+    )
+    organization = user.organization
+    content = JSONRenderer().render(UserSerializer(user, context={'request': None}).data)
+
+    timeout = ME_TIMEOUT
+    if user.photo and not has_derivatives(user.photo):
+        timeout = 0  # Miniaturas en proceso: el documento aún apunta al original
+    elif organization and organization.subscription_end and organization.has_active_subscription:
+        # status_subscription depende de la hora: la entrada no dura más que la suscripción
+        remaining = (organization.subscription_end - timezone.now()).total_seconds()
+        timeout = min(timeout, max(int(remaining), 1))
+
+    return {
+        'etag': '"%s"' % hashlib.sha1(content).hexdigest(),
+        'document': json.loads(content),
+        'organization_id': organization.pk if organization else None,
+        'organization_version': get_organization_version(organization.pk) if organization else None,
+        'timeout': timeout,
+    }
+
+
+def get_me_entry(user_id):
+    """Lee el documento desde la caché y solo lo reconstruye si cambió el usuario, su perfil o su clínica."""
+    key = ME_KEY.format(user_id=user_id, version=get_user_version(user_id))
+    entry = cache.get(key)
+    if entry is not None and entry['organization_id']:
+        if entry['organization_version'] != get_organization_version(entry['organization_id']):
+            entry = None
+    if entry is None:
+        entry = build_me_entry(user_id)
+        if entry['timeout']:
+            cache.set(key, entry, entry['timeout'])
+    return entry
+
+
+def absolute_me(document, request):
+    """Copia del documento con las URLs de la foto absolutas para este request."""
+    return {
+        **document,
+        **{field: request.build_absolute_uri(document[field]) for field in PHOTO_FIELDS if document.get(field)},
+    }
@@ -0,0 +1,67 @@
+import time
+from django.core.cache import cache
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.users.authentication import CachedJWTAuthentication
+from apps.users.models import User
+from apps.users.tenancy import TenantMiddleware
+from apps.users.views import UserViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara JWTAuthentication (usuario desde la BD) contra CachedJWTAuthentication (caché versionada): "
+        "autenticaciones/segundo, queries de autenticación y requests/segundo de GET /api/users/{id}/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help="Usuario con el que autenticar (por defecto, el primero con organización)")
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(email=options['email']).first() if options['email'] else users.filter(organization__isnull=False).first()
+        if user is None:
+            raise CommandError("No hay un usuario activo para la prueba.")
+
+        factory = APIRequestFactory()
+        header = f'Bearer {AccessToken.for_user(user)}'
+        cache.clear()
+        self.stdout.write(f"Usuario: {user.email}")
+
+        for authentication in (JWTAuthentication, CachedJWTAuthentication):
+            view = UserViewSet.as_view({'get': 'retrieve'}, authentication_classes=[authentication])
+            handler = TenantMiddleware(lambda request: view(request, pk=str(user.pk)))
+
+            def authenticate():
+                request = Request(factory.get('/', HTTP_AUTHORIZATION=header))
+                authenticated, _ = authentication().authenticate(request)
+                # Lo que toda vista termina usando: el usuario y su organización
+                return authenticated.organization
+
+            def call():
+                response = handler(factory.get(f'/api/users/{user.pk}/', HTTP_AUTHORIZATION=header))
+                response.render()
+                assert response.status_code == 200, response.status_code
+
+            call()  # Calienta la caché
+            with CaptureQueriesContext(connection) as queries:
+                authenticate()
+
+            auth_rate = self.rate(authenticate, options['requests'])
+            request_rate = self.rate(call, options['requests'])
+            self.stdout.write(
+                f"{authentication.__name__:<24} | autenticación: {auth_rate:8.0f}/s, {len(queries)} queries | "
+                f"GET /api/users/{{id}}/: {request_rate:6.0f} req/s"
+            )
+
+    def rate(self, fn, count):
+        started = time.perf_counter()
+        for _ in range(count):
+            fn()
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+from apps.clinical.models import ClinicalPatient
+from apps.common.images import derivatives_exist, record_derivatives, render_derivatives, store_derivatives
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las miniaturas (avatar/medium) de las fotos de pacientes y usuarios que aún no las "
+        "tienen: las existentes y las que el pool del upload no llegó a registrar. Pensado para cron "
+        "o como worker con --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Procesos para redimensionar")
+        parser.add_argument('--force', action='store_true', help="Regenera aunque ya existan")
+        parser.add_argument('--loop', action='store_true', help="Queda corriendo y revisa cada --interval segundos")
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        while True:
+            self.build_pending(options)
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def build_pending(self, options):
+        photos = []
+        for model in (ClinicalPatient, User):
+            rows = model.objects.exclude(photo='').exclude(photo__isnull=True)
+            if not options['force']:
+                rows = rows.exclude(photo_derivatives=F('photo'))
+            photos.extend((name, model) for name in sorted(set(rows.values_list('photo', flat=True))))
+
+        # Miniaturas ya generadas antes de registrarlas en la base: basta con marcarlas
+        existing = set() if options['force'] else {(name, model) for name, model in photos if derivatives_exist(name)}
+        for name, model in existing:
+            record_derivatives(model, name)
+        photos = [photo for photo in photos if photo not in existing]
+        self.stdout.write(f"Registradas: {len(existing)} | sin miniaturas: {len(photos)}")
+
+        started = time.perf_counter()
+        done = failed = 0
+        window = options['workers'] * 4  # Fotos leídas a la vez (acota la memoria)
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(photos), window):
+                futures = {}
+                for name, model in photos[start:start + window]:
+                    try:
+                        with default_storage.open(name, 'rb') as fp:
+                            futures[name, model] = pool.submit(render_derivatives, fp.read())
+                    except OSError as exc:
+                        failed += 1
+                        self.stderr.write(f"No se pudo leer {name}: {exc}")
+                for (name, model), future in futures.items():
+                    try:
+                        store_derivatives(name, future.result())
+                        record_derivatives(model, name)
+                        done += 1
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"Falló {name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Miniaturas generadas: {done} | con error: {failed} | {time.perf_counter() - started:.2f}s"
+        ))
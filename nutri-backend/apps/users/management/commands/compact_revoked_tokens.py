@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.users.revocation import get_revocation_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarta los refresh tokens revocados que ya vencieron del archivo local. "
+        "Pensado para cron o como worker con --loop (el backend de caché expira solo por TTL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Queda corriendo y compacta cada --interval segundos")
+        parser.add_argument('--interval', type=int, default=3600)
+
+    def handle(self, *args, **options):
+        store = get_revocation_store()
+        while True:
+            started = time.perf_counter()
+            remaining = store.compact()
+            if remaining is None:
+                self.stdout.write(f"{store.__class__.__name__}: las entradas vencen solas por TTL, nada que compactar.")
+            else:
+                self.stdout.write(
+                    f"Revocaciones vigentes: {remaining} | {time.perf_counter() - started:.2f}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
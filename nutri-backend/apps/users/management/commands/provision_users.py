@@ -0,0 +1,62 @@
+import csv
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from apps.clinical.importer import read_rows
+from apps.users.models import Organization, UserRole
+from apps.users.provisioning import PROVISIONABLE_ROLES, STATUS_CREATED, provision_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Alta masiva de usuarios (CSV o XLSX con email, nombre, apellido, rol y contraseña opcional): "
+        "usuarios y perfiles se insertan con bulk_create, sin la cascada de señales por fila."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo CSV/XLSX a importar")
+        parser.add_argument('--organization', help="Slug o id de la organización (sin ella, usuarios sin clínica)")
+        parser.add_argument('--default-role', default=UserRole.PACIENTE, choices=PROVISIONABLE_ROLES[UserRole.ADMIN],
+                            help="Rol de las filas que no traen uno")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--report', help="Archivo CSV donde guardar el reporte por fila")
+        parser.add_argument('--dry-run', action='store_true', help="Valida sin escribir en la BD")
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization']:
+            organization = Organization.objects.filter(slug=options['organization']).first()
+            if organization is None:
+                try:
+                    organization = Organization.objects.get(pk=options['organization'])
+                except (Organization.DoesNotExist, ValidationError):
+                    raise CommandError(f"No existe la organización '{options['organization']}'.")
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fp:
+                report = provision_users(
+                    organization, read_rows(fp, options['path']), default_role=options['default_role'],
+                    dry_run=options['dry_run'], batch_size=options['batch_size'],
+                )
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as fp:
+                writer = csv.writer(fp)
+                writer.writerow(['row', 'status', 'id', 'email', 'errors'])
+                for entry in report['rows']:
+                    writer.writerow([entry['row'], entry['status'], entry['id'] or '', entry['email'], json.dumps(entry['errors'], ensure_ascii=False)])
+
+        if options['verbosity'] >= 2:
+            for entry in report['rows']:
+                if entry['status'] != STATUS_CREATED:
+                    self.stderr.write(f"Fila {entry['row']} ({entry['status']}): {'; '.join(entry['errors'])}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Creados: {report['created']} | omitidos: {report['skipped']} | con errores: {report['errors']} | "
+            f"{elapsed:.2f}s" + (" [dry-run]" if options['dry_run'] else "")
+        ))
@@ -0,0 +1,104 @@
+"""
+Consultas sobre la serie de mediciones corporales (BodyMeasurement).
+
+Todo se agrega en la BD: un año de pesajes diarios se devuelve como ~52 puntos
+semanales (promedio, mínimo, máximo, cantidad) en vez de cientos de lecturas.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from .models import BodyMeasurement, PatientProfile
+
+BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def _quantize(value):
+    return str(Decimal(value).quantize(Decimal('0.01'))) if value is not None else None
+
+
+def bucket_end(bucket, start):
+    """Inicio del período siguiente al que empieza en `start`."""
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(weeks=1)
+    return (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def series(patient_id, kind, start=None, end=None):
+    """Lecturas de un paciente y medida en el rango [start, end] (usa el índice de la serie)."""
+    queryset = BodyMeasurement.objects.filter(patient_id=patient_id, kind=kind)
+    if start:
+        queryset = queryset.filter(measured_at__gte=start)
+    if end:
+        queryset = queryset.filter(measured_at__lte=end)
+    return queryset.order_by('measured_at')
+
+
+def rollup(patient_id, kind, bucket='week', start=None, end=None):
+    """Un punto por día/semana/mes con promedio, mínimo, máximo y cantidad de lecturas."""
+    rows = (
+        series(patient_id, kind, start, end)
+        .annotate(bucket=BUCKETS[bucket]('measured_at'))
+        .values('bucket')
+        .annotate(avg=Avg('value'), min=Min('value'), max=Max('value'), count=Count('id'))
+        .order_by('bucket')
+    )
+    return [
+        {
+            'bucket': row['bucket'],
+            'avg': _quantize(row['avg']),
+            'min': _quantize(row['min']),
+            'max': _quantize(row['max']),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+
+
+def latest_values(patient_id):
+    """Última lectura de cada medida (2 queries, sin importar cuántas lecturas haya)."""
+    last_dates = (
+        BodyMeasurement.objects.filter(patient_id=patient_id)
+        .values('kind')
+        .annotate(last=Max('measured_at'))
+    )
+    pairs = {(row['kind'], row['last']) for row in last_dates}
+    if not pairs:
+        return {}
+    candidates = BodyMeasurement.objects.filter(
+        patient_id=patient_id, measured_at__in=[last for _, last in pairs],
+    ).order_by('measured_at', 'id')
+    latest = {}
+    for measurement in candidates:
+        if (measurement.kind, measurement.measured_at) in pairs:
+            latest[measurement.kind] = {
+                'value': str(measurement.value),
+                'unit': measurement.unit,
+                'measured_at': measurement.measured_at,
+            }
+    return latest
+
+
+def bmi_trend(patient_id, bucket='week', start=None, end=None):
+    """
+    IMC por período = peso promedio / talla². La talla es la última medida hasta
+    el final del período (o la del perfil si nunca se registró una antes).
+    """
+    weights = rollup(patient_id, 'WEIGHT', bucket, start, end)
+    heights = list(series(patient_id, 'HEIGHT').values_list('measured_at', 'value'))
+    fallback = PatientProfile.objects.filter(user_id=patient_id).values_list('height', flat=True).first()
+
+    trend, position, height = [], 0, fallback
+    for point in weights:
+        end_of_bucket = bucket_end(bucket, point['bucket'])
+        while position < len(heights) and heights[position][0] < end_of_bucket:
+            height = heights[position][1]
+            position += 1
+        if not height:
+            continue
+        meters = Decimal(height) / 100
+        bmi = Decimal(point['avg']) / (meters * meters)
+        trend.append({'bucket': point['bucket'], 'weight': point['avg'], 'height': str(height), 'bmi': _quantize(bmi)})
+    return trend
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:17
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_active_patients(apps, schema_editor):
+    """Inicializa el contador con los expedientes activos que ya existen."""
+    Organization = apps.get_model('users', 'Organization')
+    organizations = Organization.objects.annotate(
+        active=Count('patients', filter=Q(patients__is_active=True))
+    ).only('pk')
+    for organization in organizations.iterator():
+        Organization.objects.filter(pk=organization.pk).update(active_patient_count=organization.active)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_organization_subscription_end_and_more'),
+        ('clinical', '0005_patient_link_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='active_patient_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Pacientes activos'),
+        ),
+        migrations.RunPython(count_active_patients, migrations.RunPython.noop),
+    ]
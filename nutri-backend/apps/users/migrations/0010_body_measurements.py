@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_organization_active_patient_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BodyMeasurement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('WEIGHT', 'Peso'), ('HEIGHT', 'Talla'), ('BODY_FAT', '% Grasa Corporal'), ('WAIST', 'Cintura'), ('HIP', 'Cadera'), ('MUSCLE_MASS', 'Masa Muscular')], max_length=12, verbose_name='Medida')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='Valor')),
+                ('measured_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de la medición')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(limit_choices_to={'role': 'PACIENTE'}, on_delete=django.db.models.deletion.CASCADE, related_name='measurements', to=settings.AUTH_USER_MODEL)),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Medición Corporal',
+                'verbose_name_plural': 'Mediciones Corporales',
+                'ordering': ['measured_at'],
+                'indexes': [models.Index(fields=['patient', 'kind', 'measured_at'], name='users_measurement_series')],
+            },
+        ),
+    ]
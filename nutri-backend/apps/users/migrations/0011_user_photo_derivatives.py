@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_body_measurements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='photo_derivatives',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
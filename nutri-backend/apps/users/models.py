@@ -1,7 +1,19 @@
 import uuid
+from django.core.exceptions import PermissionDenied
 from django.db import models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
+from .tenancy import TenantQuerySet, bump_organization_version
+
+
+class PatientQuotaExceeded(PermissionDenied):
+    """La organización ya usa todos los pacientes activos de su plan (DRF responde 403)."""
+
+# Pacientes activos por plan (ENTERPRISE y cualquier otro: ilimitado)
+PLAN_MAX_PATIENTS = {'STARTER': 10, 'PROFESSIONAL': 30, 'BUSINESS': 100}
+UNLIMITED_PATIENTS = 999999
 
 # ==============================================================================
 # 1. ORGANIZACIÓN (La Entidad que Paga)
@@ -30,6 +42,9 @@ class Organization(models.Model):
     tax_id = models.CharField(max_length=20, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Contador desnormalizado de expedientes activos (lo mantiene ClinicalPatient)
+    active_patient_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Pacientes activos")
+
     def __str__(self):
         return f"{self.name} ({self.get_plan_type_display()})"
 
@@ -43,11 +58,16 @@ class Organization(models.Model):
     @property
     def max_patients(self):
         """Maximum number of active patients allowed per plan"""
-        if self.plan_type == 'STARTER': return 10
-        if self.plan_type == 'PROFESSIONAL': return 30
-        if self.plan_type == 'BUSINESS': return 100
-        # ENTERPRISE is unlimited
-        return 999999 
+        return PLAN_MAX_PATIENTS.get(self.plan_type, UNLIMITED_PATIENTS)
+
+    @staticmethod
+    def max_patients_expression():
+        """max_patients en SQL (CASE plan_type ...), para reservar cupo sin cargar la fila."""
+        return Case(
+            *[When(plan_type=plan, then=Value(limit)) for plan, limit in PLAN_MAX_PATIENTS.items()],
+            default=Value(UNLIMITED_PATIENTS),
+            output_field=IntegerField(),
+        )
 
     @property
     def allows_branding(self):
@@ -71,11 +91,46 @@ class Organization(models.Model):
         if self.plan_type == 'BUSINESS': return 'Email Support'
         return 'Community Support'
 
+    # Cupo de pacientes: un UPDATE condicional por operación, sin COUNT(*)
+    @property
+    def remaining_patient_slots(self):
+        return max(self.max_patients - self.active_patient_count, 0)
+
+    @classmethod
+    def reserve_slots(cls, organization_id, count=1):
+        """
+        Ocupa `count` lugares del cupo de forma atómica: el UPDATE solo aplica si
+        todavía entran, así dos altas simultáneas no pueden pasarse del límite.
+        Solo necesita el id (el límite del plan se evalúa en SQL).
+        """
+        updated = cls.objects.filter(
+            pk=organization_id, active_patient_count__lte=cls.max_patients_expression() - count,
+        ).update(active_patient_count=F('active_patient_count') + count)
+        if not updated:
+            organization = cls.objects.get(pk=organization_id)
+            raise PatientQuotaExceeded(
+                f"Tu plan {organization.get_plan_type_display()} permite hasta {organization.max_patients} pacientes activos."
+            )
+        bump_organization_version(organization_id)
+
+    @classmethod
+    def release_slots(cls, organization_id, count=1):
+        cls.objects.filter(pk=organization_id, active_patient_count__gte=count).update(
+            active_patient_count=F('active_patient_count') - count
+        )
+        bump_organization_version(organization_id)
+
+    def reserve_patient_slots(self, count=1):
+        self.reserve_slots(self.pk, count)
+
+    def release_patient_slots(self, count=1):
+        self.release_slots(self.pk, count)
+
 
 # ==============================================================================
 # 2. GESTOR DE USUARIOS
 # ==============================================================================
-class CustomUserManager(BaseUserManager):
+class CustomUserManager(BaseUserManager.from_queryset(TenantQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('El Email es obligatorio')
@@ -101,6 +156,10 @@ class UserRole(models.TextChoices):
     PROFESSIONAL = 'PROFESSIONAL', 'Nutricionista'
     PACIENTE = 'PACIENTE', 'Paciente'
 
+# Qué perfil lleva cada rol (incluye los nombres viejos que aún puede haber en la BD)
+PROFESSIONAL_PROFILE_ROLES = ('PROFESSIONAL', 'ORG_OWNER', 'NUTRICIONISTA')
+PATIENT_PROFILE_ROLES = ('PATIENT', 'PACIENTE')
+
 class User(AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
@@ -108,6 +167,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     first_name = models.CharField(max_length=150, blank=True, verbose_name="Nombre")
     last_name = models.CharField(max_length=150, blank=True, verbose_name="Apellido")
     photo = models.ImageField(upload_to='users/photos/', null=True, blank=True, verbose_name="Foto de Perfil")
+    # Foto cuyas miniaturas ya están generadas (apps.common.images)
+    photo_derivatives = models.CharField(max_length=100, blank=True, default='', editable=False)
     
     organization = models.ForeignKey(
         Organization, 
@@ -134,6 +195,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
+        indexes = [
+            # Búsqueda de emails sin distinguir mayúsculas (alta masiva)
+            models.Index(Lower('email'), name='users_user_email_lower'),
+        ]
 
     def __str__(self):
         return f"{self.email} ({self.role})"
@@ -147,10 +212,56 @@ class User(AbstractBaseUser, PermissionsMixin):
         super().save(*args, **kwargs)
 
 
+# ==============================================================================
+# PERFILES: BASE CON SEGUIMIENTO DE CAMBIOS
+# ==============================================================================
+class TrackedProfile(models.Model):
+    """
+    Recuerda los valores leídos de la BD para que `changed_fields()` diga qué se
+    modificó en memoria; así guardar el usuario solo escribe el perfil si hace falta.
+    """
+    UNTRACKED_FIELDS = {'id', 'user', 'created_at', 'updated_at'}
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def tracked_fields(cls):
+        return [field for field in cls._meta.concrete_fields if field.name not in cls.UNTRACKED_FIELDS]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_persisted()
+        return instance
+
+    def _remember_persisted(self, update_fields=None):
+        # Solo lo cargado (only/defer dejan campos afuera y esos no cuentan como cambios)
+        persisted = getattr(self, '_persisted_values', None) if update_fields is not None else None
+        self._persisted_values = persisted or {}
+        for field in self.tracked_fields():
+            if field.attname in self.__dict__ and (update_fields is None or field.name in update_fields):
+                self._persisted_values[field.attname] = self.__dict__[field.attname]
+
+    def changed_fields(self):
+        """Campos modificados desde la lectura o el último save (todos si nunca se guardó)."""
+        persisted = getattr(self, '_persisted_values', None)
+        if persisted is None:
+            return [field.name for field in self.tracked_fields()]
+        return [
+            field.name for field in self.tracked_fields()
+            if field.attname in persisted and getattr(self, field.attname) != persisted[field.attname]
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_persisted(kwargs.get('update_fields'))
+
+
 # ==============================================================================
 # 4. PERFIL PROFESIONAL
 # ==============================================================================
-class ProfessionalProfile(models.Model):
+class ProfessionalProfile(TrackedProfile):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='professional_profile')
     license_number = models.CharField(max_length=50, blank=True)
     bio = models.TextField(blank=True)
@@ -169,7 +280,7 @@ class ProfessionalProfile(models.Model):
 # ==============================================================================
 # 5. PERFIL PACIENTE
 # ==============================================================================
-class PatientProfile(models.Model):
+class PatientProfile(TrackedProfile):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_profile')
     date_of_birth = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=20, choices=[('M', 'M'), ('F', 'F'), ('O', 'Otro')], blank=True)
@@ -182,4 +293,69 @@ class PatientProfile(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Perfil App: {self.user.email}"
\ No newline at end of file
+        return f"Perfil App: {self.user.email}"
+
+
+def profile_model_for(role):
+    """Modelo de perfil que corresponde a `role` (None para ADMIN)."""
+    if role in PROFESSIONAL_PROFILE_ROLES:
+        return ProfessionalProfile
+    if role in PATIENT_PROFILE_ROLES:
+        return PatientProfile
+    return None
+
+# ==============================================================================
+# 6. MEDICIONES ANTROPOMÉTRICAS (Serie de tiempo, solo inserción)
+# ==============================================================================
+class BodyMeasurement(models.Model):
+    """
+    Una lectura (peso, talla, % grasa, cintura...) en un momento dado.
+    Nunca se edita: las correcciones son lecturas nuevas, así se conserva la historia
+    para los gráficos de progreso. El último peso/talla se copia en PatientProfile.
+    """
+    KINDS = [
+        ('WEIGHT', 'Peso'),
+        ('HEIGHT', 'Talla'),
+        ('BODY_FAT', '% Grasa Corporal'),
+        ('WAIST', 'Cintura'),
+        ('HIP', 'Cadera'),
+        ('MUSCLE_MASS', 'Masa Muscular'),
+    ]
+    UNITS = {'WEIGHT': 'kg', 'HEIGHT': 'cm', 'BODY_FAT': '%', 'WAIST': 'cm', 'HIP': 'cm', 'MUSCLE_MASS': 'kg'}
+
+    id = models.BigAutoField(primary_key=True)
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='measurements', limit_choices_to={'role': 'PACIENTE'})
+    kind = models.CharField(max_length=12, choices=KINDS, verbose_name="Medida")
+    value = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Valor")
+    measured_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha de la medición")
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Medición Corporal"
+        verbose_name_plural = "Mediciones Corporales"
+        ordering = ['measured_at']
+        indexes = [
+            # Rangos por paciente y medida: WHERE patient = ? AND kind = ? AND measured_at BETWEEN ...
+            models.Index(fields=['patient', 'kind', 'measured_at'], name='users_measurement_series'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient.email} {self.kind}={self.value}{self.unit} ({self.measured_at:%Y-%m-%d})"
+
+    @property
+    def unit(self):
+        return self.UNITS[self.kind]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Las mediciones no se editan: registra una nueva lectura.")
+        super().save(*args, **kwargs)
+
+        # Si es la lectura más reciente de peso/talla, actualiza el perfil (valor "actual")
+        field = {'WEIGHT': 'weight', 'HEIGHT': 'height'}.get(self.kind)
+        newer = BodyMeasurement.objects.filter(
+            patient_id=self.patient_id, kind=self.kind, measured_at__gt=self.measured_at,
+        )
+        if field and not newer.exists():
+            PatientProfile.objects.filter(user_id=self.patient_id).update(**{field: self.value})
@@ -0,0 +1,178 @@
+"""
+Alta masiva de usuarios (profesionales y pacientes de una clínica).
+
+Crear usuario por usuario dispara en cascada las señales de post_save (perfil,
+caché, miniaturas): varias queries por fila. Aquí cada lote:
+  1. normaliza (emails en minúsculas) y valida todas las filas en una pasada,
+     contraseñas incluidas (AUTH_PASSWORD_VALIDATORS),
+  2. descarta los emails que ya existen con una sola query (sin distinguir mayúsculas),
+  3. inserta usuarios, perfiles profesionales y perfiles de paciente con tres
+     bulk_create (los ids UUID se generan en Python, no hace falta leerlos de vuelta).
+
+bulk_create no emite señales: los perfiles se crean aquí mismo, los usuarios nuevos
+aún no tienen entradas en caché que invalidar y `reconcile_patient_links` vincula
+a los pacientes con sus expedientes como a cualquier registro nuevo.
+
+Sin contraseña en la fila, el usuario queda con contraseña inutilizable (debe
+restablecerla). Con contraseña, el hash se calcula en el mismo lote, antes del
+INSERT: un usuario reportado como creado siempre puede entrar. El hash es el costo
+dominante de cada fila; settings.PROVISIONING_PASSWORD_HASHER permite usar un
+algoritmo más barato para el alta (Django lo rehace con el preferido en el primer login).
+
+Devuelve un reporte por fila: {'row', 'status', 'id', 'email', 'errors'}.
+"""
+import logging
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from apps.common.text import normalize_text
+from .models import User, UserRole, profile_model_for
+
+logger = logging.getLogger(__name__)
+
+# Encabezados aceptados (ya normalizados: minúsculas y sin tildes)
+COLUMN_ALIASES = {
+    'email': ['email', 'e mail', 'correo', 'correo electronico'],
+    'first_name': ['first name', 'nombre', 'nombres'],
+    'last_name': ['last name', 'apellido', 'apellidos'],
+    'role': ['role', 'rol'],
+    'password': ['password', 'contrasena', 'clave'],
+}
+MAX_LENGTHS = {field: User._meta.get_field(field).max_length for field in ('email', 'first_name', 'last_name')}
+
+# Roles que puede dar de alta cada quien (los ADMIN se crean con createsuperuser)
+PROVISIONABLE_ROLES = {
+    UserRole.ADMIN: [UserRole.ORG_OWNER, UserRole.PROFESSIONAL, UserRole.PACIENTE],
+    UserRole.ORG_OWNER: [UserRole.PROFESSIONAL, UserRole.PACIENTE],
+}
+
+STATUS_CREATED = 'created'
+STATUS_SKIPPED = 'skipped'
+STATUS_ERROR = 'error'
+
+
+def resolve_columns(header):
+    normalized = {normalize_text(column): column for column in header}
+    columns = {
+        field: next((normalized[alias] for alias in aliases if alias in normalized), None)
+        for field, aliases in COLUMN_ALIASES.items()
+    }
+    if not columns['email']:
+        raise ValueError("Falta la columna obligatoria: email.")
+    return columns
+
+
+def provision_users(organization, rows, roles=None, default_role=UserRole.PACIENTE, dry_run=False, batch_size=500):
+    """
+    Crea los usuarios de `rows` (iterable de dicts) en `organization` (o sin clínica si es None).
+    `roles` limita los roles permitidos; las filas sin rol usan `default_role`.
+    Devuelve {'created', 'skipped', 'errors', 'dry_run', 'rows': [reporte por fila]}.
+    """
+    roles = [str(role) for role in (roles or PROVISIONABLE_ROLES[UserRole.ADMIN])]
+    report = []
+    columns = None
+    batch = []
+    seen_emails = set()
+
+    for row_number, record in enumerate(rows, start=2):  # La fila 1 es el encabezado
+        if columns is None:
+            columns = resolve_columns(record.keys())
+        values = {
+            field: str(record.get(column) or '').strip() if column else ''
+            for field, column in columns.items()
+        }
+        values['email'] = values['email'].lower()
+        values['role'] = values['role'].upper() or str(default_role)
+
+        errors = []
+        try:
+            validate_email(values['email'])
+        except ValidationError:
+            errors.append(f"Email inválido: {values['email'] or '(vacío)'}")
+        if values['email'] in seen_emails:
+            errors.append(f"Email repetido en el archivo: {values['email']}")
+        seen_emails.add(values['email'])
+        for field, max_length in MAX_LENGTHS.items():
+            if len(values[field]) > max_length:
+                errors.append(f"'{field}' supera {max_length} caracteres.")
+        if values['role'] not in roles:
+            errors.append(f"Rol no permitido: {values['role']} (usa {', '.join(roles)}).")
+        if values['password']:
+            try:
+                # Los validadores de similitud comparan con email y nombre
+                validate_password(values['password'], User(**{field: values[field] for field in ('email', 'first_name', 'last_name')}))
+            except ValidationError as exc:
+                errors.extend(exc.messages)
+
+        entry = {'row': row_number, 'status': STATUS_ERROR if errors else None, 'id': None, 'email': values['email'], 'errors': errors}
+        report.append(entry)
+        if not errors:
+            batch.append((entry, values))
+        if len(batch) >= batch_size:
+            _flush(organization, batch, dry_run)
+            batch = []
+
+    if batch:
+        _flush(organization, batch, dry_run)
+
+    summary = {
+        'created': sum(entry['status'] == STATUS_CREATED for entry in report),
+        'skipped': sum(entry['status'] == STATUS_SKIPPED for entry in report),
+        'errors': sum(entry['status'] == STATUS_ERROR for entry in report),
+        'dry_run': dry_run,
+    }
+    logger.info("Alta masiva de usuarios en %s: %s", organization.pk if organization else None, summary)
+    return {**summary, 'rows': report}
+
+
+def _flush(organization, batch, dry_run):
+    """Descarta emails existentes con una query e inserta usuarios y perfiles con tres bulk_create."""
+    existing = set(
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=[values['email'] for _, values in batch])
+        .values_list('email_lower', flat=True)
+    )
+
+    users = []
+    hasher = getattr(settings, 'PROVISIONING_PASSWORD_HASHER', 'default')
+    for entry, values in batch:
+        if values['email'] in existing:
+            entry['status'] = STATUS_SKIPPED
+            entry['errors'].append("Ya existe un usuario con este email.")
+            continue
+        user = User(
+            email=values['email'],
+            first_name=values['first_name'],
+            last_name=values['last_name'],
+            role=values['role'],
+            organization=organization,
+        )
+        # En dry-run no se calcula ningún hash (ya se validaron las contraseñas)
+        if not dry_run:
+            user.password = make_password(values['password'] or None, hasher=hasher)
+        entry['status'] = STATUS_CREATED
+        entry['id'] = str(user.pk)
+        users.append((entry, user))
+    if not users or dry_run:
+        return
+
+    profiles = {}
+    for _, user in users:
+        profile_model = profile_model_for(user.role)
+        if profile_model is not None:
+            profiles.setdefault(profile_model, []).append(profile_model(user=user))
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in users])
+            for profile_model, instances in profiles.items():
+                profile_model.objects.bulk_create(instances)
+    except IntegrityError:
+        # Otra alta simultánea registró alguno de los emails entre la lectura y el INSERT
+        for entry, _ in users:
+            entry.update(status=STATUS_ERROR, id=None)
+            entry['errors'].append("No se pudo crear el lote: algún email se registró mientras tanto. Reintenta.")
@@ -0,0 +1,203 @@
+"""
+Revocación de refresh tokens rotados (reemplaza a rest_framework_simplejwt.token_blacklist).
+
+Cada refresh rota el token: el anterior se revoca hasta su vencimiento (claim `exp`,
+o sea iat + REFRESH_TOKEN_LIFETIME) y después se olvida solo. El store se elige en
+settings.TOKEN_REVOCATION_STORE:
+
+  - LocalRevocationStore: memoria del proceso, opcionalmente persistida en un
+    archivo (un nodo, desarrollo y pruebas). Escrituras y compactación toman un
+    flock sobre `<archivo>.lock`, así ningún proceso escribe en un archivo ya reemplazado.
+  - CacheRevocationStore: una clave por jti en la caché compartida (Redis) con TTL
+    igual a la vida restante del token.
+
+`revoke_if_absent()` revoca y responde si el jti ya estaba revocado en una sola
+operación atómica (cache.add / chequeo y escritura bajo el lock): dos refresh
+simultáneos con el mismo token no pueden rotarlo los dos. Con rotación, esa es la
+única consulta del refresh: revisar antes un filtro (p.ej. de Bloom) no ahorra el
+viaje a la caché, porque el token igual hay que reclamarlo.
+
+`compact()` descarta lo vencido (comando compact_revoked_tokens).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.settings import api_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, el archivo solo es seguro con un proceso
+    fcntl = None
+
+_store = None
+
+
+class BaseRevocationStore:
+    def revoke(self, jti, expires_at):
+        """Revoca `jti` hasta `expires_at` (timestamp unix)."""
+        raise NotImplementedError
+
+    def revoke_if_absent(self, jti, expires_at):
+        """Revoca `jti` si no lo estaba; False si ya estaba revocado (atómico)."""
+        raise NotImplementedError
+
+    def is_revoked(self, jti):
+        raise NotImplementedError
+
+    def compact(self):
+        """Descarta entradas vencidas; devuelve cuántas quedan (o None si el backend expira solo)."""
+        return None
+
+    def _token_expiry(self, token):
+        return token.get('exp', time.time() + api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+    def revoke_token(self, token):
+        self.revoke(token[api_settings.JTI_CLAIM], self._token_expiry(token))
+
+    def revoke_token_if_absent(self, token):
+        return self.revoke_if_absent(token[api_settings.JTI_CLAIM], self._token_expiry(token))
+
+    def is_token_revoked(self, token):
+        return self.is_revoked(token[api_settings.JTI_CLAIM])
+
+
+class LocalRevocationStore(BaseRevocationStore):
+    """
+    Memoria del proceso + archivo opcional (`path`) con una línea "jti<TAB>exp" por revocación.
+    Con archivo, varios procesos del mismo nodo comparten las revocaciones: cada consulta
+    lee solo las líneas nuevas (un stat por consulta).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset()
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._sync()
+
+    def _reset(self):
+        self.entries = {}
+        self.offset = 0
+        self.inode = None
+
+    @contextmanager
+    def _locked(self):
+        """Lock del proceso y, con archivo, flock exclusivo entre procesos (append y compactación)."""
+        with self.lock:
+            if not self.path:
+                yield
+                return
+            with open(f'{self.path}.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Carga las revocaciones que otros procesos agregaron al archivo."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self._reset()  # El archivo se compactó (es otro archivo): recargamos todo
+            self.inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return
+        with open(self.path, 'rb') as fp:
+            fp.seek(self.offset)
+            data = fp.read()
+        complete = data[:data.rfind(b'\n') + 1]  # Una línea a medio escribir se lee la próxima vez
+        self.offset += len(complete)
+        for line in complete.decode().splitlines():
+            jti, _, expires_at = line.partition('\t')
+            if jti:
+                self.entries[jti] = float(expires_at or 0)
+
+    def _revoked(self, jti):
+        expires_at = self.entries.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def _append(self, jti, expires_at):
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as fp:
+                fp.write(f'{jti}\t{expires_at}\n')
+            self._sync()
+        else:
+            self.entries[jti] = expires_at
+
+    def revoke(self, jti, expires_at):
+        with self._locked():
+            self._append(jti, expires_at)
+
+    def revoke_if_absent(self, jti, expires_at):
+        with self._locked():
+            if self._revoked(jti):
+                return False
+            self._append(jti, expires_at)
+            return True
+
+    def is_revoked(self, jti):
+        with self.lock:
+            if self.path:
+                self._sync()
+            return self._revoked(jti)
+
+    def compact(self):
+        with self._locked():
+            now = time.time()
+            alive = {jti: expires_at for jti, expires_at in self.entries.items() if expires_at > now}
+            if self.path:
+                # Archivo nuevo + rename atómico: los demás procesos lo detectan por el inode
+                temporary = f'{self.path}.{os.getpid()}.tmp'
+                with open(temporary, 'w', encoding='utf-8') as fp:
+                    fp.writelines(f'{jti}\t{expires_at}\n' for jti, expires_at in alive.items())
+                os.replace(temporary, self.path)
+                self._sync()
+            else:
+                self.entries = alive
+            return len(alive)
+
+
+class CacheRevocationStore(BaseRevocationStore):
+    """Una clave por jti en la caché compartida; el TTL la borra al vencer el token."""
+    key_prefix = 'users:revoked-token:'
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def _ttl(self, expires_at):
+        return int(expires_at - time.time()) + 1
+
+    def revoke(self, jti, expires_at):
+        ttl = self._ttl(expires_at)
+        if ttl > 0:
+            self.cache.set(f'{self.key_prefix}{jti}', 1, ttl)
+
+    def revoke_if_absent(self, jti, expires_at):
+        ttl = self._ttl(expires_at)
+        if ttl <= 0:
+            return True  # Ya vencido: no hay nada que proteger
+        return self.cache.add(f'{self.key_prefix}{jti}', 1, ttl)
+
+    def is_revoked(self, jti):
+        return self.cache.get(f'{self.key_prefix}{jti}') is not None
+
+
+def get_revocation_store():
+    """Store configurado en settings.TOKEN_REVOCATION_STORE (uno por proceso)."""
+    global _store
+    if _store is None:
+        config = getattr(settings, 'TOKEN_REVOCATION_STORE', {})
+        backend = import_string(config.get('BACKEND', 'apps.users.revocation.LocalRevocationStore'))
+        _store = backend(**config.get('OPTIONS', {}))
+    return _store
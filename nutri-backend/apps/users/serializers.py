@@ -1,5 +1,12 @@
 from rest_framework import serializers
-from .models import User, Organization, ProfessionalProfile, PatientProfile
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from apps.common.fields import ImageDerivativeField
+from .authentication import CachedJWTAuthentication
+from .revocation import get_revocation_store
+from .tokens import set_tenant_claims
+from .models import User, Organization, ProfessionalProfile, PatientProfile, BodyMeasurement
 
 # Organization serializer with subscription and plan features
 class OrganizationSerializer(serializers.ModelSerializer):
@@ -19,6 +26,8 @@ class OrganizationSerializer(serializers.ModelSerializer):
             
             # 👇 AQUI LA MAGIA: Exponemos las reglas de negocio al Frontend
             'max_patients', 
+            'active_patient_count',     # Uso actual del cupo (contador desnormalizado)
+            'remaining_patient_slots',
             'allows_branding', 
             'allows_marketplace',
             'allows_shopping_list',
@@ -45,6 +54,10 @@ class UserSerializer(serializers.ModelSerializer):
     professional_profile = ProfessionalProfileSerializer(read_only=True)
     patient_profile = PatientProfileSerializer(read_only=True)
 
+    # Miniaturas de la foto de perfil
+    photo_avatar = ImageDerivativeField(size='avatar', source='photo')
+    photo_medium = ImageDerivativeField(size='medium', source='photo')
+
     class Meta:
         model = User
         fields = [
@@ -54,10 +67,56 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name', 
             'role', 
             'photo',
+            'photo_avatar',
+            'photo_medium',
             'is_active',
             'organization',
             'organization_data',
             'professional_profile', 
             'patient_profile'
         ]
-        read_only_fields = ['id', 'email', 'role', 'organization_data']
\ No newline at end of file
+        read_only_fields = ['id', 'email', 'role', 'organization_data']
+
+# Body measurement serializer (append-only time series)
+class BodyMeasurementSerializer(serializers.ModelSerializer):
+    unit = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = BodyMeasurement
+        fields = ['id', 'patient', 'kind', 'value', 'unit', 'measured_at', 'recorded_by', 'created_at']
+        read_only_fields = ['id', 'recorded_by', 'created_at']
+        extra_kwargs = {'patient': {'required': False}}
+
+    def validate_value(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("El valor debe ser mayor que cero.")
+        return value
+
+# Tokens JWT con claims de rol, organización y plan (ver tokens.py)
+class TenantTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return set_tenant_claims(super().get_token(user), user)
+
+class TenantTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Al refrescar (y rotar) se vuelven a leer rol, organización y plan del usuario,
+    así un cambio hecho después del login llega en el próximo access token.
+    Un refresh ya rotado queda revocado (revocation.py) y no se puede reutilizar.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        store = get_revocation_store()
+        rotating = api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION
+        if not rotating and store.is_token_revoked(refresh):
+            raise InvalidToken("El token ya fue usado o revocado.", code='token_revoked')
+        if api_settings.USER_ID_CLAIM not in refresh:
+            raise AuthenticationFailed("El token no identifica a ningún usuario.", code='user_not_found')
+        user = CachedJWTAuthentication().get_cached_user(refresh)
+        # Revocar y comprobar en una sola operación: de dos refresh simultáneos, solo uno rota
+        if rotating and not store.revoke_token_if_absent(refresh):
+            raise InvalidToken("El token ya fue usado o revocado.", code='token_revoked')
+        set_tenant_claims(refresh, user)
+        # Mismo jti y vencimiento; la rotación (si está activa) la hace la clase base
+        return super().validate({**attrs, 'refresh': str(refresh)})
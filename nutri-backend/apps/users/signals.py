@@ -1,6 +1,12 @@
-from django.db.models.signals import post_save
+import logging
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import User, ProfessionalProfile, PatientProfile
+from apps.common.images import refresh_derivatives
+from .authentication import bump_user_version, flag_inactive_user
+from .models import BodyMeasurement, Organization, PatientProfile, ProfessionalProfile, User, profile_model_for
+from .tenancy import bump_organization_version
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -8,30 +14,82 @@ def create_user_profile(sender, instance, created, **kwargs):
     Automatización: Crea el perfil vacío correspondiente apenas se registra el usuario.
     """
     if created:
-        # Rol Profesional o Dueño -> Perfil Profesional
-        if instance.role in ['PROFESSIONAL', 'ORG_OWNER', 'NUTRICIONISTA']:
-            ProfessionalProfile.objects.create(user=instance)
-            print(f"Professional profile created for {instance.email}")
-            
-        # Rol Paciente -> Perfil Médico
-        elif instance.role in ['PATIENT', 'PACIENTE']:
-            PatientProfile.objects.create(user=instance)
-            print(f"Patient profile created for {instance.email}")
+        # Profesional o Dueño -> Perfil Profesional | Paciente -> Perfil Médico
+        profile_model = profile_model_for(instance.role)
+        if profile_model is not None:
+            profile_model.objects.create(user=instance)
+            logger.info("%s created for %s", profile_model.__name__, instance.email)
+
+@receiver(post_save, sender=User)
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Guarda los datos anidados si se actualiza el usuario padre, pero solo lo que cambió:
+    un save que no toca el perfil (p.ej. last_login al hacer login) no escribe nada.
+    """
+    profile_model = profile_model_for(instance.role)
+    if created or profile_model is None:
+        return
+
+    accessor = profile_model._meta.get_field('user').related_query_name()
+    descriptor = getattr(User, accessor)
+    if descriptor.is_cached(instance):
+        # Perfil ya cargado en la instancia: UPDATE solo de los campos modificados
+        profile = descriptor.related.get_cached_value(instance)
+        if profile is not None:
+            changed = profile.changed_fields()
+            if changed:
+                profile.save(update_fields=[*changed, 'updated_at'])
+            return
+
+    # Perfil no cargado: que exista el del rol actual (cambió el rol o falta el perfil).
+    # Un save parcial que no toca el rol (update_last_login) no paga esa consulta
+    if update_fields is not None and 'role' not in update_fields:
+        return
+    profile_model.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=User)
+def generate_photo_derivatives(sender, instance, update_fields=None, **kwargs):
+    """
+    Foto de perfil nueva -> miniaturas en segundo plano (al confirmar la transacción);
+    las de la foto anterior se borran.
+    """
+    if update_fields is not None and 'photo' not in update_fields:
+        return
+    refresh_derivatives(instance)
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_cached_organization(sender, instance, **kwargs):
+    """
+    Cambió el plan, la vigencia o los datos de la clínica -> nueva versión en caché.
+    """
+    bump_organization_version(instance.pk)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """
-    Guarda los datos anidados si se actualiza el usuario padre.
-    """
-    # Clean up related profile when user is deleted
-    if instance.role in ['PROFESSIONAL', 'ORG_OWNER', 'NUTRICIONISTA']:
-        try:
-            instance.professional_profile.save()
-        except ProfessionalProfile.DoesNotExist:
-            ProfessionalProfile.objects.create(user=instance)
-            
-    elif instance.role in ['PATIENT', 'PACIENTE']:
-        try:
-            instance.patient_profile.save()
-        except PatientProfile.DoesNotExist:
-            PatientProfile.objects.create(user=instance)
\ No newline at end of file
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, signal, **kwargs):
+    """
+    Cambió el usuario (rol, organización, contraseña, is_active...) -> nueva versión
+    para CachedJWTAuthentication. Desactivado o borrado -> marca que rechaza al
+    momento sus access tokens con claims (que no leen la entrada del usuario).
+    """
+    bump_user_version(instance.pk)
+    flag_inactive_user(instance.pk, signal is post_delete or not instance.is_active)
+
+@receiver(post_save, sender=ProfessionalProfile)
+@receiver(post_delete, sender=ProfessionalProfile)
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_delete, sender=PatientProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    """
+    El perfil es parte del documento de /users/me/ -> nueva versión del usuario.
+    """
+    bump_user_version(instance.user_id)
+
+@receiver(post_save, sender=BodyMeasurement)
+def invalidate_profile_measurements(sender, instance, created, **kwargs):
+    """
+    Peso o talla nuevos se copian al perfil con un UPDATE directo (sin señales).
+    """
+    if instance.kind in ('WEIGHT', 'HEIGHT'):
+        bump_user_version(instance.patient_id)
@@ -0,0 +1,185 @@
+"""
+Contexto de tenant (organización) por request.
+
+`TenantMiddleware` deja en cada request un `TenantContext` (request.tenant) que
+resuelve una sola vez el usuario, su rol y su organización. La organización y los
+derechos de su plan (max_patients, allows_*) se leen de la caché compartida con
+claves versionadas: guardar la organización o mover su cupo asigna una versión
+nueva y las entradas viejas simplemente dejan de leerse.
+
+Los modelos multi-tenant usan `TenantQuerySet`:
+    ClinicalPatient.objects.for_tenant()  ->  WHERE organization_id = <org del request>
+El filtro solo necesita `user.organization_id` (ya viene en la fila del usuario
+o en los claims del token), así que no agrega queries.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.cache import cache
+from django.db import models, transaction
+
+ORGANIZATION_VERSION_KEY = 'users:organization-version:{organization_id}'
+ORGANIZATION_KEY = 'users:organization:{organization_id}:{version}'
+ORGANIZATION_TIMEOUT = 60 * 60 * 24  # Red de seguridad; la invalidación es por versión
+
+# Derechos del plan que se cachean junto a la organización
+ENTITLEMENT_FIELDS = [
+    'plan_type',
+    'max_patients',
+    'allows_branding',
+    'allows_marketplace',
+    'allows_shopping_list',
+    'support_level',
+]
+
+_current_tenant = ContextVar('current_tenant', default=None)
+
+
+# ==============================================================================
+# CACHÉ DE ORGANIZACIONES
+# ==============================================================================
+def get_organization_version(organization_id):
+    """Versión actual; si la clave no existe se crea una nueva (nunca se reutiliza una anterior)."""
+    key = ORGANIZATION_VERSION_KEY.format(organization_id=organization_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_organization_version(organization_id):
+    """Invalida la organización en caché (al confirmar la transacción en curso)."""
+    key = ORGANIZATION_VERSION_KEY.format(organization_id=organization_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def entitlements_for(organization):
+    return {field: getattr(organization, field) for field in ENTITLEMENT_FIELDS}
+
+
+def get_cached_organization(organization_id):
+    """
+    Devuelve {'organization': Organization, 'entitlements': dict} o None si no existe.
+    Con la caché caliente no toca la BD.
+    """
+    from .models import Organization
+
+    key = ORGANIZATION_KEY.format(organization_id=organization_id, version=get_organization_version(organization_id))
+    entry = cache.get(key)
+    if entry is None:
+        organization = Organization.objects.filter(pk=organization_id).first()
+        if organization is None:
+            return None
+        entry = {'organization': organization, 'entitlements': entitlements_for(organization)}
+        cache.set(key, entry, ORGANIZATION_TIMEOUT)
+    return entry
+
+
+# ==============================================================================
+# CONTEXTO DEL REQUEST
+# ==============================================================================
+class TenantContext:
+    """
+    Tenant del request, resuelto de forma perezosa: el middleware corre antes de que
+    DRF autentique (JWT), así que el usuario se lee recién cuando la vista lo pide.
+    """
+
+    def __init__(self, request=None, user=None):
+        self._request = request
+        self._user = user
+        self._entry = None
+
+    @property
+    def user(self):
+        if self._user is None and self._request is not None:
+            user = getattr(self._request, 'user', None)
+            if user is None or not user.is_authenticated:
+                return None
+            self._user = user
+        return self._user
+
+    @property
+    def role(self):
+        return self.user.role if self.user else None
+
+    @property
+    def organization_id(self):
+        return self.user.organization_id if self.user else None
+
+    @property
+    def from_token(self):
+        """True si rol y organización salen de los claims del token (TokenTenantUser)."""
+        from .tokens import TokenTenantUser
+        return isinstance(self.user, TokenTenantUser)
+
+    def _load(self):
+        if self._entry is None and self.organization_id:
+            self._entry = get_cached_organization(self.organization_id)
+            # Así user.organization tampoco dispara una query en serializers/vistas
+            # (un TokenTenantUser lo hace él mismo si llega a cargar el modelo)
+            if self._entry is not None and not self.from_token:
+                self.user._meta.get_field('organization').set_cached_value(self.user, self._entry['organization'])
+        return self._entry
+
+    @property
+    def organization(self):
+        entry = self._load()
+        return entry['organization'] if entry else None
+
+    @property
+    def entitlements(self):
+        # Si el token ya trae los derechos del plan (claims), no hace falta la caché
+        if self.from_token and self.user.entitlements:
+            return self.user.entitlements
+        entry = self._load()
+        return entry['entitlements'] if entry else {}
+
+
+def get_current_tenant():
+    """Tenant del request en curso (None fuera de un request, p.ej. comandos)."""
+    return _current_tenant.get()
+
+
+@contextmanager
+def use_tenant(user):
+    """Fija el tenant a mano (comandos, jobs, shell): `with use_tenant(owner): ...`."""
+    token = _current_tenant.set(TenantContext(user=user))
+    try:
+        yield _current_tenant.get()
+    finally:
+        _current_tenant.reset(token)
+
+
+class TenantMiddleware:
+    """Crea el TenantContext del request y lo publica para los managers (`for_tenant`)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = TenantContext(request)
+        token = _current_tenant.set(request.tenant)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_tenant.reset(token)
+
+
+# ==============================================================================
+# QUERYSETS MULTI-TENANT
+# ==============================================================================
+class TenantQuerySet(models.QuerySet):
+    """
+    `for_tenant()` filtra por la organización del tenant actual.
+    `tenant_field` es la ruta hasta la FK de organización (p.ej. 'professional__organization').
+    Sin tenant u organización devuelve un queryset vacío (nunca "todo").
+    """
+    tenant_field = 'organization'
+
+    def for_tenant(self, tenant=None):
+        tenant = tenant or get_current_tenant()
+        organization_id = tenant.organization_id if tenant else None
+        if not organization_id:
+            return self.none()
+        return self.filter(**{f'{self.tenant_field}_id': organization_id})
@@ -0,0 +1,339 @@
+import io
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from apps.clinical.models import ClinicalPatient
+from apps.common.images import build_derivatives, derivative_name
+from .authentication import AUTH_USER_FIELDS, AUTH_USER_KEY, CACHED_USER_FIELDS, CachedJWTAuthentication, get_user_version
+from .models import BodyMeasurement, Organization, PatientProfile, User
+from .revocation import CacheRevocationStore, LocalRevocationStore
+from .serializers import TenantTokenObtainPairSerializer
+from .tenancy import TenantMiddleware, get_cached_organization, get_current_tenant, use_tenant
+
+
+class UsersTestCase(APITestCase):
+    """Clínica con su dueño, un profesional, un paciente y un admin de plataforma."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name="Clínica Test", slug='clinica-test', plan_type='BUSINESS')
+        cls.owner = User.objects.create_user('owner@test.com', 'x', role='ORG_OWNER', organization=cls.organization)
+        cls.professional = User.objects.create_user(
+            'pro@test.com', 'x', role='PROFESSIONAL', organization=cls.organization,
+        )
+        cls.patient = User.objects.create_user('paciente@test.com', 'x', role='PACIENTE')
+        cls.admin = User.objects.create_user('admin@test.com', 'x', role='ADMIN')
+
+    def setUp(self):
+        cache.clear()
+
+
+class MeasurementQueryTests(UsersTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def measure(self, kind, value, *moment):
+        return BodyMeasurement.objects.create(
+            patient=self.patient, kind=kind, value=value, measured_at=timezone.make_aware(datetime(*moment)),
+        )
+
+    def test_malformed_patient_id_is_a_bad_request(self):
+        response = self.client.get('/api/measurements/latest/', {'patient': 'no-es-un-uuid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_impossible_dates_are_a_bad_request(self):
+        for value in ['2024-02-30', '2024-13-01T10:00:00', 'ayer']:
+            with self.subTest(value=value):
+                response = self.client.get('/api/measurements/', {'patient': self.patient.pk, 'from': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_bmi_uses_the_height_measured_within_the_bucket(self):
+        # Semana del lunes 6 de mayo: talla el miércoles, peso el jueves
+        self.measure('HEIGHT', '170', 2024, 5, 8, 9)
+        self.measure('WEIGHT', '72.25', 2024, 5, 9, 9)
+        self.measure('HEIGHT', '180', 2024, 5, 14, 9)  # Semana siguiente: no aplica a la primera
+        self.measure('WEIGHT', '81', 2024, 5, 15, 9)
+
+        response = self.client.get('/api/measurements/bmi/', {'patient': self.patient.pk, 'bucket': 'week'})
+        points = response.json()['points']
+        self.assertEqual([point['height'] for point in points], ['170.00', '180.00'])
+        self.assertEqual([point['bmi'] for point in points], ['25.00', '25.00'])
+
+
+
+class TenantMiddlewareTests(UsersTestCase):
+    """El tenant se resuelve una vez por request y su organización sale de la caché versionada."""
+
+    def run_request(self, user):
+        seen = []
+
+        def view(request):
+            tenant = get_current_tenant()
+            for _ in range(3):  # Vistas, serializers y permisos lo piden varias veces
+                seen.append((tenant.organization.pk, tenant.entitlements['max_patients'], request.user.organization.name))
+            return HttpResponse()
+
+        request = APIRequestFactory().get('/')
+        request.user = user
+        TenantMiddleware(view)(request)
+        return seen
+
+    def test_organization_is_loaded_once_and_then_served_from_cache(self):
+        owner = User.objects.get(pk=self.owner.pk)
+        with self.assertNumQueries(1):
+            seen = self.run_request(owner)
+        self.assertEqual(set(seen), {(self.organization.pk, 100, "Clínica Test")})
+        # Otro request (otra instancia del usuario): la organización ya no va a la BD
+        owner = User.objects.get(pk=self.owner.pk)
+        with self.assertNumQueries(0):
+            self.run_request(owner)
+
+    def test_organization_and_plan_changes_invalidate_the_cache(self):
+        self.assertEqual(get_cached_organization(self.organization.pk)['entitlements']['max_patients'], 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.plan_type = 'STARTER'
+            self.organization.name = "Clínica Renombrada"
+            self.organization.save()
+        entry = get_cached_organization(self.organization.pk)
+        self.assertEqual((entry['organization'].name, entry['entitlements']['plan_type']), ("Clínica Renombrada", 'STARTER'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Organization.reserve_slots(self.organization.pk, 3)
+        self.assertEqual(get_cached_organization(self.organization.pk)['organization'].active_patient_count, 3)
+
+    def test_for_tenant_scopes_org_owners_to_their_clinic(self):
+        other = Organization.objects.create(name="Otra Clínica", slug='otra-clinica', plan_type='BUSINESS')
+        own = ClinicalPatient.objects.create(organization=self.organization, first_name="Ana", last_name="Paz")
+        ClinicalPatient.objects.create(organization=other, first_name="Luis", last_name="Soto")
+
+        with use_tenant(self.owner):
+            self.assertEqual(list(ClinicalPatient.objects.for_tenant()), [own])
+        with use_tenant(self.patient):  # Sin organización: nada, nunca "todo"
+            self.assertFalse(ClinicalPatient.objects.for_tenant().exists())
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get('/api/clinical/patients/')
+        self.assertEqual([patient['id'] for patient in response.json()['results']], [str(own.pk)])
+
+class CachedAuthenticationTests(UsersTestCase):
+    def test_cache_keeps_the_auth_and_read_fields_but_not_the_password(self):
+        token = TenantTokenObtainPairSerializer.get_token(self.professional).access_token
+        CachedJWTAuthentication().get_cached_user(token)
+
+        entry = cache.get(AUTH_USER_KEY.format(user_id=self.professional.pk, version=get_user_version(self.professional.pk)))
+        self.assertEqual(set(entry), {*AUTH_USER_FIELDS, *CACHED_USER_FIELDS})
+
+        with self.assertNumQueries(0):
+            user = CachedJWTAuthentication().get_cached_user(token)
+            self.assertEqual((user.pk, user.role, user.organization_id), (self.professional.pk, 'PROFESSIONAL', self.organization.pk))
+            self.assertEqual((user.email, user.get_full_name(), str(user), bool(user.photo)), ('pro@test.com', '', 'pro@test.com (PROFESSIONAL)', False))
+        # Lo que no está en la entrada se lee de la BD al usarlo
+        with self.assertNumQueries(1):
+            self.assertIsNone(user.cognito_sub)
+
+    def test_me_with_warm_caches_makes_no_queries(self):
+        token = TenantTokenObtainPairSerializer.get_token(self.patient).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        first = self.client.get('/api/users/me/')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/users/me/')
+        self.assertEqual(second.json(), first.json())
+
+
+class TokenTenantUserTests(UsersTestCase):
+    def test_is_authenticated_check_does_not_load_the_user(self):
+        token = TenantTokenObtainPairSerializer.get_token(self.professional).access_token
+        user = CachedJWTAuthentication().get_user(token)
+        request = APIRequestFactory().get('/')
+        request.user = user
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAuthenticated().has_permission(request, None))
+        self.assertFalse(user.loaded)
+
+    def test_deactivated_users_are_rejected_before_the_token_expires(self):
+        token = TenantTokenObtainPairSerializer.get_token(self.professional).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professional.is_active = False
+            self.professional.save()
+        with self.assertRaises(AuthenticationFailed):
+            CachedJWTAuthentication().get_user(token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professional.is_active = True
+            self.professional.save()
+        self.assertTrue(CachedJWTAuthentication().get_user(token))
+
+
+class RevocationStoreTests(UsersTestCase):
+    def test_local_store_shares_revocations_through_the_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'revoked.tsv')
+        first, second = LocalRevocationStore(path), LocalRevocationStore(path)  # Dos procesos del nodo
+        expires_at = time.time() + 3600
+
+        self.assertTrue(first.revoke_if_absent('a', expires_at))
+        self.assertFalse(second.revoke_if_absent('a', expires_at))
+        first.revoke('vencido', time.time() - 1)
+
+        self.assertEqual(second.compact(), 1)
+        # Lo agregado después de compactar va al archivo nuevo y lo ven los dos
+        self.assertTrue(first.revoke_if_absent('b', expires_at))
+        self.assertTrue(second.is_revoked('b'))
+        self.assertTrue(first.is_revoked('a'))
+        self.assertFalse(first.is_revoked('vencido'))
+
+    def test_cache_store_claims_atomically(self):
+        first, second = CacheRevocationStore(), CacheRevocationStore()  # Dos procesos
+        expires_at = time.time() + 3600
+
+        self.assertTrue(first.revoke_if_absent('a', expires_at))
+        self.assertFalse(second.revoke_if_absent('a', expires_at))
+        self.assertTrue(second.is_revoked('a'))
+        self.assertFalse(second.is_revoked('nunca-revocado'))
+        self.assertTrue(first.revoke_if_absent('vencido', time.time() - 1))
+        self.assertFalse(first.is_revoked('vencido'))
+
+    def test_refresh_claims_the_token_with_a_single_cache_operation(self):
+        store = CacheRevocationStore()
+        self.enterContext(mock.patch('apps.users.revocation._store', store))
+        refresh = str(TenantTokenObtainPairSerializer.get_token(self.professional))
+        with mock.patch.object(store.cache, 'get', wraps=store.cache.get) as get, \
+                mock.patch.object(store.cache, 'add', wraps=store.cache.add) as add:
+            self.assertEqual(self.client.post('/api/refresh/', {'refresh': refresh}).status_code, 200)
+        revocation_calls = lambda calls: [call.args[0] for call in calls if call.args[0].startswith(store.key_prefix)]
+        self.assertEqual(len(revocation_calls(add.call_args_list)), 1)
+        self.assertEqual(revocation_calls(get.call_args_list), [])
+
+    def test_refresh_tokens_can_be_used_only_once(self):
+        self.enterContext(mock.patch('apps.users.revocation._store', CacheRevocationStore()))
+        refresh = str(TenantTokenObtainPairSerializer.get_token(self.professional))
+
+        self.assertEqual(self.client.post('/api/refresh/', {'refresh': refresh}).status_code, 200)
+        response = self.client.post('/api/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+
+
+class ProvisioningTests(UsersTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def provision(self, users, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/provision/', {'users': users, **data}, format='json')
+        return response.json()
+
+    def test_existing_emails_are_matched_case_insensitively(self):
+        report = self.provision([{'email': 'PRO@Test.com', 'role': 'PROFESSIONAL'}, {'email': 'Nuevo@Test.com'}])
+        self.assertEqual((report['created'], report['skipped']), (1, 1))
+        self.assertTrue(User.objects.filter(email='nuevo@test.com').exists())
+
+    def test_created_users_can_log_in_as_soon_as_the_response_arrives(self):
+        response = self.client.post('/api/users/provision/', {'users': [
+            {'email': 'ana@test.com', 'first_name': 'Ana', 'password': 'Zanahoria-Azul-42'},
+            {'email': 'beto@test.com', 'password': '1234'},
+            {'email': 'caro@test.com'},
+        ]}, format='json')
+        report = response.json()
+        self.assertEqual((report['created'], report['errors']), (2, 1))
+        self.assertTrue(report['rows'][1]['errors'])
+        # Sin esperar ningún callback: el hash ya está guardado
+        self.assertTrue(User.objects.get(email='ana@test.com').check_password('Zanahoria-Azul-42'))
+        self.assertFalse(User.objects.get(email='caro@test.com').has_usable_password())
+
+    def test_dry_run_does_not_hash_passwords(self):
+        with mock.patch('apps.users.provisioning.make_password') as make_password:
+            report = self.provision([{'email': 'ana@test.com', 'password': 'Zanahoria-Azul-42'}], dry_run=True)
+        make_password.assert_not_called()
+        self.assertEqual(report['created'], 1)
+        self.assertFalse(User.objects.filter(email='ana@test.com').exists())
+
+
+class ProfileSyncTests(UsersTestCase):
+    def test_saving_a_user_recreates_a_missing_profile(self):
+        PatientProfile.objects.filter(user=self.patient).delete()
+        patient = User.objects.get(pk=self.patient.pk)
+        patient.first_name = "Paz"
+        patient.save()
+        self.assertTrue(PatientProfile.objects.filter(user=patient).exists())
+
+    def test_login_timestamp_does_not_touch_the_profile(self):
+        patient = User.objects.get(pk=self.patient.pk)
+        with self.assertNumQueries(1):  # Solo el UPDATE de last_login
+            update_last_login(None, patient)
+
+    def test_role_change_creates_the_new_profile(self):
+        user = User.objects.get(pk=self.professional.pk)
+        user.role = 'PACIENTE'
+        user.save(update_fields=['role'])
+        self.assertTrue(PatientProfile.objects.filter(user=user).exists())
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class MeCacheTests(UsersTestCase):
+    """/users/me/ sale de la caché hasta que cambia el usuario, su perfil o las miniaturas de su foto."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_authenticate(self.patient)
+
+    def me(self, **extra):
+        response = self.client.get('/api/users/me/', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_warm_document_makes_no_queries(self):
+        first = self.me()
+        self.assertEqual(first['patient_profile']['allergies'], '')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(), first)
+
+    def test_user_and_profile_changes_invalidate_it(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = PatientProfile.objects.get(user=self.patient)
+            profile.allergies = "Maní"
+            profile.save()
+        self.assertEqual(self.me()['patient_profile']['allergies'], "Maní")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.patient.pk)
+            user.first_name = "Paz"
+            user.save()
+        self.assertEqual(self.me()['first_name'], "Paz")
+
+    def test_photo_urls_follow_the_derivatives_and_the_request_host(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 120), 'teal').save(buffer, 'PNG')
+        user = User.objects.get(pk=self.patient.pk)
+        with mock.patch('apps.common.images.schedule_derivatives'), self.captureOnCommitCallbacks(execute=True):
+            user.photo = SimpleUploadedFile('paz.png', buffer.getvalue(), content_type='image/png')
+            user.save()
+        name = User.objects.get(pk=user.pk).photo.name
+
+        # Miniaturas en proceso: se sirve el original y el documento no se cachea
+        self.assertEqual(self.me()['photo_avatar'], f'http://testserver/media/{name}')
+        build_derivatives(name, User)
+        self.assertEqual(self.me()['photo_avatar'], f'http://testserver/media/{derivative_name(name, "avatar")}')
+        self.assertEqual(
+            self.me(HTTP_HOST='app.example.com', secure=True)['photo_avatar'],
+            f'https://app.example.com/media/{derivative_name(name, "avatar")}',
+        )
@@ -0,0 +1,83 @@
+"""
+Claims de rol y organización dentro de los tokens JWT.
+
+Al hacer login (y en cada refresh) el token lleva, firmados:
+    role, organization_id, entitlements (plan_type, max_patients, allows_*...)
+Con esos claims `TokenTenantUser` responde rol, id y organización sin tocar la
+tabla de usuarios: las vistas deciden el alcance (qué pacientes, qué planes) con
+el token. Recién si una vista necesita el modelo completo (asignarlo a una FK,
+serializarlo) se carga el User, desde la caché de CachedJWTAuthentication.
+
+Los claims son una foto del momento del login/refresh: un cambio de rol u
+organización se refleja en el próximo refresh (el access token dura 1 hora).
+"""
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.settings import api_settings
+from .tenancy import get_cached_organization
+
+TENANT_CLAIMS = ('role', 'organization_id', 'entitlements')
+
+
+def tenant_claims(user):
+    """Claims de tenant para `user` (la organización sale de su caché versionada)."""
+    entry = get_cached_organization(user.organization_id) if user.organization_id else None
+    return {
+        'role': user.role,
+        'organization_id': str(user.organization_id) if user.organization_id else None,
+        'entitlements': entry['entitlements'] if entry else {},
+    }
+
+
+def set_tenant_claims(token, user):
+    for claim, value in tenant_claims(user).items():
+        token[claim] = value
+    return token
+
+
+def has_tenant_claims(token):
+    return all(claim in token for claim in TENANT_CLAIMS)
+
+
+class TokenTenantUser(SimpleLazyObject):
+    """
+    Usuario respaldado por el token: id, rol, organización y plan salen de los claims.
+    Cualquier otro atributo (o usarlo como instancia de User) carga el modelo real.
+    """
+
+    def __init__(self, token, loader):
+        self.__dict__['token'] = token
+        super().__init__(loader)
+
+    @property
+    def loaded(self):
+        return self._wrapped is not empty
+
+    @property
+    def pk(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+    id = pk
+
+    @property
+    def role(self):
+        return self.token['role']
+
+    @property
+    def organization_id(self):
+        return self.token['organization_id']
+
+    @property
+    def entitlements(self):
+        return self.token['entitlements']
+
+    def __bool__(self):
+        # SimpleLazyObject delega bool() al modelo (lo cargaría); IsAuthenticated hace bool(request.user)
+        return True
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
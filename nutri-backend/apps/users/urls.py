@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet
+from .views import BodyMeasurementViewSet, UserViewSet
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -8,6 +8,7 @@ from rest_framework_simplejwt.views import (
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='users')
+router.register(r'measurements', BodyMeasurementViewSet, basename='measurements')
 
 urlpatterns = [
     # CRUD de usuarios (api/auth/users/)
@@ -1,28 +1,230 @@
-from rest_framework import viewsets
+import uuid
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
-from .models import User
+from rest_framework.response import Response
+from apps.common.http import etag_matches
+from apps.common.images import derivative_url_for_name
+from apps.common.projections import ProjectionListMixin
+from apps.clinical.importer import read_rows
+from apps.clinical.models import ClinicalPatient
+from . import measurements
+from .caching import absolute_me, get_me_entry
+from .models import BodyMeasurement, Organization, User
+from .provisioning import PROVISIONABLE_ROLES, provision_users
 
 # Serializador actualizado
-from .serializers import UserSerializer
+from .serializers import BodyMeasurementSerializer, UserSerializer
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ProjectionListMixin, viewsets.ModelViewSet):
     """
     API endpoint para gestión de usuarios con seguridad Multi-Tenant.
+    Con ?fields=id,email,role la lista sale de una proyección (sin perfiles anidados).
     """
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated] 
+    projection = {
+        'id': 'id',
+        'email': 'email',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'role': 'role',
+        'photo_avatar': 'photo',
+        'is_active': 'is_active',
+        'organization': 'organization',
+        'created_at': 'created_at',
+    }
+    projection_keys = ('photo_derivatives',)  # Foto con miniaturas ya generadas (sin sondear el storage)
+
+    def project_row(self, row):
+        if 'photo_avatar' in row:
+            url = derivative_url_for_name(row['photo_avatar'], 'avatar', row['photo_derivatives'])
+            row['photo_avatar'] = self.request.build_absolute_uri(url) if url else None
+        return row
 
     def get_queryset(self):
         user = self.request.user
+        tenant = self.request.tenant
+        # Organización y perfiles anidados por JOIN: la lista hace las mismas queries con 1 o 500 usuarios
+        users = User.objects.select_related('organization', 'professional_profile', 'patient_profile')
         
         # 1. Super Admin ve todo
-        if user.role == 'ADMIN':
-            return User.objects.all().order_by('-created_at')
+        if tenant.role == 'ADMIN':
+            return users.order_by('-created_at')
 
         # 2. Dueño de Clínica ve a todos en SU organización
-        if user.role == 'ORG_OWNER' and user.organization:
-            return User.objects.filter(organization=user.organization).order_by('-created_at')
+        if tenant.role == 'ORG_OWNER' and tenant.organization_id:
+            return users.for_tenant(tenant).order_by('-created_at')
 
         # 3. Nutricionista o Paciente solo ve su propio perfil
         # (Por seguridad, no queremos que un nutri vea los datos de usuario de otro nutri)
-        return User.objects.filter(id=user.id)
\ No newline at end of file
+        return users.filter(id=user.id)
+
+    @action(detail=False, methods=['get'])
+    def me(self, request):
+        """
+        Perfil completo del usuario logueado (lo pide la app al abrirse).
+        Se sirve desde un documento cacheado con ETag: si el cliente manda
+        If-None-Match y nada cambió, responde 304 sin tocar la BD.
+        """
+        try:
+            entry = get_me_entry(request.user.pk)
+        except User.DoesNotExist:
+            raise AuthenticationFailed("El usuario ya no existe.", code='user_not_found')
+
+        headers = {'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+        if etag_matches(request, entry['etag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(absolute_me(entry['document'], request), headers=headers)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser])
+    def provision(self, request):
+        """
+        Alta masiva: JSON {"users": [{"email", "first_name", "last_name", "role", "password"}], "dry_run"}
+        o multipart con `file` (CSV/XLSX). Dueño de clínica: profesionales y pacientes de su clínica.
+        Super Admin: también dueños, en la clínica de `organization` (id). Responde con un reporte por fila.
+        """
+        tenant = request.tenant
+        roles = PROVISIONABLE_ROLES.get(tenant.role)
+        if roles is None:
+            raise PermissionDenied("Solo el dueño de la clínica o un administrador pueden dar de alta usuarios.")
+        if tenant.role == 'ADMIN':
+            organization_id = request.data.get('organization')
+            organization = Organization.objects.filter(pk=organization_id).first() if organization_id else None
+            if organization_id and organization is None:
+                raise ValidationError({'organization': "No existe la organización."})
+        else:
+            organization = tenant.organization
+            if organization is None:
+                raise PermissionDenied("Tu usuario no pertenece a ninguna clínica.")
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            rows = read_rows(upload, upload.name)
+        else:
+            rows = request.data.get('users')
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValidationError({'users': "Envía una lista de usuarios o adjunta un archivo CSV/XLSX."})
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+        try:
+            report = provision_users(organization, rows, roles=roles, dry_run=dry_run)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ValidationError({'file' if upload is not None else 'users': str(exc)})
+
+        created = report['created'] and not dry_run
+        return Response(report, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+def parse_moment(value, end_of_day=False):
+    """Acepta fecha (2024-05-01) o fecha y hora ISO; devuelve un datetime con zona horaria."""
+    if not value:
+        return None
+    try:
+        # Bien formada pero imposible (2024-02-30) -> ValueError
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        moment = day = None
+    if moment is None:
+        if day is None:
+            raise ValidationError(f"Fecha inválida: '{value}'. Usa AAAA-MM-DD.")
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+class BodyMeasurementViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Mediciones corporales (serie de tiempo, solo inserción: no hay edición ni borrado).
+    - Paciente: registra y consulta las suyas.
+    - Profesional / Dueño: las de pacientes vinculados a un expediente de su clínica.
+    Filtros comunes: ?patient=<uuid>&kind=WEIGHT&from=2024-01-01&to=2024-12-31
+    """
+    serializer_class = BodyMeasurementSerializer
+    permission_classes = [IsAuthenticated]
+    MAX_RAW_POINTS = 2000
+
+    def get_patient_id(self, patient_id=None):
+        user = self.request.user
+        patient_id = patient_id or self.request.query_params.get('patient')
+        if user.role == 'PACIENTE':
+            if patient_id and str(patient_id) != str(user.pk):
+                raise PermissionDenied("Solo puedes ver tus propias mediciones.")
+            return user.pk
+        if not patient_id:
+            raise ValidationError({'patient': "Indica el paciente."})
+        try:
+            patient_id = uuid.UUID(str(patient_id))
+        except ValueError:
+            raise ValidationError({'patient': f"Id de paciente inválido: '{patient_id}'."})
+        if user.role == 'ADMIN':
+            return patient_id
+        if user.role in ('PROFESSIONAL', 'ORG_OWNER') and user.organization_id:
+            if ClinicalPatient.objects.for_tenant(self.request.tenant).filter(app_user_id=patient_id).exists():
+                return patient_id
+        raise PermissionDenied("Este paciente no pertenece a tu clínica.")
+
+    def get_kind(self, required=True):
+        kind = self.request.query_params.get('kind')
+        if kind is None and not required:
+            return None
+        if kind not in BodyMeasurement.UNITS:
+            raise ValidationError({'kind': f"Usa una de: {', '.join(BodyMeasurement.UNITS)}."})
+        return kind
+
+    def get_range(self):
+        params = self.request.query_params
+        return parse_moment(params.get('from')), parse_moment(params.get('to'), end_of_day=True)
+
+    def get_bucket(self):
+        bucket = self.request.query_params.get('bucket', 'week')
+        if bucket not in measurements.BUCKETS:
+            raise ValidationError({'bucket': "Usa day, week o month."})
+        return bucket
+
+    def get_queryset(self):
+        patient_id = self.get_patient_id()
+        start, end = self.get_range()
+        queryset = BodyMeasurement.objects.filter(patient_id=patient_id)
+        kind = self.get_kind(required=False)
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        if start:
+            queryset = queryset.filter(measured_at__gte=start)
+        if end:
+            queryset = queryset.filter(measured_at__lte=end)
+        return queryset.order_by('measured_at')
+
+    def list(self, request, *args, **kwargs):
+        """Lecturas crudas del rango (máx. MAX_RAW_POINTS; para gráficos largos usar /rollup/)."""
+        queryset = self.get_queryset()[:self.MAX_RAW_POINTS]
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def perform_create(self, serializer):
+        patient = serializer.validated_data.get('patient')
+        patient_id = self.get_patient_id(patient.pk if patient else None)
+        serializer.save(patient_id=patient_id, recorded_by=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def rollup(self, request):
+        """
+        Serie resumida: /measurements/rollup/?patient=&kind=WEIGHT&bucket=week&from=&to=
+        Un punto por período con avg/min/max/count, calculado en la BD.
+        """
+        start, end = self.get_range()
+        points = measurements.rollup(self.get_patient_id(), self.get_kind(), self.get_bucket(), start, end)
+        return Response({'kind': self.get_kind(), 'unit': BodyMeasurement.UNITS[self.get_kind()], 'points': points})
+
+    @action(detail=False, methods=['get'])
+    def latest(self, request):
+        """Último valor registrado de cada medida: /measurements/latest/?patient="""
+        return Response(measurements.latest_values(self.get_patient_id()))
+
+    @action(detail=False, methods=['get'])
+    def bmi(self, request):
+        """Tendencia del IMC por período: /measurements/bmi/?patient=&bucket=month&from=&to="""
+        start, end = self.get_range()
+        return Response({'points': measurements.bmi_trend(self.get_patient_id(), self.get_bucket(), start, end)})
@@ -55,10 +55,12 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.common.middleware.CompressionMiddleware',  # gzip de respuestas (antes de todo lo que lee el cuerpo)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.users.tenancy.TenantMiddleware',  # request.tenant: organización y plan cacheados
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -136,18 +138,40 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# CACHÉ COMPARTIDA
+# Redis si hay REDIS_URL (producción / varios workers), memoria local en desarrollo
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # --- AUTHENTICATION CONFIGURATION ---
 AUTH_USER_MODEL = 'users.User'
 
 # CONFIGURACIÓN DE DRF Y SEGURIDAD
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT con el usuario en caché versionada (misma validación que simplejwt)
+        'apps.users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # JSON con orjson (cae al JSONRenderer de DRF si no está instalado)
+    'DEFAULT_RENDERER_CLASSES': (
+        'apps.common.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     # AGREGA ESTO: Le dice a DRF que use Spectacular para generar el esquema
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -160,8 +184,21 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Claims de rol, organización y plan en los tokens (apps/users/tokens.py)
+    'TOKEN_OBTAIN_SERIALIZER': 'apps.users.serializers.TenantTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.users.serializers.TenantTokenRefreshSerializer',
 }
 
+# REVOCACIÓN DE REFRESH TOKENS ROTADOS (apps/users/revocation.py)
+# Redis si hay REDIS_URL (varios nodos); si no, memoria + archivo local (un nodo, desarrollo)
+if os.getenv('REDIS_URL'):
+    TOKEN_REVOCATION_STORE = {'BACKEND': 'apps.users.revocation.CacheRevocationStore'}
+else:
+    TOKEN_REVOCATION_STORE = {
+        'BACKEND': 'apps.users.revocation.LocalRevocationStore',
+        'OPTIONS': {'path': os.getenv('TOKEN_REVOCATION_FILE', str(BASE_DIR / 'var' / 'revoked-tokens.tsv'))},
+    }
+
 # CONFIGURACIÓN DE DOCUMENTACIÓN API (SWAGGER)
 SPECTACULAR_SETTINGS = {
     'TITLE': 'NutriApp API',
@@ -175,4 +212,21 @@ SPECTACULAR_SETTINGS = {
         'persistAuthorization': True,
         'displayOperationId': True,
     },
-}
\ No newline at end of file
+}
+# MINIATURAS DE FOTOS: procesos que redimensionan en segundo plano (apps/common/images.py)
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 2))
+
+# LOGGING: los mensajes de las apps (vinculaciones, importaciones) van a la consola
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'apps': {
+            'handlers': ['console'],
+            'level': os.environ.get('APP_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -19,7 +19,7 @@ const MOCK_DEMO_PATIENTS = [
 
 export const PatientListScreen = () => {
     const navigation = useNavigation<any>();
-    const { patients, fetchPatients, isLoading } = usePatientStore();
+    const { patients, fetchPatients, fetchMorePatients, isLoading } = usePatientStore();
     const [searchQuery, setSearchQuery] = useState('');
     const [activeFilter, setActiveFilter] = useState('Todos');
 
@@ -139,6 +139,8 @@ export const PatientListScreen = () => {
                 showsVerticalScrollIndicator={false}
                 refreshing={isLoading}
                 onRefresh={fetchPatients}
+                onEndReached={fetchMorePatients}
+                onEndReachedThreshold={0.5}
                 ListEmptyComponent={
                     <View style={styles.emptyContainer}>
                         <Ionicons name="search" size={60} color="#ECEFF1" />
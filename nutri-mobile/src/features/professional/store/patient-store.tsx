@@ -4,19 +4,30 @@ import { nhApi } from '../../../core/config/api';
 // 👇 Importamos el tipo desde el archivo central (Buenas Prácticas)
 import { Patient } from '../../auth/types';
 
+// Respuesta paginada por cursor del backend ({ next, results })
+interface PatientPage {
+  next: string | null;
+  results: Patient[];
+}
+
 interface PatientState {
   patients: Patient[];
+  nextUrl: string | null;
   isLoading: boolean;
+  isLoadingMore: boolean;
   error: string | null;
 
   // Acciones
   fetchPatients: () => Promise<void>;
+  fetchMorePatients: () => Promise<void>;
   addPatient: (patientData: any) => Promise<boolean>;
 }
 
 export const usePatientStore = create<PatientState>((set, get) => ({
   patients: [],
+  nextUrl: null,
   isLoading: false,
+  isLoadingMore: false,
   error: null,
 
   fetchPatients: async () => {
@@ -25,11 +36,11 @@ export const usePatientStore = create<PatientState>((set, get) => ({
     try {
       console.log("Fetching patients from /clinical/patients/");
 
-      // Fetch patients from API with authentication
-      const { data } = await nhApi.get<Patient[]>('/clinical/patients/');
+      // Primera página; las siguientes se piden con fetchMorePatients (cursor)
+      const { data } = await nhApi.get<PatientPage>('/clinical/patients/');
 
-      console.log(`Fetched ${data.length} patients`);
-      set({ patients: data, isLoading: false });
+      console.log(`Fetched ${data.results.length} patients`);
+      set({ patients: data.results, nextUrl: data.next, isLoading: false });
 
     } catch (e: any) {
       // Error handling
@@ -45,11 +56,32 @@ export const usePatientStore = create<PatientState>((set, get) => ({
       set({
         isLoading: false,
         patients: [],
+        nextUrl: null,
         error: errorMsg
       });
     }
   },
 
+  fetchMorePatients: async () => {
+    const { nextUrl, isLoadingMore } = get();
+    if (!nextUrl || isLoadingMore) return;
+
+    set({ isLoadingMore: true, error: null });
+    try {
+      // `next` ya trae el cursor: no se repiten pacientes aunque se creen nuevos mientras tanto
+      const { data } = await nhApi.get<PatientPage>(nextUrl);
+      set((state) => ({
+        patients: [...state.patients, ...data.results],
+        nextUrl: data.next,
+        isLoadingMore: false,
+      }));
+    } catch (e: any) {
+      const errorMsg = e.response?.data?.detail || 'Connection error';
+      console.error(`Store error (${e.response?.status}):`, errorMsg);
+      set({ isLoadingMore: false, error: errorMsg });
+    }
+  },
+
   addPatient: async (patientData: any) => {
     set({ isLoading: true, error: null });
     try {